@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from hocuspocus.access import AccessList
+
+
+def time_checks(access, credentials, rounds):
+    """
+    Returns the mean microseconds `access.check` took per credential.
+    """
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for credential in credentials:
+            access.check(credential, 'front')
+    return (time.perf_counter() - started) * 1e6 / (rounds * len(credentials))
+
+
+def main(argv=None):
+    """
+    Checks known and unknown credentials against an access list of
+    `--credentials` entries and reports the mean time per check, without
+    and with a bloom filter.
+
+        PYTHONPATH=. python benchmarks/access_lookup.py
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--credentials', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--bloom-bits', type=int, default=2 ** 21)
+    args = parser.parse_args(argv)
+
+    known = ['badge-{}'.format(number) for number in range(args.credentials)]
+    unknown = ['pin-{}'.format(number) for number in range(1000)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'allow.list')
+        with open(path, 'w') as f:
+            f.write('\n'.join(known))
+
+        for bloom_bits in (0, args.bloom_bits):
+            started = time.perf_counter()
+            access = AccessList(path, bloom_bits=bloom_bits)
+            loaded = (time.perf_counter() - started) * 1000
+            sys.stdout.write(
+                'bloom_bits={:<10} load {:>8.1f} ms  known {:>6.2f} us  '
+                'unknown {:>6.2f} us\n'.format(
+                    bloom_bits, loaded,
+                    time_checks(access, known[:1000], args.rounds),
+                    time_checks(access, unknown, args.rounds)))
+
+
+if __name__ == '__main__':
+    main()
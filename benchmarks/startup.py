@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+
+from collections import OrderedDict
+
+
+CONFIG = '''
+[paths]
+pid_file = {tmp}/door_controller.pid
+error_file = {tmp}/door_controller_error.txt
+
+[gpio]
+backend = simulator
+
+[logging]
+format = json
+'''
+
+# in the order `run.py` and `main` go through them
+PHASES = ('interpreter', 'imports', 'config', 'gpio', 'pin_setup', 'logging',
+          'daemon', 'ready', 'time_to_ready', 'wall')
+
+
+def start_daemon(tmp, config_path, timeout=30):
+    """
+    Starts the daemon and waits for its `ready` log line. Returns the wall
+    clock seconds until then and the startup timings it logged.
+    """
+    started = time.monotonic()
+    daemon = subprocess.Popen(
+        [sys.executable, '-m', 'hocuspocus.run', config_path],
+        stdout=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    try:
+        for line in daemon.stdout:
+            record = json.loads(line.decode('utf-8'))
+            if record['message'] == 'ready':
+                return time.monotonic() - started, record
+            if time.monotonic() - started > timeout:
+                break
+        raise RuntimeError('The daemon did not become ready')
+    finally:
+        daemon.send_signal(signal.SIGTERM)
+        daemon.wait()
+        daemon.stdout.close()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv=None):
+    """
+    Restarts the daemon (with the simulator backend) `--restarts` times and
+    reports the median time spent in each startup phase and the time to
+    ready, until the SIGUSR1 handler is installed. `wall` is measured from
+    outside the daemon, from spawning it until its ready line was read.
+
+        PYTHONPATH=. python benchmarks/startup.py
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--restarts', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    timings = OrderedDict((phase, []) for phase in PHASES)
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, 'benchmark.ini')
+        with open(config_path, 'w') as f:
+            f.write(CONFIG.format(tmp=tmp))
+
+        for _ in range(args.restarts):
+            wall, record = start_daemon(tmp, config_path)
+            for key, value in record.items():
+                if key.endswith('_ms'):
+                    timings.setdefault(key[:-3], []).append(value)
+            timings.setdefault('wall', []).append(wall * 1000)
+
+    for phase, values in timings.items():
+        if not values:
+            continue
+        sys.stdout.write('{:<16}{:>10.1f} ms (max {:.1f})\n'.format(
+            phase, median(values), max(values)))
+
+
+if __name__ == '__main__':
+    main()
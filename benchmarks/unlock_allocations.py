@@ -0,0 +1,100 @@
+import sys
+import time
+import argparse
+import tracemalloc
+
+from mock import patch
+
+from hocuspocus.backends.simulator import SimulatedGPIO, default_relays
+from hocuspocus.clock import VirtualClock
+from hocuspocus.door_controller import DoorController
+from hocuspocus.main import RelayError, unlock_door
+
+
+def legacy_relay_error(relay, test):
+    """
+    How `check_relays` created its result before the outcomes were
+    interned, formatting the code and parsing it back.
+    """
+    return RelayError("{relay} {test}".format(test=test, relay=relay))
+
+
+def create_door_controller(legacy):
+    clock = VirtualClock()
+    gpio = SimulatedGPIO(default_relays(), now=clock.now)
+    if legacy:
+        # every read and write looks the pin up by name
+        gpio.handle = lambda pin: pin
+    return DoorController(gpio, clock=clock)
+
+
+def measure(unlocks, legacy):
+    """
+    Returns the `RelayError`s created per unlock, the most memory allocated
+    during any one unlock and the seconds taken per unlock.
+    """
+    door_controller = create_door_controller(legacy)
+    check_kwargs = {'samples': 3, 'poll_ms': 5, 'timeout_ms': 100}
+
+    created = [0]
+    relay_error_init = RelayError.__init__
+
+    def counting_init(self, code):
+        created[0] += 1
+        relay_error_init(self, code)
+
+    patches = [patch.object(RelayError, '__init__', counting_init)]
+    if legacy:
+        patches.append(patch('hocuspocus.main.relay_error_for',
+                             legacy_relay_error))
+    for patcher in patches:
+        patcher.start()
+
+    try:
+        # warm up, so lazily created state isn't counted
+        unlock_door(door_controller, check_kwargs=check_kwargs)
+        created[0] = 0
+
+        peak = 0
+        for _ in range(unlocks):
+            # restarted for every unlock, so the peak is the unlock's own
+            tracemalloc.start()
+            unlock_door(door_controller, check_kwargs=check_kwargs)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        created_per_unlock = created[0] / unlocks
+
+        started = time.perf_counter()
+        for _ in range(unlocks):
+            unlock_door(door_controller, check_kwargs=check_kwargs)
+        seconds = time.perf_counter() - started
+    finally:
+        for patcher in reversed(patches):
+            patcher.stop()
+
+    return created_per_unlock, peak, seconds / unlocks
+
+
+def main(argv=None):
+    """
+    Compares the allocations of an unlock against the simulator with the
+    string parsed `RelayError`s and pin names (before) and with interned
+    `RelayError`s and pin handles (after). The simulator runs on a virtual
+    clock, so the time is only the daemon's own work.
+
+        PYTHONPATH=. python benchmarks/unlock_allocations.py
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--unlocks', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    sys.stdout.write('{:<8}{:>16}{:>16}{:>16}\n'.format(
+        '', 'RelayErrors', 'peak bytes', 'us'))
+    for name, legacy in (('before', True), ('after', False)):
+        created, peak, seconds = measure(args.unlocks, legacy)
+        sys.stdout.write('{:<8}{:>16.1f}{:>16}{:>16.1f}\n'.format(
+            name, created, peak, seconds * 1000000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import os
+import struct
+import hashlib
+import logging
+import threading
+
+from hocuspocus.clock import MONOTONIC
+
+
+logger = logging.getLogger(__name__)
+
+
+def read_access_list(path):
+    """
+    Reads the allow-list at `path`, one credential per line followed by the
+    doors it opens, every door if there are none:
+
+        # badges
+        badge-1234
+        badge-5678 front back
+        # PIN hashes
+        9f86d081884c7d65 back
+
+    Returns a dict of credential to a frozenset of door names (`None` for
+    every door). Raises a `ValueError` if a credential is listed twice.
+    """
+    entries = {}
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            credential, doors = fields[0], fields[1:]
+            if credential in entries:
+                raise ValueError('{}:{} {} is listed twice'.format(
+                    path, number, credential))
+            entries[credential] = frozenset(doors) if doors else None
+    return entries
+
+
+class BloomFilter():
+    """
+    Set of strings that can answer "definitely not in it" from `bits` bits
+    of memory, set by `hashes` hash functions per string. Strings can't be
+    removed, they may still be found (a false positive) until it's rebuilt.
+    """
+
+    def __init__(self, bits, hashes=3, items=()):
+        self.bits = bits
+        self.hashes = hashes
+        self._bits = bytearray((bits + 7) // 8)
+        for item in items:
+            self.add(item)
+
+    def _positions(self, item):
+        # double hashing, the i-th hash is h1 + i * h2
+        h1, h2 = struct.unpack_from(
+            '<QQ', hashlib.md5(item.encode('utf-8')).digest())
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class AccessList():
+    """
+    In memory index of the allow-list at `path` (see `read_access_list`)
+    that unlock requests are checked against, so a credential is decided
+    without leaving the process. `reload` applies the changes to the file.
+
+    `required` - requests without a credential are denied as well (SIGUSR1
+    included), otherwise only the ones that carry a credential are checked
+    `bloom_bits` - size of a `BloomFilter` credentials are looked up in
+    first, so unknown ones are turned away without touching the index, 0
+    doesn't use one
+    `bloom_hashes` - number of hash functions of the `BloomFilter`
+    """
+
+    def __init__(self, path, required=False, bloom_bits=0, bloom_hashes=3):
+        self.path = path
+        self.required = required
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        self.allowed = 0
+        self.denied = 0
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._bloom = None
+        # credentials removed since the bloom filter was built
+        self._stale = 0
+        self._version = None
+        if not self.reload():
+            raise ValueError('Can not read the access list {}'.format(path))
+
+    def check(self, credential, door):
+        """
+        Returns whether `credential` (`None` if the request didn't carry
+        one) opens `door`. Never waits on `reload`.
+        """
+        if credential is None:
+            allowed = not self.required
+        else:
+            bloom = self._bloom
+            if bloom is not None and credential not in bloom:
+                allowed = False
+            else:
+                doors = self._index.get(credential, ())
+                allowed = doors is None or door in doors
+
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.denied += 1
+        return allowed
+
+    def reload(self):
+        """
+        Re-reads the file if it changed since it was last read and applies
+        the credentials added, changed and removed to the index. Returns
+        `False` if the file couldn't be read, the index is left as it was.
+        """
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if version == self._version:
+                return True
+            entries = read_access_list(self.path)
+        except (OSError, ValueError) as e:
+            logger.error('access list not reloaded',
+                         extra={'path': self.path, 'error': str(e)})
+            return False
+
+        # changed in place one credential at a time, `check` sees each
+        # change whole without a lock and the index isn't copied
+        index = self._index
+        removed = [credential for credential in index
+                   if credential not in entries]
+        changed = [(credential, doors)
+                   for credential, doors in entries.items()
+                   if index.get(credential, ()) != doors]
+        for credential in removed:
+            del index[credential]
+        for credential, doors in changed:
+            index[credential] = doors
+
+        # removed credentials stay in the bloom filter, it's rebuilt once
+        # they outnumber the ones left
+        self._stale += len(removed)
+        if self.bloom_bits and (self._bloom is None or
+                                self._stale > len(index)):
+            self._bloom = BloomFilter(self.bloom_bits, self.bloom_hashes,
+                                      index)
+            self._stale = 0
+        elif self._bloom is not None:
+            for credential, _ in changed:
+                self._bloom.add(credential)
+
+        self._version = version
+        self.reloads += 1
+        logger.info('access list loaded', extra={
+            'path': self.path, 'entries': len(index),
+            'changed': len(changed), 'removed': len(removed)})
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._index),
+                'allowed': self.allowed,
+                'denied': self.denied,
+                'reloads': self.reloads,
+            }
+
+
+class AccessWatcher(threading.Thread):
+    """
+    Reloads an `AccessList` every `interval` seconds, the file is only read
+    again once it has changed.
+    """
+
+    def __init__(self, access, interval=5, clock=MONOTONIC):
+        super(AccessWatcher, self).__init__(name='AccessWatcher',
+                                            daemon=True)
+        self.access = access
+        self.interval = interval
+        self.clock = clock
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self.clock.wait_event(self._stopped, self.interval):
+            self.access.reload()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,556 @@
+import os
+import signal
+import asyncio
+import logging
+
+from functools import partial
+
+from hocuspocus.clock import MONOTONIC
+from hocuspocus.control import (
+    LATENCY,
+    STATS,
+    binding_path,
+    encode,
+    format_error,
+    format_reply,
+    move_socket,
+    parse_message,
+    remove_socket,
+    unlock_request,
+)
+from hocuspocus.main import (
+    error_code_flashes,
+    ignore_phase,
+    journaled_phases,
+    log_error,
+    read_relays,
+    relay_error_for,
+)
+from hocuspocus.metrics import PhaseLatency, UnlockCounters
+from hocuspocus.worker import (
+    DROPPED,
+    FAILED,
+    UNLOCKED,
+    Admission,
+    HoldWindow,
+    ScheduledWindow,
+    UnlockRequest,
+    UnlockWorker,
+    WindowRequest,
+    fail_request,
+    reject_request,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+async def check_relays_async(door_controller, test, **kwargs):
+    """
+    Coroutine version of `check_relays`, takes the same arguments.
+    """
+    first = kwargs.get('first', door_controller.high)
+    second = kwargs.get('second', door_controller.high)
+
+    clock = door_controller.clock
+
+    samples = kwargs.get('samples', 0)
+    if samples > 0:
+        poll_ms = kwargs.get('poll_ms', 5)
+        deadline = clock.now() + kwargs.get('timeout_ms', 1000)/1000
+        settled = 0
+
+        while True:
+            relay = read_relays(door_controller, first, second)
+            settled = settled + 1 if relay == 0 else 0
+            if settled >= samples or clock.now() >= deadline:
+                break
+            await clock.sleep_async(poll_ms/1000)
+
+        return relay_error_for(relay, test)
+
+    ms = kwargs.get('ms', 1000)
+    if ms > 0:
+        await clock.sleep_async(ms/1000)
+
+    relay = read_relays(door_controller, first, second)
+
+    return relay_error_for(relay, test)
+
+
+async def activate_pin_async(door_controller, pin, ms=500, suffix_ms=0):
+    """
+    Coroutine version of `DoorController.activate_pin`.
+    """
+
+    # prevent sleeping for less than half a second
+    if ms < 500:
+        ms = 500
+
+    door_controller.turn_on_led(pin)
+    try:
+        await door_controller.clock.sleep_async(ms/1000)
+    finally:
+        door_controller.turn_off_led(pin)
+
+    if suffix_ms > 0:
+        await door_controller.clock.sleep_async(suffix_ms/1000)
+
+
+class AsyncHoldWindow(HoldWindow):
+    """
+    `HoldWindow` that is waited on from the event loop.
+    """
+
+    async def wait(self):
+        self.started = self.clock.now()
+        self.deadline = self.started + self.ms/1000
+
+        while True:
+            remaining = self.deadline - self.clock.now()
+            if remaining <= 0:
+                break
+            await self.clock.sleep_async(remaining)
+
+        self.deadline = None
+
+
+class AsyncScheduledWindow(ScheduledWindow):
+    """
+    `ScheduledWindow` that is waited on and closed from the event loop.
+    """
+
+    def __init__(self, end, clock=MONOTONIC):
+        super(AsyncScheduledWindow, self).__init__(end, clock)
+        self._wakeup = None
+
+    async def wait(self):
+        self.started = self.clock.now()
+        self.deadline = self.end
+        self._wakeup = asyncio.Event()
+
+        while not self.closed:
+            remaining = self.end - self.clock.now()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        self.deadline = None
+
+    def extend(self, on_extend=None):
+        if self.deadline is None:
+            return False
+
+        self.extended += 1
+        if on_extend is not None:
+            on_extend()
+        return True
+
+    def close(self):
+        self.closed = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+
+async def unlock_door_async(door_controller, ms=5000, hold=None,
+                            on_phase=None, check_kwargs=None,
+                            pre_checked=False):
+    """
+    Coroutine version of `unlock_door`, takes the same arguments except
+    `hold` has to be an `AsyncHoldWindow`.
+    """
+    on_phase = on_phase or ignore_phase
+    check_kwargs = check_kwargs or {}
+
+    if not pre_checked:
+        on_phase('pre_check')
+        relay_error = await check_relays_async(door_controller, 1,
+                                               first=door_controller.low,
+                                               second=door_controller.low,
+                                               **check_kwargs)
+
+        if relay_error.codes.relay > 0:
+            door_controller.relays(activate=False)
+            return relay_error
+
+    on_phase('engage')
+    door_controller.relays(activate=True)
+
+    on_phase('verify')
+    relay_error = await check_relays_async(door_controller, 2,
+                                           first=door_controller.high,
+                                           second=door_controller.high,
+                                           **check_kwargs)
+
+    if relay_error.codes.relay > 0:
+        door_controller.relays(activate=False)
+        return relay_error
+
+    on_phase('hold')
+    if hold is None:
+        await activate_pin_async(door_controller, door_controller.green_pin,
+                                 ms=ms)
+    else:
+        door_controller.turn_on_led(door_controller.green_pin)
+        try:
+            await hold.wait()
+        finally:
+            door_controller.turn_off_led(door_controller.green_pin)
+
+    on_phase('release')
+    door_controller.relays(activate=False)
+
+    on_phase('post_check')
+    relay_error = await check_relays_async(door_controller, 3,
+                                           first=door_controller.low,
+                                           second=door_controller.low,
+                                           **check_kwargs)
+
+    if relay_error.codes.relay > 0:
+        door_controller.relays(activate=False)
+        return relay_error
+
+    return None
+
+
+async def display_error_code_async(relay_error, door_controller, repeats=0):
+    """
+    Coroutine version of `display_error_code`. Displays the error code
+    `repeats` times, or until the task is cancelled if `repeats` is 0. The
+    red led is turned back on once it's done.
+    """
+    shown = 0
+    try:
+        while repeats == 0 or shown < repeats:
+            for flash in error_code_flashes(relay_error):
+                await activate_pin_async(door_controller,
+                                         door_controller.red_pin, **flash)
+            shown += 1
+    finally:
+        door_controller.turn_on_led(door_controller.red_pin)
+
+
+class AsyncDaemon():
+    """
+    Serves unlock requests from `queue` one at a time on the event loop,
+    the relay checks, holds and error code displays wait on the loop's
+    timers instead of sleeping in a thread. Takes the same options as
+    `UnlockWorker` and `process_request`. `serve` returns once the queue is
+    closed and empty.
+    """
+
+    def __init__(self, door_controller, queue, check_kwargs=None,
+                 hold_ms=5000, max_hold_ms=0, error_repeats=0, monitor=None,
+                 admission=None):
+        self.door_controller = door_controller
+        self.clock = door_controller.clock
+        self.admission = admission or Admission(clock=self.clock)
+        self.queue = queue
+        self.check_kwargs = check_kwargs or {}
+        self.hold_ms = hold_ms
+        self.max_hold_ms = max_hold_ms
+        self.error_repeats = error_repeats
+        self.monitor = monitor
+        self.extended = 0
+        self.latency = PhaseLatency()
+        self.counters = UnlockCounters()
+        self.recorders = [self.latency, self.counters]
+        self._current = None
+        self._hold = None
+        self._error_display = None
+        self._wakeup = None
+        self._changes = []
+
+    hold_time = UnlockWorker.hold_time
+    stats = UnlockWorker.stats
+    close_window = UnlockWorker.close_window
+
+    def submit(self, request):
+        hold, current = self._hold, self._current
+        if hold is not None and hold.extend(partial(current.merge, request)):
+            self.extended += 1
+            return True
+
+        reason = self.admission.admit(request)
+        if reason is not None:
+            reject_request(request, reason)
+            return False
+
+        accepted = self.queue.put(request)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return accepted
+
+    def apply(self, change):
+        """
+        `UnlockWorker.apply`, has to be called from the event loop.
+        """
+        if self._current is None:
+            change()
+        else:
+            self._changes.append(change)
+
+    def open_window(self, seconds):
+        """
+        `UnlockWorker.open_window`, has to be called from the event loop.
+        """
+        window = AsyncScheduledWindow(self.clock.now() + seconds, self.clock)
+        if not self.queue.put_front(WindowRequest(window, self.clock)):
+            return None
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return window
+
+    def stop(self):
+        """
+        Closes the queue, `serve` returns once it has served the requests
+        still in it (a scheduled window is ended early).
+        """
+        self.queue.close()
+        self.close_window()
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def show_error(self, relay_error):
+        """
+        Displays `relay_error` on the red led, has to be called from the
+        event loop.
+        """
+        self.cancel_error_display()
+        self._error_display = asyncio.ensure_future(
+            display_error_code_async(relay_error, self.door_controller,
+                                     self.error_repeats))
+
+    def cancel_error_display(self):
+        if self._error_display is not None:
+            self._error_display.cancel()
+            self._error_display = None
+
+    async def process(self, request, hold=None):
+        """
+        Coroutine version of `process_request`.
+        """
+        self.cancel_error_display()
+
+        logger.info('unlocking door',
+                    extra={'request_id': request.request_id,
+                           'source': request.source})
+        on_phase = journaled_phases(self.door_controller, request.mark)
+
+        monitor = self.monitor
+        pre_checked = monitor is not None and monitor.claim()
+        try:
+            relay_error = await unlock_door_async(
+                self.door_controller,
+                ms=request.hold_ms,
+                hold=hold,
+                on_phase=on_phase,
+                check_kwargs=self.check_kwargs,
+                pre_checked=pre_checked
+            )
+        finally:
+            if monitor is not None:
+                monitor.release()
+
+        if self.door_controller.journal is not None:
+            self.door_controller.journal.idle()
+
+        if relay_error:
+            log_error(relay_error, request_id=request.request_id)
+            request.finish(FAILED, relay_error)
+            self.show_error(relay_error)
+        else:
+            request.finish(UNLOCKED)
+
+    async def serve(self):
+        self._wakeup = asyncio.Event()
+        if self.monitor is not None:
+            # sampled between the unlocks on the loop, whose `time` is the
+            # monotonic clock too
+            self.monitor.start(asyncio.get_event_loop().call_at)
+
+        while True:
+            request = self.queue.get(timeout=0)
+            if request is None and self.queue.closed:
+                if self.monitor is not None:
+                    self.monitor.stop()
+                return
+            if request is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if request.window is not None and request.window.closed:
+                request.finish(DROPPED)
+                continue
+
+            delay, reason = self.admission.wait_time(request)
+            if reason is not None:
+                reject_request(request, reason)
+                continue
+            if delay > 0:
+                await self.clock.sleep_async(delay)
+            self.admission.start_cycle()
+
+            request.mark('started')
+            request.hold_ms = self.hold_time(request)
+
+            hold = request.window
+            if hold is None and self.max_hold_ms > request.hold_ms:
+                hold = AsyncHoldWindow(request.hold_ms, self.max_hold_ms,
+                                       self.clock)
+
+            self._current, self._hold = request, hold
+            try:
+                await self.process(request, hold)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                fail_request(request)
+            finally:
+                self._current, self._hold = None, None
+
+            while self._changes:
+                self._changes.pop(0)()
+
+            for recorder in self.recorders:
+                recorder.record(request)
+
+
+async def handle_control(doors, reader, writer):
+    """
+    Coroutine version of `ControlHandler.handle`, for the `AsyncDaemon`s
+    of `doors`.
+    """
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+
+        if not line.strip():
+            continue
+
+        try:
+            message = parse_message(line)
+        except ValueError as e:
+            writer.write(format_error(None, e))
+            continue
+
+        try:
+            if message['op'] == STATS:
+                writer.write(encode(doors.stats(message.get('door'))))
+                continue
+
+            if message['op'] == LATENCY:
+                writer.write(encode(doors.latency(message.get('door'))))
+                continue
+
+            request = unlock_request(message, doors.clock)
+            finished = asyncio.Event()
+            request.add_done_callback(lambda request: finished.set())
+            doors.submit(request)
+        except ValueError as e:
+            writer.write(format_error(message, e))
+            continue
+
+        await finished.wait()
+
+        writer.write(format_reply(request))
+        await writer.drain()
+
+    writer.close()
+
+
+def run(doors, on_exit, control_path=None, on_ready=None, on_reload=None,
+        schedule=None, on_serving=None):
+    """
+    Runs the `AsyncDaemon` of every door in `doors` on a new event loop
+    until SIGINT or SIGTERM is received, then calls `on_exit`. SIGUSR1
+    submits an unlock request for the default door and, if `control_path`
+    is given, requests are accepted on that unix socket. `on_ready` is
+    called once SIGUSR1 is handled, in a thread of the loop's executor so
+    a slow start (ie. `take_over`) doesn't hold up the requests being
+    accepted, then `on_serving` is called on the loop and the requests
+    are served.
+
+    SIGHUP calls `on_reload` (see `Reloader`). SIGUSR2 hands the doors off
+    to a new daemon: the socket stops accepting connections and the loop
+    stops once every door has served the requests it had queued.
+
+    The windows of the `ScheduleEngine` `schedule` are opened and closed by
+    timers on the loop, from once the daemon is ready.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    server = None
+    if control_path is not None:
+        bound = binding_path(control_path)
+        if os.path.exists(bound):
+            os.remove(bound)
+        server = loop.run_until_complete(asyncio.start_unix_server(
+            partial(handle_control, doors), path=bound))
+        inode = move_socket(bound, control_path)
+
+    def handle_usr1():
+        logger.info('handling USR1')
+        request = UnlockRequest('signal', clock=doors.clock)
+        if not doors.submit(request) and request.status == DROPPED:
+            logger.warning('request dropped', extra=doors.get().queue.stats())
+
+    timer = None
+    tasks = []
+
+    def tick():
+        nonlocal timer
+        timer = loop.call_later(schedule.tick(), tick)
+
+    def hand_off():
+        logger.info('handing off')
+        if timer is not None:
+            timer.cancel()
+        if server is not None:
+            server.close()
+        for door_daemon in doors.daemons.values():
+            door_daemon.stop()
+        # the doors may still be being taken over, they serve what they
+        # have queued once they are
+        started.add_done_callback(lambda _: asyncio.gather(
+            *tasks).add_done_callback(lambda _: loop.stop()))
+
+    async def start():
+        if on_ready is not None:
+            await loop.run_in_executor(None, on_ready)
+        if on_serving is not None:
+            on_serving()
+        if schedule is not None:
+            tick()
+        tasks.extend(loop.create_task(door_daemon.serve())
+                     for door_daemon in doors.daemons.values())
+        logger.info('running', extra={'mode': 'asyncio'})
+
+    loop.add_signal_handler(signal.SIGUSR1, handle_usr1)
+    loop.add_signal_handler(signal.SIGINT, loop.stop)
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    loop.add_signal_handler(signal.SIGUSR2, hand_off)
+    if on_reload is not None:
+        loop.add_signal_handler(signal.SIGHUP, on_reload)
+
+    started = loop.create_task(start())
+    try:
+        loop.run_forever()
+    finally:
+        started.cancel()
+        if timer is not None:
+            timer.cancel()
+            schedule.close()
+        for task, door_daemon in zip(tasks, doors.daemons.values()):
+            task.cancel()
+            door_daemon.cancel_error_display()
+        if server is not None:
+            server.close()
+            remove_socket(control_path, inode)
+        on_exit()
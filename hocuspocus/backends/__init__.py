@@ -0,0 +1,118 @@
+from abc import ABCMeta, abstractmethod
+
+from hocuspocus.clock import MONOTONIC
+
+
+# Kernel GPIO numbers of the header pins used by the door controller, as
+# exported by dto_files/rc.local.sh. Note: rc.local.sh exports 70 for the
+# red led on P8_9 while its overlay (bspm_P8_9_7) claims gpio2_5, which is
+# GPIO 69, see `MUXED_PINS`. Pass `pins` to a backend to override the map.
+PINS = {
+    'P8_9': 70,
+    'P8_11': 45,
+    'P8_15': 47,
+    'P8_16': 46,
+    'P8_17': 27,
+    'P8_18': 65,
+}
+
+# The GPIO numbers the device tree overlays mux the header pins to, used by
+# backends that drive the GPIO modules directly.
+MUXED_PINS = dict(PINS, P8_9=69)
+
+
+class GPIOBackend(metaclass=ABCMeta):
+    """
+    Base class for the GPIO backends that can be given to `DoorController`
+    instead of `Adafruit_BBIO.GPIO`. They use the same constants and the
+    same `setup`, `input`, `output` and `cleanup` functions.
+    """
+    HIGH = 1
+    LOW = 0
+
+    IN = 1
+    OUT = 0
+
+    PUD_OFF = 0
+    PUD_DOWN = 1
+    PUD_UP = 2
+
+    @abstractmethod
+    def setup(self, pin, direction, pull_up_down=PUD_OFF):
+        pass
+
+    @abstractmethod
+    def input(self, pin):
+        pass
+
+    @abstractmethod
+    def output(self, pin, value):
+        pass
+
+    def handle(self, pin):
+        """
+        Returns a handle that can be given to `input` and `output` instead
+        of the name of `pin`, only valid until `pin` is set up again.
+        Backends that can resolve a pin to something quicker to read and
+        write than its name should override this.
+        """
+        return pin
+
+    def output_many(self, pins, value):
+        """
+        Sets every pin in `pins` to `value`. Backends that can switch
+        several pins at once should override this.
+        """
+        for pin in pins:
+            self.output(pin, value)
+
+    def cleanup(self):
+        pass
+
+    @classmethod
+    def from_config(cls, options, clock=MONOTONIC):
+        """
+        Creates the backend from the options of the `[gpio]` config section,
+        backends that wait or keep time use `clock`.
+        """
+        return cls(**options)
+
+
+def parse_pins(value, defaults=PINS):
+    """
+    Parses a `P8_9=69, P8_11=45` style pin map from the config file, pins
+    that aren't given keep their number in `defaults`.
+    """
+    pins = dict(defaults)
+    for item in value.split(','):
+        if item.strip():
+            name, number = item.split('=')
+            pins[name.strip()] = int(number)
+    return pins
+
+
+def create_backend(name, options=None, clock=MONOTONIC):
+    """
+    Returns the GPIO backend called `name`, created with the (string)
+    `options` of the `[gpio]` config section and the daemon's `clock`. The
+    backend modules are only imported when they are used.
+    """
+    options = dict(options or {})
+
+    if name == 'adafruit':
+        import Adafruit_BBIO.GPIO as GPIO
+        return GPIO
+
+    if name == 'mmap':
+        from hocuspocus.backends.memory import MmapGPIO
+        return MmapGPIO.from_config(options, clock)
+
+    if name == 'sysfs':
+        from hocuspocus.backends.sysfs import SysfsGPIO
+        return SysfsGPIO.from_config(options, clock)
+
+    if name == 'simulator':
+        from hocuspocus.backends.simulator import SimulatedGPIO
+        return SimulatedGPIO.from_config(options, clock)
+
+    raise ValueError('Unknown GPIO backend: {}'.format(name))
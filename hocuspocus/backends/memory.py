@@ -0,0 +1,136 @@
+import os
+import mmap
+
+from hocuspocus.backends import GPIOBackend, MUXED_PINS, parse_pins
+from hocuspocus.clock import MONOTONIC
+
+
+# AM335x GPIO0-3 module base addresses (AM335x TRM, memory map)
+GPIO_BANKS = (0x44E07000, 0x4804C000, 0x481AC000, 0x481AE000)
+BANK_SIZE = 0x1000
+
+# register offsets within a bank
+OE = 0x134
+DATAIN = 0x138
+DATAOUT = 0x13C
+CLEARDATAOUT = 0x190
+SETDATAOUT = 0x194
+
+
+class MmapPin():
+    """
+    Pin handle, the registers of the pin's bank and its bit.
+    """
+
+    __slots__ = ('bank', 'registers', 'mask')
+
+    def __init__(self, bank, registers, mask):
+        self.bank = bank
+        self.registers = registers
+        self.mask = mask
+
+
+class MmapGPIO(GPIOBackend):
+    """
+    GPIO backend that reads and writes the AM335x GPIO registers directly
+    through a memory map of `path` (/dev/mem by default, needs root).
+
+    `banks` - base address of each GPIO bank within `path`, point them at
+    an ordinary file to try the backend out without the hardware
+    `pins` - header pin name to kernel GPIO number map, defaults to the
+    pins muxed by the overlays (see `MUXED_PINS`)
+
+    `handle` resolves a pin to its bank's registers and bit once, so a
+    handle is read or written without looking the pin up. Pins are read
+    from DATAIN and written with SETDATAOUT/CLEARDATAOUT, so
+    no read-modify-write is needed and pins in the same bank are switched
+    together with a single write (the relay engage pins are in banks 0 and
+    1, so `relays` makes two back to back writes). Pull up/down resistors
+    are set by the device tree overlays and are ignored.
+    """
+
+    def __init__(self, path='/dev/mem', banks=GPIO_BANKS, pins=MUXED_PINS):
+        self.path = path
+        self.banks = tuple(banks)
+        self.pins = pins
+        self._fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        self._maps = {}
+        self._registers = {}
+
+    @classmethod
+    def from_config(cls, options, clock=MONOTONIC):
+        kwargs = {}
+        if 'path' in options:
+            kwargs['path'] = options['path']
+        if 'banks' in options:
+            kwargs['banks'] = [
+                int(base, 0) for base in options['banks'].split(',')]
+        if 'pins' in options:
+            kwargs['pins'] = parse_pins(options['pins'], MUXED_PINS)
+        return cls(**kwargs)
+
+    def _bank(self, bank):
+        """
+        Returns the registers of `bank` as 32 bit words, mapping the bank on
+        first use.
+        """
+        registers = self._registers.get(bank)
+        if registers is None:
+            self._maps[bank] = mmap.mmap(self._fd, BANK_SIZE,
+                                         offset=self.banks[bank])
+            registers = memoryview(self._maps[bank]).cast('I')
+            self._registers[bank] = registers
+        return registers
+
+    def _resolve(self, pin):
+        number = self.pins[pin]
+        return number // 32, 1 << (number % 32)
+
+    def handle(self, pin):
+        bank, mask = self._resolve(pin)
+        return MmapPin(bank, self._bank(bank), mask)
+
+    def _pin(self, pin):
+        if isinstance(pin, MmapPin):
+            return pin
+        return self.handle(pin)
+
+    def setup(self, pin, direction, pull_up_down=GPIOBackend.PUD_OFF):
+        pin = self._pin(pin)
+        # OE: 1 is an input, 0 an output, only written if it changes
+        enabled = pin.registers[OE // 4]
+        if direction == self.IN:
+            if not enabled & pin.mask:
+                pin.registers[OE // 4] = enabled | pin.mask
+        elif enabled & pin.mask:
+            pin.registers[OE // 4] = enabled & ~pin.mask & 0xFFFFFFFF
+
+    def input(self, pin):
+        pin = self._pin(pin)
+        return self.HIGH if pin.registers[DATAIN // 4] & pin.mask else self.LOW
+
+    def output(self, pin, value):
+        pin = self._pin(pin)
+        register = SETDATAOUT if value else CLEARDATAOUT
+        pin.registers[register // 4] = pin.mask
+
+    def output_many(self, pins, value):
+        masks = {}
+        for pin in pins:
+            pin = self._pin(pin)
+            masks[pin.bank] = masks.get(pin.bank, 0) | pin.mask
+
+        register = SETDATAOUT if value else CLEARDATAOUT
+        for bank, mask in masks.items():
+            self._bank(bank)[register // 4] = mask
+
+    def cleanup(self):
+        for registers in self._registers.values():
+            registers.release()
+        for memory_map in self._maps.values():
+            memory_map.close()
+        self._registers.clear()
+        self._maps.clear()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
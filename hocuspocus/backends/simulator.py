@@ -0,0 +1,191 @@
+import configparser
+
+from hocuspocus.backends import GPIOBackend
+from hocuspocus.clock import MONOTONIC
+
+
+# relay faults
+STUCK_HIGH = 'high'
+STUCK_LOW = 'low'
+WELDED = 'weld'
+
+FAULTS = (STUCK_HIGH, STUCK_LOW, WELDED)
+
+
+class SimulatedRelay():
+    """
+    Timing model of one relay, driven by its engage pin and read back on
+    its read pin.
+
+    `actuate_ms` - time from engaging the relay to its contacts closing
+    `release_ms` - time from releasing the relay to its contacts opening
+    `bounce_ms` - time the contacts chatter for after closing or opening,
+    the read level flips every millisecond
+    `fault` - None, 'high' or 'low' (the read pin is stuck at that level)
+    or 'weld' (the contacts stay closed once they have closed)
+    """
+
+    def __init__(self, engage, read, actuate_ms=15, release_ms=10,
+                 bounce_ms=0, fault=None):
+        if fault not in FAULTS + (None,):
+            raise ValueError('Unknown relay fault: {}'.format(fault))
+
+        self.engage = engage
+        self.read = read
+        self.actuate_ms = actuate_ms
+        self.release_ms = release_ms
+        self.bounce_ms = bounce_ms
+        self.fault = fault
+        self.engaged = False
+        self.welded = False
+        self._changed = None
+        self._from = GPIOBackend.LOW
+
+    def drive(self, engaged, now):
+        if engaged == self.engaged:
+            return
+        # the contacts weld once they've closed, whether or not anyone read
+        # the relay while it was engaged
+        if (self.fault == WELDED and self.engaged and
+                self._settled(now)):
+            self.welded = True
+        self._from = self.level(now)
+        self._changed = now
+        self.engaged = engaged
+
+    def _settled(self, now):
+        if self._changed is None:
+            return True
+        delay_ms = self.actuate_ms if self.engaged else self.release_ms
+        elapsed_ms = (now - self._changed) * 1000
+        return elapsed_ms >= delay_ms + self.bounce_ms
+
+    def level(self, now):
+        if self.fault == STUCK_HIGH:
+            return GPIOBackend.HIGH
+        if self.fault == STUCK_LOW:
+            return GPIOBackend.LOW
+        if self.welded:
+            return GPIOBackend.HIGH
+
+        target = GPIOBackend.HIGH if self.engaged else GPIOBackend.LOW
+        if self._changed is None:
+            return target
+
+        elapsed_ms = (now - self._changed) * 1000
+        delay_ms = self.actuate_ms if self.engaged else self.release_ms
+
+        if elapsed_ms < delay_ms:
+            return self._from
+
+        if elapsed_ms < delay_ms + self.bounce_ms:
+            if int(elapsed_ms - delay_ms) % 2:
+                return self._from
+            return target
+
+        return target
+
+
+class SimulatedGPIO(GPIOBackend):
+    """
+    GPIO backend that simulates the door controller's hardware, for
+    benchmarks and for reproducing relay faults without a BeagleBone.
+
+    `relays` - the `SimulatedRelay`s, engaging a relay's engage pin drives
+    its read pin after the relay's timing
+    `now` - function returning the current time in seconds
+
+    Every other output pin (the leds) just keeps the last level written,
+    see `outputs`.
+    """
+
+    def __init__(self, relays, now=MONOTONIC.now):
+        self.relays = list(relays)
+        self.now = now
+        self.directions = {}
+        self.outputs = {}
+        self._by_engage = dict(
+            (relay.engage, relay) for relay in self.relays)
+        self._by_read = dict((relay.read, relay) for relay in self.relays)
+
+    @classmethod
+    def from_config(cls, options, clock=MONOTONIC):
+        if 'config' in options:
+            return cls.from_file(options['config'], clock)
+        return cls(default_relays(), now=clock.now)
+
+    @classmethod
+    def from_file(cls, path, clock=MONOTONIC):
+        """
+        Reads the relays from an INI file with a section per relay:
+
+            [relay:1]
+            engage = P8_15
+            read = P8_16
+            actuate_ms = 15
+            release_ms = 10
+            bounce_ms = 3
+            fault = weld
+
+        Relays that aren't in the file use the defaults of
+        `default_relays`.
+        """
+        config = configparser.ConfigParser()
+        with open(path) as f:
+            config.read_file(f)
+
+        relays = dict((relay.engage, relay) for relay in default_relays())
+        for section in config.sections():
+            if not section.startswith('relay:'):
+                continue
+            options = config[section]
+            relay = SimulatedRelay(
+                options.get('engage'),
+                options.get('read'),
+                actuate_ms=options.getfloat('actuate_ms', 15),
+                release_ms=options.getfloat('release_ms', 10),
+                bounce_ms=options.getfloat('bounce_ms', 0),
+                fault=options.get('fault')
+            )
+            relays[relay.engage] = relay
+
+        return cls(relays.values(), now=clock.now)
+
+    @property
+    def leds(self):
+        """
+        Levels of the output pins that aren't relay engage pins.
+        """
+        return dict((pin, level) for pin, level in self.outputs.items()
+                    if pin not in self._by_engage)
+
+    def setup(self, pin, direction, pull_up_down=GPIOBackend.PUD_OFF):
+        self.directions[pin] = direction
+        if direction == self.OUT:
+            self.output(pin, self.LOW)
+
+    def input(self, pin):
+        relay = self._by_read.get(pin)
+        if relay is not None:
+            return relay.level(self.now())
+        return self.outputs.get(pin, self.LOW)
+
+    def output(self, pin, value):
+        self.outputs[pin] = self.HIGH if value else self.LOW
+        relay = self._by_engage.get(pin)
+        if relay is not None:
+            relay.drive(bool(value), self.now())
+
+
+def default_relays():
+    """
+    Relays wired to the `DoorController` pins with typical timings.
+    """
+    from hocuspocus.door_controller import DoorController
+
+    return [
+        SimulatedRelay(DoorController.relay_1.engage,
+                       DoorController.relay_1.read),
+        SimulatedRelay(DoorController.relay_2.engage,
+                       DoorController.relay_2.read),
+    ]
@@ -0,0 +1,107 @@
+import os
+
+from hocuspocus.backends import GPIOBackend, PINS, parse_pins
+from hocuspocus.clock import MONOTONIC
+
+
+class SysfsGPIO(GPIOBackend):
+    """
+    GPIO backend that uses the kernel's sysfs GPIO interface under `root`.
+
+    `pins` - header pin name to kernel GPIO number map (see `PINS`)
+    `export_timeout` - seconds to wait for a pin exported by `setup` to show
+    up (and for udev to fix its permissions)
+    `clock` - clock the export is waited for with
+
+    Each pin's value file is opened once by `setup`, after that every read
+    and write is a single `pread`/`pwrite` on the cached file descriptor,
+    which is also the pin's `handle`.
+    Pull up/down resistors are set by the device tree overlays and are
+    ignored.
+    """
+
+    def __init__(self, root='/sys/class/gpio', pins=PINS, export_timeout=5,
+                 clock=MONOTONIC):
+        self.root = root
+        self.pins = pins
+        self.export_timeout = export_timeout
+        self.clock = clock
+        self._fds = {}
+
+    @classmethod
+    def from_config(cls, options, clock=MONOTONIC):
+        kwargs = {'clock': clock}
+        if 'root' in options:
+            kwargs['root'] = options['root']
+        if 'pins' in options:
+            kwargs['pins'] = parse_pins(options['pins'])
+        if 'export_timeout' in options:
+            kwargs['export_timeout'] = float(options['export_timeout'])
+        return cls(**kwargs)
+
+    def _path(self, number, name):
+        return os.path.join(self.root, 'gpio{}'.format(number), name)
+
+    def _export(self, number):
+        with open(os.path.join(self.root, 'export'), 'w') as f:
+            f.write(str(number))
+
+        deadline = self.clock.now() + self.export_timeout
+        value = self._path(number, 'value')
+        while not os.access(value, os.R_OK | os.W_OK):
+            if self.clock.now() >= deadline:
+                raise OSError('GPIO {} was not exported in time'.format(
+                    number))
+            self.clock.sleep(0.05)
+
+    def _direction(self, number):
+        with open(self._path(number, 'direction')) as f:
+            return f.read().strip()
+
+    def setup(self, pin, direction, pull_up_down=GPIOBackend.PUD_OFF):
+        """
+        Exports the pin and sets its direction, unless it's already exported
+        with that direction (ie. after a restart). An output is set low
+        either way.
+        """
+        number = self.pins[pin]
+        wanted = 'in' if direction == self.IN else 'out'
+
+        configured = False
+        if not os.path.isdir(os.path.join(self.root,
+                                          'gpio{}'.format(number))):
+            self._export(number)
+        else:
+            configured = self._direction(number) == wanted
+
+        if not configured:
+            # writing 'out' also sets the pin low
+            with open(self._path(number, 'direction'), 'w') as f:
+                f.write(wanted)
+
+        previous = self._fds.pop(pin, None)
+        if previous is not None:
+            os.close(previous)
+
+        flags = os.O_RDONLY if direction == self.IN else os.O_RDWR
+        self._fds[pin] = os.open(self._path(number, 'value'), flags)
+        if configured and direction == self.OUT:
+            self.output(pin, self.LOW)
+
+    def handle(self, pin):
+        return self._fds[pin]
+
+    def _fd(self, pin):
+        return pin if isinstance(pin, int) else self._fds[pin]
+
+    def input(self, pin):
+        value = os.pread(self._fd(pin), 1, 0)
+        return self.HIGH if value == b'1' else self.LOW
+
+    def output(self, pin, value):
+        os.pwrite(self._fd(pin), b'1' if value else b'0', 0)
+
+    def cleanup(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
@@ -0,0 +1,130 @@
+import time
+import heapq
+import threading
+
+from itertools import count
+
+from hocuspocus.timers import Timer, shared_wheel
+
+
+class MonotonicClock():
+    """
+    The real clock, used unless another one is given.
+    """
+
+    def now(self):
+        return time.monotonic()
+
+    def call_at(self, when, callback, *args):
+        """
+        Schedules `callback(*args)` to run at `when` on the process'
+        `TimerWheel` thread. Returns the `Timer`.
+        """
+        return shared_wheel().call_at(when, callback, *args)
+
+    def call_later(self, delay, callback, *args):
+        return shared_wheel().call_later(delay, callback, *args)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def sleep_async(self, seconds):
+        """
+        Returns an awaitable that sleeps on the event loop, used by
+        `hocuspocus.aio`.
+        """
+        import asyncio
+        return asyncio.sleep(seconds)
+
+    def wait(self, condition, timeout):
+        """
+        Waits on the (acquired) `condition` for up to `timeout` seconds.
+        """
+        condition.wait(timeout)
+
+    def wait_event(self, event, timeout):
+        """
+        Waits up to `timeout` seconds for `event` to be set, returns whether
+        it's set.
+        """
+        return event.wait(timeout)
+
+
+class VirtualClock():
+    """
+    Discrete event clock for simulations. Time only moves when something
+    sleeps or waits on the clock, which jumps straight to the end of the
+    sleep, running any events scheduled with `call_at`/`call_later` on the
+    way, in order. Hours of door traffic can be simulated in milliseconds.
+
+    Sleeping advances the clock for everyone, so it has to be driven from
+    a single thread. Simulations serve the requests themselves with
+    `UnlockWorker.serve_one` (or `process_request`) instead of starting the
+    worker thread. Timelines (see `hocuspocus.timers`) play on its events.
+    """
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._events = []
+        self._sequence = count()
+        self._lock = threading.RLock()
+
+    def now(self):
+        return self._now
+
+    def call_at(self, when, callback, *args):
+        """
+        Schedules `callback(*args)` to run once the clock reaches `when`.
+        Returns the `Timer`.
+        """
+        timer = Timer(when, None, callback, args)
+        with self._lock:
+            heapq.heappush(self._events, (when, next(self._sequence), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self._now + delay, callback, *args)
+
+    def advance(self, seconds):
+        """
+        Moves the clock forward by `seconds`, running every event that is
+        due on the way.
+        """
+        with self._lock:
+            target = self._now + max(seconds, 0)
+            while self._events and self._events[0][0] <= target:
+                when, _, timer = heapq.heappop(self._events)
+                if timer.cancelled:
+                    continue
+                self._now = max(self._now, when)
+                timer.callback(*timer.args)
+            self._now = target
+
+    def run(self):
+        """
+        Runs every scheduled event, including the ones they schedule.
+        """
+        with self._lock:
+            while self._events:
+                self.advance(self._events[0][0] - self._now)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def sleep_async(self, seconds):
+        import asyncio
+        self.advance(seconds)
+        return asyncio.sleep(0)
+
+    def wait(self, condition, timeout):
+        # events run while advancing may notify the condition, the caller
+        # re-checks its deadline either way
+        self.advance(timeout)
+
+    def wait_event(self, event, timeout):
+        if not event.is_set():
+            self.advance(timeout)
+        return event.is_set()
+
+
+MONOTONIC = MonotonicClock()
@@ -0,0 +1,218 @@
+import os
+import json
+import threading
+import socketserver
+
+from hocuspocus.clock import MONOTONIC
+from hocuspocus.worker import UnlockRequest
+
+
+UNLOCK = 'unlock'
+STATS = 'stats'
+LATENCY = 'latency'
+OPS = (UNLOCK, STATS, LATENCY)
+
+
+def default_control_path(pid_path):
+    """
+    Returns the path of the control socket that lives next to the pid file.
+    """
+    return os.path.splitext(pid_path)[0] + '.sock'
+
+
+def binding_path(path):
+    """
+    Returns the path the control socket is bound at before it's moved over
+    `path` with `move_socket`.
+    """
+    return '{}.{}'.format(path, os.getpid())
+
+
+def move_socket(bound, path):
+    """
+    Moves the socket bound at `bound` over `path` in one step. A daemon
+    serving on the socket at `path` (see `main`'s `handoff`) keeps the
+    connections it has, new ones go to the moved socket. Returns the inode
+    of the socket, see `remove_socket`.
+    """
+    os.rename(bound, path)
+    return os.stat(path).st_ino
+
+
+def remove_socket(path, inode):
+    """
+    Removes the socket at `path` unless another daemon has moved its own
+    socket over it since.
+    """
+    try:
+        if os.stat(path).st_ino == inode:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def parse_message(line):
+    """
+    Parses a line sent to the control socket. Each line is a JSON object:
+
+        {"op": "unlock", "id": "badge-1234", "hold_ms": 3000}
+        {"op": "unlock", "door": "back"}
+        {"op": "unlock", "credential": "badge-1234"}
+        {"op": "unlock", "deadline_ms": 2000}
+        {"op": "stats", "door": "back"}
+        {"op": "latency"}
+
+    `op` defaults to unlock, `id`, `hold_ms`, `door` (the default door if
+    it's not given), `credential` (see `AccessList`) and `deadline_ms` (see
+    `Admission`) are optional.
+    Raises a `ValueError` if the message isn't valid.
+    """
+    message = json.loads(line.decode('utf-8'))
+    if not isinstance(message, dict):
+        raise ValueError('Expected a JSON object')
+
+    op = message.setdefault('op', UNLOCK)
+    if op not in OPS:
+        raise ValueError('Unknown op: {}'.format(op))
+
+    for option in ('hold_ms', 'deadline_ms'):
+        ms = message.get(option)
+        if ms is not None and (not isinstance(ms, int) or ms <= 0):
+            raise ValueError('{} must be a positive integer'.format(option))
+
+    door = message.get('door')
+    if door is not None and not isinstance(door, str):
+        raise ValueError('door must be a string')
+
+    credential = message.get('credential')
+    if credential is not None and (
+            not isinstance(credential, str) or not credential):
+        raise ValueError('credential must be a non-empty string')
+
+    return message
+
+
+def unlock_request(message, clock=MONOTONIC):
+    return UnlockRequest('socket',
+                         request_id=message.get('id'),
+                         hold_ms=message.get('hold_ms'),
+                         clock=clock,
+                         door=message.get('door'),
+                         credential=message.get('credential'),
+                         deadline_ms=message.get('deadline_ms'))
+
+
+def encode(reply):
+    return bytearray(json.dumps(reply) + '\n', 'utf-8')
+
+
+def format_reply(request):
+    """
+    Returns the completion message of a finished `UnlockRequest`. `code` and
+    `message` are only set if the door failed to unlock, `reason` if it was
+    rejected, `timings` are the milliseconds spent in each phase.
+    """
+    relay_error = request.relay_error
+    return encode({
+        'id': request.request_id,
+        'status': request.status,
+        'reason': request.reason,
+        'code': relay_error.code if relay_error else None,
+        'message': relay_error.message if relay_error else None,
+        'timings': dict(request.timings()),
+    })
+
+
+def format_error(message, error):
+    return encode({
+        'id': message.get('id') if isinstance(message, dict) else None,
+        'status': 'invalid',
+        'error': str(error),
+    })
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    """
+    Serves the messages of one connection in order, replying to each
+    unlock request once it has finished.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            try:
+                message = parse_message(line)
+            except ValueError as e:
+                self.wfile.write(format_error(None, e))
+                continue
+
+            try:
+                if message['op'] == STATS:
+                    self.wfile.write(encode(
+                        self.server.stats(message.get('door'))))
+                    continue
+
+                if message['op'] == LATENCY:
+                    self.wfile.write(encode(
+                        self.server.latency(message.get('door'))))
+                    continue
+
+                request = unlock_request(message, self.server.clock)
+                finished = threading.Event()
+                request.add_done_callback(lambda request: finished.set())
+                self.server.submit(request)
+            except ValueError as e:
+                self.wfile.write(format_error(message, e))
+                continue
+
+            finished.wait()
+
+            self.wfile.write(format_reply(request))
+
+
+class ControlServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    """
+    Unix domain socket that accepts unlock requests from local processes.
+
+    `submit(request)` - queues an `UnlockRequest`, raises a `ValueError` if
+    it names an unknown door
+    `stats(door)` - returns a JSON serializable dict for the stats op
+    `clock` - clock the requests are timed with
+    `latency(door)` - returns the phase latency summaries for the latency
+    op (see `PhaseLatency.dump`)
+
+    `door` is the door named by the message, `None` if it didn't name one
+    (see `Doors`).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, submit, stats, clock=MONOTONIC,
+                 latency=lambda door: {}):
+        bound = binding_path(path)
+        if os.path.exists(bound):
+            os.remove(bound)
+
+        self.path = path
+        self.submit = submit
+        self.stats = stats
+        self.clock = clock
+        self.latency = latency
+        socketserver.UnixStreamServer.__init__(self, bound, ControlHandler)
+        # replaces a socket left behind by a daemon that didn't exit cleanly
+        # or the one of the daemon being handed off from
+        self._inode = move_socket(bound, path)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever,
+                                  name='ControlServer',
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.server_close()
+        remove_socket(self.path, self._inode)
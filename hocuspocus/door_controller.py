@@ -1,6 +1,8 @@
-import time
 from collections import namedtuple
 
+from hocuspocus.backends import GPIOBackend
+from hocuspocus.clock import MONOTONIC
+
 
 Relay = namedtuple('Relay', 'read engage')
 
@@ -19,54 +21,125 @@ class DoorController():
 
         Read_LED: 69
         Read_LED: P8_9
+
+    The pins can be changed for each door by passing `relay_1`, `relay_2`
+    (`Relay`s of pin names), `green_pin` or `red_pin`, and moved while the
+    daemon runs with `set_pins`.
+
+    Setting up an output drives it low, a daemon taking over the doors from
+    another one (see `take_over`) passes `setup=False` and calls
+    `setup_pins` once the other daemon has exited, so the unlock it's
+    finishing isn't cut short.
     """
     relay_1 = Relay('P8_16', 'P8_15')
     relay_2 = Relay('P8_18', 'P8_17')
     green_pin = 'P8_11'
     red_pin = 'P8_9'
 
-    def __init__(self, GPIO):
-        self.GPIO = GPIO
+    # used for every delay, see `hocuspocus.clock`
+    clock = MONOTONIC
 
-        # Relay_1: Read
-        self.GPIO.setup(
-            self.relay_1.read,
-            self.GPIO.IN,
-            pull_up_down=self.GPIO.PUD_DOWN
-        )
-        # Relay_2: Read
-        self.GPIO.setup(
-            self.relay_2.read,
-            self.GPIO.IN,
-            pull_up_down=self.GPIO.PUD_DOWN
-        )
+    # `StatusBoard` the pin levels are published to, if any
+    status = None
 
-        # Relay_1: Engage
-        self.GPIO.setup(
-            self.relay_1.engage,
-            self.GPIO.OUT,
-            pull_up_down=self.GPIO.PUD_DOWN
-        )
-        # Relay_2: Engage
-        self.GPIO.setup(
-            self.relay_2.engage,
-            self.GPIO.OUT,
-            pull_up_down=self.GPIO.PUD_DOWN
-        )
+    # `UnlockJournal` the unlock phases are journaled to, if any
+    journal = None
 
-        # Red_LED
-        self.GPIO.setup(
-            self.red_pin,
-            self.GPIO.OUT,
-            pull_up_down=self.GPIO.PUD_DOWN
-        )
-        # Green_LED
-        self.GPIO.setup(
-            self.green_pin,
-            self.GPIO.OUT,
-            pull_up_down=self.GPIO.PUD_DOWN
+    def __init__(self, GPIO, clock=None, relay_1=None, relay_2=None,
+                 green_pin=None, red_pin=None, setup=True):
+        self.GPIO = GPIO
+        if clock is not None:
+            self.clock = clock
+        if relay_1 is not None:
+            self.relay_1 = relay_1
+        if relay_2 is not None:
+            self.relay_2 = relay_2
+        if green_pin is not None:
+            self.green_pin = green_pin
+        if red_pin is not None:
+            self.red_pin = red_pin
+
+        self.pins = {}
+        if setup:
+            self.setup_pins()
+
+    def setup_pins(self):
+        """
+        Sets up the pins the door was created with, unless they already
+        are. Returns the names of the pins that were set up.
+        """
+        if self.pins:
+            return []
+        return self.set_pins(relay_1=self.relay_1, relay_2=self.relay_2,
+                             green_pin=self.green_pin, red_pin=self.red_pin)
+
+    def set_pins(self, relay_1=None, relay_2=None, green_pin=None,
+                 red_pin=None):
+        """
+        Moves the door to the pins given (by name) that differ from the ones
+        it uses, the others aren't set up again. The outputs it stops using
+        are driven low first. Returns the names of the pins that changed.
+        """
+        pins = {
+            'relay_1': relay_1,
+            'relay_2': relay_2,
+            'green_pin': green_pin,
+            'red_pin': red_pin,
+        }
+        changed = dict(
+            (name, pin) for name, pin in pins.items()
+            if pin is not None and self.pins.get(name) != pin
         )
 
+        for name in changed:
+            if name not in self.pins:
+                continue
+            used = getattr(self, name)
+            if isinstance(used, Relay):
+                used = used.engage
+            self.GPIO.output(used, self.low)
+
+        # Relay_1 & Relay_2: Read
+        for name in ('relay_1', 'relay_2'):
+            if name in changed:
+                self.GPIO.setup(
+                    changed[name].read,
+                    self.GPIO.IN,
+                    pull_up_down=self.GPIO.PUD_DOWN
+                )
+
+        # Relay_1 & Relay_2: Engage
+        for name in ('relay_1', 'relay_2'):
+            if name in changed:
+                self.GPIO.setup(
+                    changed[name].engage,
+                    self.GPIO.OUT,
+                    pull_up_down=self.GPIO.PUD_DOWN
+                )
+
+        # Red_LED & Green_LED
+        for name in ('red_pin', 'green_pin'):
+            if name in changed:
+                self.GPIO.setup(
+                    changed[name],
+                    self.GPIO.OUT,
+                    pull_up_down=self.GPIO.PUD_DOWN
+                )
+
+        # resolve the pins once, so the unlock doesn't look them up by name
+        # on every read and write
+        for name, pin in changed.items():
+            if isinstance(self.GPIO, GPIOBackend):
+                if isinstance(pin, Relay):
+                    pin = Relay(*map(self.GPIO.handle, pin))
+                else:
+                    pin = self.GPIO.handle(pin)
+            setattr(self, name, pin)
+        self._engage_pins = (self.relay_1.engage, self.relay_2.engage)
+
+        self.pins.update(changed)
+        return sorted(changed)
+
     @property
     def high(self):
         return self.GPIO.HIGH
@@ -76,26 +149,50 @@ class DoorController():
         return self.GPIO.LOW
 
     def clean_up(self):
+        # the pins were never set up, they may still be another daemon's
+        if not self.pins:
+            return
         self.turn_off_led(self.green_pin)
         self.turn_off_led(self.red_pin)
         self.relays(False)
 
+    def _publish_led(self, pin, level):
+        if pin == self.green_pin:
+            self.status.update(green=level)
+        elif pin == self.red_pin:
+            self.status.update(red=level)
+
     def turn_on_led(self, pin):
         self.GPIO.output(pin, self.high)
+        if self.status is not None:
+            self._publish_led(pin, self.high)
 
     def turn_off_led(self, pin):
         self.GPIO.output(pin, self.low)
+        if self.status is not None:
+            self._publish_led(pin, self.low)
 
     def test_relay_state(self, relay, expected):
         """
         returns True if the relay is in the spected state
         """
-        return self.GPIO.input(relay) == expected
+        level = self.GPIO.input(relay)
+        if self.status is not None:
+            if relay == self.relay_1.read:
+                self.status.update(relay_1=level)
+            elif relay == self.relay_2.read:
+                self.status.update(relay_2=level)
+        return level == expected
 
     def relays(self, activate=True):
         output = self.high if activate else self.low
-        self.GPIO.output(self.relay_1.engage, output)
-        self.GPIO.output(self.relay_2.engage, output)
+        if isinstance(self.GPIO, GPIOBackend):
+            self.GPIO.output_many(self._engage_pins, output)
+        else:
+            self.GPIO.output(self.relay_1.engage, output)
+            self.GPIO.output(self.relay_2.engage, output)
+        if self.status is not None:
+            self.status.update(engaged=output)
 
     def activate_pin(self, pin, ms=500, suffix_ms=0):
         """
@@ -110,8 +207,8 @@ class DoorController():
         if ms < 500:
             ms = 500
 
-        self.GPIO.output(pin, self.GPIO.HIGH)
-        time.sleep(ms/1000)  # convert milliseconds to seconds
-        self.GPIO.output(pin, self.GPIO.LOW)
+        self.turn_on_led(pin)
+        self.clock.sleep(ms/1000)  # convert milliseconds to seconds
+        self.turn_off_led(pin)
         if suffix_ms > 0:
-            time.sleep(suffix_ms/1000)
+            self.clock.sleep(suffix_ms/1000)
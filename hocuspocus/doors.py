@@ -0,0 +1,180 @@
+import logging
+
+from collections import OrderedDict, namedtuple
+
+from hocuspocus.door_controller import DoorController, Relay
+from hocuspocus.worker import DENIED
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_DOOR = 'default'
+
+# pin options of a `[door:<name>]` config section, with the
+# `DoorController` keyword argument each one sets
+PIN_OPTIONS = (
+    ('relay_1_read', 'relay_1', 'read'),
+    ('relay_1_engage', 'relay_1', 'engage'),
+    ('relay_2_read', 'relay_2', 'read'),
+    ('relay_2_engage', 'relay_2', 'engage'),
+    ('green_led', 'green_pin', None),
+    ('red_led', 'red_pin', None),
+)
+
+# a `[door:<name>]` section, `pins` are the `DoorController` keyword
+# arguments
+DoorConfig = namedtuple('DoorConfig', 'name pins hold_ms max_hold_ms')
+
+
+class Door():
+    """
+    A door served by the daemon, its `DoorController` and the time it's
+    held unlocked for (see `UnlockWorker`).
+
+    Once `main` serves the door, `daemon` is its `UnlockWorker` (or
+    `AsyncDaemon`), `check_kwargs` the `check_relays` options it unlocks
+    with and `error_display` its `ErrorDisplay` (threaded mode only), see
+    `Reloader`.
+    """
+
+    def __init__(self, name, door_controller, hold_ms=5000, max_hold_ms=0):
+        self.name = name
+        self.door_controller = door_controller
+        self.hold_ms = hold_ms
+        self.max_hold_ms = max_hold_ms
+        self.daemon = None
+        self.check_kwargs = {}
+        self.error_display = None
+
+
+def read_doors(config, hold_ms=5000, max_hold_ms=0):
+    """
+    Returns a `DoorConfig` for each `[door:<name>]` section of `config`, in
+    order:
+
+        [door:front]
+        relay_1_read = P8_16
+        relay_1_engage = P8_15
+        relay_2_read = P8_18
+        relay_2_engage = P8_17
+        green_led = P8_11
+        red_led = P8_9
+        hold_ms = 5000
+        max_hold_ms = 0
+
+    Every pin has to be given and no two doors can share a pin, the hold
+    times default to `hold_ms` and `max_hold_ms`. Returns an empty list if
+    there are no door sections. Raises a `ValueError` if a door isn't
+    valid.
+    """
+    doors = []
+    used = {}
+
+    for section in config.sections():
+        if not section.startswith('door:'):
+            continue
+
+        name = section[len('door:'):].strip()
+        if not name:
+            raise ValueError('[{}] has no door name'.format(section))
+
+        options = config[section]
+        pins = {}
+        for option, _, _ in PIN_OPTIONS:
+            pin = options.get(option)
+            if not pin:
+                raise ValueError('[{}] is missing {}'.format(section, option))
+            if pin in used:
+                raise ValueError('[{}] {} {} is already used by {}'.format(
+                    section, option, pin, used[pin]))
+            used[pin] = name
+            pins[option] = pin
+
+        doors.append(DoorConfig(
+            name,
+            {
+                'relay_1': Relay(pins['relay_1_read'],
+                                 pins['relay_1_engage']),
+                'relay_2': Relay(pins['relay_2_read'],
+                                 pins['relay_2_engage']),
+                'green_pin': pins['green_led'],
+                'red_pin': pins['red_led'],
+            },
+            options.getint('hold_ms', hold_ms),
+            options.getint('max_hold_ms', max_hold_ms)
+        ))
+
+    return doors
+
+
+def load_doors(config, GPIO, hold_ms=5000, max_hold_ms=0, clock=None,
+               setup=True):
+    """
+    Creates a `Door` for each `[door:<name>]` section of `config`, see
+    `read_doors`. Their pins are only set up if `setup` is True (see
+    `DoorController`). Raises a `ValueError` if a door isn't valid.
+    """
+    return [
+        Door(door.name,
+             DoorController(GPIO, clock=clock, setup=setup, **door.pins),
+             hold_ms=door.hold_ms,
+             max_hold_ms=door.max_hold_ms)
+        for door in read_doors(config, hold_ms, max_hold_ms)
+    ]
+
+
+class Doors():
+    """
+    Routes requests to the daemon (`UnlockWorker` or `AsyncDaemon`) of each
+    door by the door's name. Each door has its own queue and is unlocked
+    independently of the others. Requests that don't name a door go to the
+    first one.
+
+    `daemons` - (name, daemon) pairs
+    `access` - `AccessList` the requests are checked against before they're
+    queued, the ones it denies are finished with the `DENIED` status.
+    `None` lets every request through
+    """
+
+    def __init__(self, daemons, access=None):
+        self.daemons = OrderedDict(daemons)
+        self.access = access
+        if not self.daemons:
+            raise ValueError('There has to be at least one door')
+        self.default = next(iter(self.daemons))
+        self.clock = self.daemons[self.default].clock
+
+    def get(self, door=None):
+        """
+        Returns the daemon of `door`, the default door's if it's `None`.
+        Raises a `ValueError` if there is no such door.
+        """
+        if door is None:
+            door = self.default
+        try:
+            return self.daemons[door]
+        except KeyError:
+            raise ValueError('Unknown door: {}'.format(door))
+
+    def submit(self, request):
+        daemon = self.get(request.door)
+        if self.access is not None and not self.access.check(
+                request.credential, request.door or self.default):
+            logger.warning('access denied', extra={
+                'request_id': request.request_id,
+                'source': request.source,
+                'door': request.door or self.default,
+            })
+            request.finish(DENIED)
+            return False
+        return daemon.submit(request)
+
+    def stats(self, door=None):
+        stats = self.get(door).stats()
+        if self.access is not None:
+            stats['access'] = self.access.stats()
+        return stats
+
+    def latency(self, door=None):
+        return self.get(door).latency.dump()
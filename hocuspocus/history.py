@@ -0,0 +1,235 @@
+import os
+import sys
+import mmap
+import time
+import zlib
+import struct
+import argparse
+
+from collections import namedtuple
+from datetime import datetime
+
+
+MAGIC = b'HPERRLOG'
+VERSION = 1
+
+# magic, version, number of records
+HEADER = struct.Struct('<8sII')
+# sequence (0 is an empty slot), unix time, duration in milliseconds, relay
+# and test codes, then a crc32 of all of it, so a torn write is ignored
+RECORD = struct.Struct('<QdfBBxxI')
+CHECKED = RECORD.size - 4
+
+ErrorRecord = namedtuple('ErrorRecord',
+                         'sequence timestamp duration_ms relay test')
+
+
+def pack_record(sequence, timestamp, duration_ms, relay, test):
+    data = RECORD.pack(sequence, timestamp, duration_ms, relay, test, 0)
+    return data[:CHECKED] + struct.pack('<I', zlib.crc32(data[:CHECKED]))
+
+
+def iter_records(buffer, capacity):
+    """
+    Returns the valid `ErrorRecord`s in a ring buffer, oldest first.
+    """
+    records = []
+    view = memoryview(buffer)[HEADER.size:HEADER.size +
+                              capacity * RECORD.size]
+    for offset in range(0, len(view), RECORD.size):
+        data = view[offset:offset + RECORD.size]
+        sequence, timestamp, duration_ms, relay, test, crc = (
+            RECORD.unpack(data))
+        if sequence and zlib.crc32(data[:CHECKED]) == crc:
+            records.append(ErrorRecord(sequence, timestamp, duration_ms,
+                                       relay, test))
+    view.release()
+    records.sort()
+    return records
+
+
+class ErrorHistory():
+    """
+    Keeps the last `capacity` `RelayError`s as fixed size binary records in
+    a preallocated, memory mapped ring file at `path`, so the history can
+    cover months without the file growing.
+
+    A record is written in place, then flushed to disk. Every record carries
+    its own sequence number and checksum and the header is only written when
+    the file is created (see `create_history`), so a crash mid-append can
+    only lose the record being written. An existing file keeps the capacity
+    it was created with.
+    """
+
+    def __init__(self, path, capacity=65536, now=time.time):
+        self.path = path
+        self.now = now
+
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            fd = create_history(path, capacity)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            # left without a header by a crash of a version that wrote it
+            # in place
+            if len(header) < HEADER.size or not any(header):
+                os.close(fd)
+                fd = create_history(path, capacity)
+            else:
+                capacity = check_header(header, path)
+            self._map = mmap.mmap(fd, HEADER.size + capacity * RECORD.size)
+        finally:
+            os.close(fd)
+
+        self.capacity = capacity
+        records = iter_records(self._map, capacity)
+        self._next = records[-1].sequence + 1 if records else 1
+
+    def append(self, relay_error, duration_ms=0.0, timestamp=None):
+        sequence = self._next
+        self._next += 1
+
+        offset = HEADER.size + (sequence - 1) % self.capacity * RECORD.size
+        self._map[offset:offset + RECORD.size] = pack_record(
+            sequence,
+            self.now() if timestamp is None else timestamp,
+            duration_ms,
+            relay_error.codes.relay,
+            relay_error.codes.test
+        )
+
+        page = offset - offset % mmap.PAGESIZE
+        self._map.flush(page, offset + RECORD.size - page)
+        return sequence
+
+    def record(self, request):
+        """
+        Appends the `RelayError` of a failed `UnlockRequest`, timed from the
+        request being received until it finished.
+        """
+        if request.relay_error is None:
+            return
+
+        phases = dict(request.phases)
+        duration_ms = (phases.get('done', phases['received']) -
+                       phases['received']) * 1000
+        self.append(request.relay_error, duration_ms)
+
+    def records(self):
+        return iter_records(self._map, self.capacity)
+
+    def close(self):
+        self._map.close()
+
+
+def create_history(path, capacity):
+    """
+    Creates an empty history file of `capacity` records at `path` and
+    returns a descriptor of it. It's written under another name and moved
+    over `path` once it's whole, a crash never leaves a file without its
+    header behind.
+    """
+    created = '{}.{}'.format(path, os.getpid())
+    fd = os.open(created, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.pwrite(fd, HEADER.pack(MAGIC, VERSION, capacity), 0)
+        os.ftruncate(fd, HEADER.size + capacity * RECORD.size)
+        os.fsync(fd)
+        os.rename(created, path)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+def check_header(header, path):
+    magic, version, capacity = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not an error history file'.format(path))
+    return capacity
+
+
+def read_history(path):
+    """
+    Returns the records in the history file at `path`, oldest first,
+    without opening it for writing.
+    """
+    with open(path, 'rb') as f:
+        capacity = check_header(f.read(HEADER.size), path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return iter_records(buffer, capacity)
+
+
+def query(records, since=None, until=None, relay=None, test=None):
+    """
+    Filters records by unix time (`since` <= timestamp < `until`), relay and
+    test code.
+    """
+    for record in records:
+        if since is not None and record.timestamp < since:
+            continue
+        if until is not None and record.timestamp >= until:
+            continue
+        if relay is not None and record.relay != relay:
+            continue
+        if test is not None and record.test != test:
+            continue
+        yield record
+
+
+def parse_time(value):
+    """
+    Parses a unix timestamp or a local `YYYY-MM-DD[THH:MM[:SS]]` time.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    for time_format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(
+                datetime.strptime(value, time_format).timetuple())
+        except ValueError:
+            pass
+
+    raise argparse.ArgumentTypeError('Invalid time: {}'.format(value))
+
+
+def format_record(record):
+    return '{time} code="{relay} {test}" relay={relay} test={test} ' \
+        'duration_ms={duration:.1f}'.format(
+            time=datetime.fromtimestamp(record.timestamp).isoformat(),
+            relay=record.relay,
+            test=record.test,
+            duration=record.duration_ms)
+
+
+def main(argv=None):
+    """
+    `hocuspocus-errors` command, lists the relay errors in a history file.
+    """
+    parser = argparse.ArgumentParser(
+        description='Lists the relay errors recorded by the door controller')
+    parser.add_argument('history_file')
+    parser.add_argument('--since', type=parse_time,
+                        help='unix time or YYYY-MM-DD[THH:MM[:SS]]')
+    parser.add_argument('--until', type=parse_time,
+                        help='unix time or YYYY-MM-DD[THH:MM[:SS]]')
+    parser.add_argument('--relay', type=int, choices=(1, 2, 3))
+    parser.add_argument('--test', type=int, choices=(1, 2, 3))
+    args = parser.parse_args(argv)
+
+    try:
+        records = read_history(args.history_file)
+    except (OSError, ValueError) as e:
+        parser.exit(1, '{}\n'.format(e))
+
+    for record in query(records, args.since, args.until, args.relay,
+                        args.test):
+        sys.stdout.write(format_record(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
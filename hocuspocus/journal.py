@@ -0,0 +1,91 @@
+import os
+import zlib
+import struct
+
+
+IDLE = 'idle'
+# a record that was torn or can't be read, the cycle may not have ended
+UNKNOWN = 'unknown'
+
+# phase name, then a crc32 of it, so a torn write is noticed
+RECORD = struct.Struct('<16sI')
+
+# phases that are on disk before the door acts on them, the others are
+# only written, see `UnlockJournal`
+DURABLE = ('engage',)
+
+
+def default_journal_path(pid_path):
+    """
+    Returns the path of the unlock journal that lives next to the pid file.
+    """
+    return os.path.splitext(pid_path)[0] + '.journal'
+
+
+def pack_record(phase):
+    data = phase.encode('ascii').ljust(RECORD.size - 4, b'\0')
+    return RECORD.pack(data, zlib.crc32(data))
+
+
+def unpack_record(data):
+    """
+    Returns the phase of a journal record, `None` if the file was empty.
+    """
+    if not data:
+        return None
+    if len(data) < RECORD.size:
+        return UNKNOWN
+
+    phase, crc = RECORD.unpack(data)
+    if zlib.crc32(phase) != crc:
+        return UNKNOWN
+    return phase.rstrip(b'\0').decode('ascii')
+
+
+class UnlockJournal():
+    """
+    Write-ahead journal of the phase of the unlock cycle in progress, one
+    fixed size record at the start of the file at `path` that is rewritten
+    in place as each phase starts and once the cycle has ended (`idle`).
+
+    Only the `engage` record is synced to disk before the relays are
+    engaged, it's the one that matters: a cycle cut short before it didn't
+    engage them. A later phase that didn't reach the disk, or a torn record,
+    still leaves a cycle that didn't end, see `pending`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def pending(self):
+        """
+        Returns the phase the last unlock cycle was left in if it didn't end
+        (the daemon was killed or lost power mid-unlock), otherwise `None`.
+        """
+        phase = unpack_record(os.pread(self._fd, RECORD.size, 0))
+        return None if phase in (None, IDLE) else phase
+
+    def write(self, phase):
+        os.pwrite(self._fd, pack_record(phase), 0)
+        if phase in DURABLE:
+            os.fdatasync(self._fd)
+
+    def on_phase(self, on_phase):
+        """
+        Returns an `unlock_door` `on_phase` callback that journals the phase
+        before calling `on_phase`.
+        """
+        def journaled(phase):
+            self.write(phase)
+            on_phase(phase)
+        return journaled
+
+    def idle(self):
+        """
+        Records the end of the unlock cycle.
+        """
+        self.write(IDLE)
+
+    def close(self):
+        os.close(self._fd)
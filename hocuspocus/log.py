@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+)
+
+
+JSON = 'json'
+LOGFMT = 'logfmt'
+FORMATS = (JSON, LOGFMT)
+
+# errors are also written to the error file, see `setup_logging`
+ERRORS = 'hocuspocus.errors'
+
+# attributes every `LogRecord` has, anything else was given with `extra`
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord(
+    '', logging.INFO, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats each record as a single JSON object or logfmt line with the
+    time, level, logger and message, plus every field given with `extra`:
+
+        logger.info('unlocking door', extra={'request_id': 'badge-1'})
+    """
+
+    def __init__(self, style=JSON):
+        if style not in FORMATS:
+            raise ValueError('Unknown log format: {}'.format(style))
+        super(StructuredFormatter, self).__init__()
+        self.style = style
+
+    def fields(self, record):
+        fields = [
+            ('time', round(record.created, 6)),
+            ('level', record.levelname.lower()),
+            ('logger', record.name),
+            ('message', record.getMessage()),
+        ]
+        fields.extend(sorted(
+            (key, value) for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES
+        ))
+        if record.exc_info:
+            fields.append(('exception',
+                           self.formatException(record.exc_info)))
+        return fields
+
+    def format(self, record):
+        fields = self.fields(record)
+        if self.style == JSON:
+            return json.dumps(dict(fields), default=str)
+        return ' '.join(
+            '{}={}'.format(key, logfmt_value(value)) for key, value in fields)
+
+
+def logfmt_value(value):
+    if value is None:
+        return ''
+    value = str(value)
+    if not value or any(c in value for c in ' ="\n\\'):
+        return json.dumps(value)
+    return value
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded queue without ever blocking, records that
+    don't fit are counted in `dropped` instead of stalling the unlock.
+    """
+
+    def __init__(self, records):
+        super(DroppingQueueHandler, self).__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SyncingFileHandler(RotatingFileHandler):
+    """
+    `RotatingFileHandler` that fsyncs the file every `fsync_every` records
+    or `fsync_interval` seconds, whichever comes first, instead of leaving
+    it to the kernel. 0 disables either.
+    """
+
+    def __init__(self, filename, max_bytes=1048576, backup_count=5,
+                 fsync_every=16, fsync_interval=5):
+        super(SyncingFileHandler, self).__init__(
+            filename, maxBytes=max_bytes, backupCount=backup_count,
+            encoding='utf-8')
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def emit(self, record):
+        super(SyncingFileHandler, self).emit(record)
+        self.unsynced += 1
+
+        now = time.monotonic()
+        if ((self.fsync_every and self.unsynced >= self.fsync_every) or
+                (self.fsync_interval and
+                 now - self.synced_at >= self.fsync_interval)):
+            self.sync()
+
+    def sync(self):
+        if self.stream is not None:
+            self.stream.flush()
+            os.fsync(self.stream.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.stream is not None and self.unsynced:
+                self.sync()
+        finally:
+            self.release()
+        super(SyncingFileHandler, self).close()
+
+
+class LogListener(QueueListener):
+    """
+    `QueueListener` that can be stopped more than once (ie. by the exit
+    handler and at exit).
+    """
+
+    def stop(self):
+        if self._thread is not None:
+            super(LogListener, self).stop()
+
+
+def setup_logging(path=None, error_path=None, style=JSON, level='INFO',
+                  queue_size=1024, **file_options):
+    """
+    Sends the daemon's logs through a bounded queue to a background writer
+    thread, so logging never blocks an unlock on flash I/O.
+
+    `path` - log file, rotated by size, stdout (for supervisord) if `None`
+    `error_path` - file the `ERRORS` logger (relay errors) is also written to
+    `style` - 'json' (JSON lines) or 'logfmt'
+    `file_options` - `SyncingFileHandler` rotation and fsync options
+
+    Returns the `LogListener`, it's stopped (flushing the queue) at exit.
+    """
+    formatter = StructuredFormatter(style)
+
+    handlers = []
+    if path is None:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    else:
+        handlers.append(SyncingFileHandler(path, **file_options))
+
+    if error_path is not None:
+        error_handler = SyncingFileHandler(error_path, **file_options)
+        error_handler.addFilter(logging.Filter(ERRORS))
+        handlers.append(error_handler)
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.Queue(queue_size)
+    # the level is checked by the logger, the handlers don't set one
+    # (`respect_handler_level` needs Python 3.5)
+    listener = LogListener(records, *handlers)
+
+    logger = logging.getLogger('hocuspocus')
+    logger.setLevel(level.upper())
+    logger.handlers = [DroppingQueueHandler(records)]
+    logger.propagate = False
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,18 +1,52 @@
 import os
 import sys
-import time
+import fcntl
 import signal
+import logging
 import threading
 
 from collections import namedtuple
 from itertools import cycle
 from functools import partial
 
+from hocuspocus.clock import MONOTONIC
+from hocuspocus.doors import DEFAULT_DOOR, Door, Doors
+from hocuspocus.log import ERRORS, JSON, setup_logging
+from hocuspocus.startup import StartupTimer
+from hocuspocus.worker import (
+    COALESCE,
+    DROPPED,
+    FAILED,
+    UNLOCKED,
+    Admission,
+    RequestQueue,
+    UnlockRequest,
+    UnlockWorker,
+)
+
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger(ERRORS)
+
+THREADED = 'threaded'
+ASYNCIO = 'asyncio'
+MODES = (THREADED, ASYNCIO)
 
 Codes = namedtuple('Codes', 'relay test')
 
+# handled by the main thread, see `main`
+SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2,
+           signal.SIGHUP)
+
 
 class RelayError():
+    """
+    Outcome of a relay check, `code` is '<relay> <test>'. Immutable, the
+    outcomes `check_relays` can return are created once, see
+    `relay_error_for`.
+    """
+
+    __slots__ = ('code', 'codes', 'message')
 
     failed_relay = {
         '1': 'first',
@@ -21,19 +55,42 @@ class RelayError():
     }
 
     def __init__(self, code):
-        self.code = code
-        self.codes = Codes(*map(int, code.split()))
-        if self.codes.relay == 0:
-            self.message = "Relays are in expected states."
+        codes = Codes(*map(int, code.split()))
+        if codes.relay == 0:
+            message = "Relays are in expected states."
         else:
-            self._message_template = (
+            message = (
                 "Relay Failure on test number [{test}]: "
                 "Relays in wrong state: [{code}]"
+            ).format(
+                test=codes.test,
+                code=self.failed_relay[str(codes.relay)]
             )
-            self.message = self._message_template.format(
-                test=self.codes.test,
-                code=self.failed_relay[str(self.codes.relay)]
-            )
+
+        object.__setattr__(self, 'code', code)
+        object.__setattr__(self, 'codes', codes)
+        object.__setattr__(self, 'message', message)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('RelayError is immutable')
+
+    def __repr__(self):
+        return 'RelayError({!r})'.format(self.code)
+
+
+# every (relay, test) outcome of `check_relays`
+RELAY_ERRORS = dict(
+    ((relay, test), RelayError('{} {}'.format(relay, test)))
+    for relay in range(4)
+    for test in range(1, 4)
+)
+
+
+def relay_error_for(relay, test):
+    """
+    Returns the interned `RelayError` of a relay check.
+    """
+    return RELAY_ERRORS[relay, test]
 
 
 def pid_file_exists(path):
@@ -43,15 +100,55 @@ def pid_file_exists(path):
     return os.path.isfile(path)
 
 
-def log_error(path, relay_error):
+def log_error(relay_error, **fields):
+    """
+    Logs the given RelayError instance, along with any extra `fields`, to
+    the error logger (which is written to the error file as well as the
+    log, see `setup_logging`).
+    """
+    fields.update(code=relay_error.code,
+                  relay=relay_error.codes.relay,
+                  test=relay_error.codes.test)
+    error_logger.error(relay_error.message, extra=fields)
+
+
+def read_relays(door_controller, first, second):
+    """
+    Samples both relays once and returns the relay part of an error code.
+    0 if both relays are in the expected state, 1 if the first isn't, 2 if
+    the second isn't and 3 if neither of them are.
+    """
+    relay = 0
+
+    if not door_controller.test_relay_state(door_controller.relay_1.read,
+                                            first):
+        relay += 1
+
+    if not door_controller.test_relay_state(door_controller.relay_2.read,
+                                            second):
+        relay += 2
+
+    return relay
+
+
+def wait_for_relays(door_controller, first, second, samples, poll_ms,
+                    timeout_ms):
     """
-    Logs the given RelayError instance in the pid file
-    TODO: log to a another file
-    TODO: handle case where pid doesn't exist
+    Polls the relays every `poll_ms` milliseconds until both of them have
+    been read in the expected state `samples` times in a row. Gives up once
+    `timeout_ms` milliseconds have passed and returns the relay part of the
+    error code from the last read.
     """
-    with open(path, 'wb') as pid:
-        pid.write(bytearray("{}\n".format(relay_error.code), 'utf-8'))
-        pid.write(bytearray(relay_error.message, 'utf-8'))
+    clock = door_controller.clock
+    deadline = clock.now() + timeout_ms/1000
+    settled = 0
+
+    while True:
+        relay = read_relays(door_controller, first, second)
+        settled = settled + 1 if relay == 0 else 0
+        if settled >= samples or clock.now() >= deadline:
+            return relay
+        clock.sleep(poll_ms/1000)
 
 
 def check_relays(door_controller, test, **kwargs):
@@ -60,71 +157,190 @@ def check_relays(door_controller, test, **kwargs):
     door controller. Returns an ErrorCode instance if one or more of the
     expected states aren't correct. If the states match what is expected than
     an ErrorCode object with the codes of '0 0' will be returned.
+
+    By default the relays are read once after waiting `ms` milliseconds.
+    If `samples` is given the relays are polled every `poll_ms` instead and
+    the check returns as soon as both relays have settled for `samples`
+    reads in a row, failing only once `timeout_ms` has expired.
     """
 
+    first = kwargs.get('first', door_controller.high)
+    second = kwargs.get('second', door_controller.high)
+
+    samples = kwargs.get('samples', 0)
+    if samples > 0:
+        relay = wait_for_relays(door_controller, first, second, samples,
+                                kwargs.get('poll_ms', 5),
+                                kwargs.get('timeout_ms', 1000))
+        return relay_error_for(relay, test)
+
     # wait 200 milliseconds because the relays have a slight delay
     ms = kwargs.get('ms', 1000)
     if ms > 0:
-        time.sleep(ms/1000)
+        door_controller.clock.sleep(ms/1000)
 
-    first = kwargs.get('first', door_controller.high)
-    second = kwargs.get('second', door_controller.high)
+    relay = read_relays(door_controller, first, second)
 
-    relay_one = door_controller.relay_1.read
-    relay_two = door_controller.relay_2.read
+    return relay_error_for(relay, test)
 
-    relay = 0
 
-    if not door_controller.test_relay_state(relay_one, first):
-        relay += 1
+def ignore_phase(phase):
+    pass
 
-    if not door_controller.test_relay_state(relay_two, second):
-        relay += 2
 
-    return RelayError("{relay} {test}".format(test=test, relay=relay))
+def read_pid_file(path):
+    """
+    Returns the pid in the pid file at `path`, `None` if there isn't one.
+    """
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def locked(fd):
+    """
+    Returns True if the pid file open as `fd` is locked by a running daemon,
+    see `create_pid_file`.
+    """
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    return False
+
+
+def running_daemon(path):
+    """
+    Returns the pid of the daemon running with the pid file at `path` and a
+    descriptor of its pid file to wait for it to exit with (see
+    `take_over`). `(None, None)` if there isn't one: the pid file doesn't
+    exist or was left behind by a daemon that was killed or lost power. A
+    running daemon holds a lock on its pid file that goes away with the
+    process.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None, None
+
+    if not locked(fd):
+        os.close(fd)
+        return None, None
+    return int(os.pread(fd, 32, 0)), fd
 
 
 def create_pid_file(path):
-    with open(path, 'w+') as f:
-        f.write(str(os.getpid()))
+    """
+    Writes the pid file and locks it for as long as the daemon runs, see
+    `running_daemon`. Returns the file descriptor holding the lock.
+    """
+    # locked and written before it's moved over the pid file, the daemon
+    # being handed off from (see `take_over`) never sees it half written
+    written = '{}.{}'.format(path, os.getpid())
+    fd = os.open(written, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    os.write(fd, str(os.getpid()).encode('ascii'))
+    os.rename(written, path)
+    return fd
 
 
 def remove_pid_file(path):
-    if os.path.exists(path):
+    # the daemon the doors were handed off to has written its own
+    if read_pid_file(path) == os.getpid():
         os.remove(path)
 
 
-def unlock_door(door_controller, ms=5000):
+def take_over(pid, pid_fd, timeout=60, clock=MONOTONIC):
+    """
+    Asks the daemon `pid` to hand its doors off (SIGUSR2, see `hand_off`)
+    and waits for it to exit, it serves the requests it has queued first.
+    It has exited once the lock on its pid file, open as `pid_fd`, is
+    released. It's killed if it hasn't exited after `timeout` seconds, in
+    which case False is returned.
+    """
+    logger.info('taking over', extra={'pid': pid})
+    try:
+        os.kill(pid, signal.SIGUSR2)
+        deadline = clock.now() + timeout
+        while locked(pid_fd):
+            if clock.now() >= deadline:
+                logger.error('daemon did not hand off', extra={'pid': pid})
+                os.kill(pid, signal.SIGKILL)
+                fcntl.flock(pid_fd, fcntl.LOCK_SH)
+                return False
+            clock.sleep(0.05)
+    except ProcessLookupError:
+        pass
+    finally:
+        os.close(pid_fd)
+
+    return True
+
+
+def unlock_door(door_controller, ms=5000, hold=None, on_phase=None,
+                check_kwargs=None, pre_checked=False):
     """
     Unlocks the door. If there is an issue with one of the relays it'll
     return a `RelayError` with information about the failure. Otherwise
     it'l return `None`.
+
+    If a `HoldWindow` is given as `hold` the door is held unlocked until it
+    closes, otherwise for `ms` milliseconds.
+
+    `on_phase` is called with the name of each phase of the unlock as it
+    starts: pre_check, engage, verify, hold, release and post_check.
+
+    `check_kwargs` are passed along to every `check_relays` call.
+
+    `pre_checked` skips the pre-check, the relays are already known to be
+    released (see `RelayMonitor.claim`).
     """
-    relay_error = check_relays(door_controller, 1,
-                               first=door_controller.low,
-                               second=door_controller.low)
+    on_phase = on_phase or ignore_phase
+    check_kwargs = check_kwargs or {}
 
-    if relay_error.codes.relay > 0:
-        door_controller.relays(activate=False)
-        return relay_error
+    if not pre_checked:
+        on_phase('pre_check')
+        relay_error = check_relays(door_controller, 1,
+                                   first=door_controller.low,
+                                   second=door_controller.low,
+                                   **check_kwargs)
+
+        if relay_error.codes.relay > 0:
+            door_controller.relays(activate=False)
+            return relay_error
 
+    on_phase('engage')
     door_controller.relays(activate=True)
 
+    on_phase('verify')
     relay_error = check_relays(door_controller, 2,
                                first=door_controller.high,
-                               second=door_controller.high)
+                               second=door_controller.high,
+                               **check_kwargs)
 
     if relay_error.codes.relay > 0:
         door_controller.relays(activate=False)
         return relay_error
 
-    door_controller.activate_pin(door_controller.green_pin, ms=5000)
+    on_phase('hold')
+    if hold is None:
+        door_controller.activate_pin(door_controller.green_pin, ms=ms)
+    else:
+        door_controller.turn_on_led(door_controller.green_pin)
+        hold.wait()
+        door_controller.turn_off_led(door_controller.green_pin)
 
+    on_phase('release')
     door_controller.relays(activate=False)
 
+    on_phase('post_check')
     relay_error = check_relays(door_controller, 3,
                                first=door_controller.low,
-                               second=door_controller.low)
+                               second=door_controller.low,
+                               **check_kwargs)
 
     if relay_error.codes.relay > 0:
         door_controller.relays(activate=False)
@@ -133,6 +349,24 @@ def unlock_door(door_controller, ms=5000):
     return None
 
 
+def error_code_flashes(relay_error):
+    """
+    Yields the `activate_pin` keyword arguments of every flash needed to
+    display the error code of `relay_error` once.
+    """
+    yield {'ms': 2000, 'suffix_ms': 2000}
+
+    for _ in range(0, relay_error.codes.relay - 1):
+        yield {'ms': 1000}
+    else:
+        yield {'ms': 1000, 'suffix_ms': 2000}
+
+    for _ in range(0, relay_error.codes.test - 1):
+        yield {'ms': 1000}
+    else:
+        yield {'ms': 1000, 'suffix_ms': 2000}
+
+
 def display_error_code(relay_error, door_controller, **kwargs):
     """
     Displays the error code given by the `relay_error` object by flashing
@@ -172,86 +406,591 @@ def display_error_code(relay_error, door_controller, **kwargs):
     loop = kwargs.get('loop', cycle((True,)))
 
     while next(loop):
-        door_controller.activate_pin(
-            door_controller.red_pin, ms=2000, suffix_ms=2000)
+        for flash in error_code_flashes(relay_error):
+            door_controller.activate_pin(door_controller.red_pin, **flash)
 
-        for _ in range(0, relay_error.codes.relay - 1):
-            door_controller.activate_pin(
-                door_controller.red_pin, ms=1000)
-        else:
-            door_controller.activate_pin(
-                door_controller.red_pin, ms=1000, suffix_ms=2000)
 
-        for _ in range(0, relay_error.codes.test - 1):
-            door_controller.activate_pin(
-                door_controller.red_pin, ms=1000)
-        else:
-            door_controller.activate_pin(
-                door_controller.red_pin, ms=1000, suffix_ms=2000)
+def error_code_steps(relay_error):
+    """
+    Returns the (seconds, on) steps that switch the red led to display the
+    error code of `relay_error` once, like `display_error_code`, and the
+    seconds it takes.
+    """
+    steps = []
+    offset = 0
+    for flash in error_code_flashes(relay_error):
+        steps.append((offset, True))
+        offset += max(flash.get('ms', 500), 500)/1000
+        steps.append((offset, False))
+        offset += flash.get('suffix_ms', 0)/1000
+    return steps, offset
 
 
-class DoorThread(threading.Thread):
+class ErrorDisplay():
+    """
+    Flashes `RelayError` codes like `display_error_code` as a `Timeline` on
+    the door's clock (the shared timer wheel, see `hocuspocus.timers`), so
+    the worker is free to serve the next unlock request, which cancels the
+    display mid-flash, and no thread waits on the led.
+
+    `repeats` - number of times each error code is shown before the display
+    stops on its own, 0 shows it until it's cancelled
+    """
 
-    def __init__(self, lock, door_controller, error_path):
-        super(DoorThread, self).__init__()
+    def __init__(self, door_controller, repeats=0):
         self.door_controller = door_controller
-        self.error_path = error_path
-        self.lock = lock
+        self.repeats = repeats
+        self._timeline = None
+        self._lock = threading.Lock()
+
+    def show(self, relay_error):
+        """
+        Cancels the error code being displayed, if any, and displays
+        `relay_error`.
+        """
+        from hocuspocus.timers import Timeline
+
+        door_controller = self.door_controller
+        red_pin = door_controller.red_pin
+        steps, duration = error_code_steps(relay_error)
+        steps = [
+            (offset, partial(door_controller.turn_on_led if on else
+                             door_controller.turn_off_led, red_pin))
+            for offset, on in steps
+        ]
+        with self._lock:
+            self.cancel()
+            self._timeline = Timeline(
+                door_controller.clock, steps, duration, self.repeats,
+                on_done=partial(door_controller.turn_on_led, red_pin))
+            self._timeline.start()
+
+    def cancel(self):
+        """
+        Stops the error code being displayed, the flash in progress is cut
+        short and the red led is turned back on before it returns.
+        """
+        timeline = self._timeline
+        if timeline is not None:
+            timeline.cancel()
+
+
+def journaled_phases(door_controller, mark):
+    """
+    Returns the `unlock_door` `on_phase` callback of a request that calls
+    `mark`, after publishing the phase to the door's `StatusBoard` and
+    journaling it to its `UnlockJournal` first, if it has them.
+    """
+    on_phase = mark
+    if door_controller.status is not None:
+        on_phase = door_controller.status.on_phase(on_phase)
+    if door_controller.journal is not None:
+        on_phase = door_controller.journal.on_phase(on_phase)
+    return on_phase
 
-    def run(self):
 
-        print('running')
-        available = self.lock.acquire(blocking=False)
-        if not available:
-            print('resource locked')
-            return
+def recover_unlock(door_controller, check_kwargs=None):
+    """
+    Locks the door if its `UnlockJournal` has an unlock cycle that didn't
+    end (the daemon was killed or lost power mid-unlock): the green led is
+    turned off, the relays are released and checked like at the end of an
+    unlock. Returns the `RelayError` if the relays didn't release, `None`
+    otherwise.
+    """
+    journal = door_controller.journal
+    phase = journal.pending() if journal is not None else None
+    if phase is None:
+        return None
 
-        print('unlocking door')
-        relay_error = unlock_door(self.door_controller)
+    logger.warning('recovering unlock', extra={'phase': phase})
+    door_controller.turn_off_led(door_controller.green_pin)
+    door_controller.relays(activate=False)
+    relay_error = check_relays(door_controller, 3,
+                               first=door_controller.low,
+                               second=door_controller.low,
+                               **(check_kwargs or {}))
+    journal.idle()
 
-        if relay_error:
-            log_error(self.error_path, relay_error)
-            display_error_code(
-                relay_error,
-                self.door_controller
-            )
+    if relay_error.codes.relay > 0:
+        log_error(relay_error, recovered_phase=phase)
+        return relay_error
+    return None
+
+
+def process_request(door_controller, check_kwargs, error_display, request,
+                    hold=None, monitor=None):
+    """
+    Serves a single `UnlockRequest` and finishes it with the outcome. Any
+    error code still being displayed is cancelled. If the door fails to
+    unlock the error is logged and displayed.
+
+    If a `RelayMonitor` is given it's claimed for the unlock, which skips
+    the pre-check when the monitor has just seen the relays released.
 
-        self.lock.release()
+    The phases are journaled if the door has an `UnlockJournal`, the cycle
+    is only journaled as ended if the unlock returned.
+    """
+    error_display.cancel()
+
+    logger.info('unlocking door', extra={'request_id': request.request_id,
+                                         'source': request.source})
+    on_phase = journaled_phases(door_controller, request.mark)
+
+    pre_checked = monitor is not None and monitor.claim()
+    try:
+        relay_error = unlock_door(door_controller,
+                                  ms=request.hold_ms,
+                                  hold=hold,
+                                  on_phase=on_phase,
+                                  check_kwargs=check_kwargs,
+                                  pre_checked=pre_checked)
+    finally:
+        if monitor is not None:
+            monitor.release()
+
+    if door_controller.journal is not None:
+        door_controller.journal.idle()
+
+    if relay_error:
+        log_error(relay_error, request_id=request.request_id)
+        request.finish(FAILED, relay_error)
+        error_display.show(relay_error)
+    else:
+        request.finish(UNLOCKED)
 
 
 # has accuess to the signal number and frame
-def handle_usr1(lock, door_controller, error_path, *args):
-    print('Handling USR1')
-    door_thread = DoorThread(lock, door_controller, error_path)
-    door_thread.start()
+def handle_usr1(doors, *args):
+    logger.info('handling USR1')
+    request = UnlockRequest('signal', clock=doors.clock)
+    if not doors.submit(request) and request.status == DROPPED:
+        logger.warning('request dropped', extra=doors.get().queue.stats())
+
+
+def handle_hup(reloader, *args):
+    logger.info('handling HUP')
+    reloader.reload()
+
+
+def hand_off(doors, exit_callback, *args, control_server=None):
+    """
+    Hands the doors off to the daemon taking over (see `take_over`). The
+    control socket stops accepting connections, every door serves the
+    requests it has queued and the daemon exits.
+    """
+    logger.info('handing off')
+    if control_server is not None:
+        control_server.shutdown()
+    for daemon in doors.daemons.values():
+        daemon.stop()
+    exit_callback()
 
 
-def exit_gracefully(pid_path, door_controller, *args):
+def exit_gracefully(pid_path, door_controller, *args, cleanup=()):
+    """
+    Removes the pid file, turns off the leds and relays and exits. Each
+    callable in `cleanup` is called first.
+    """
+    for callback in cleanup:
+        callback()
     remove_pid_file(pid_path)
     door_controller.clean_up()
     sys.exit(1)
 
 
-def main(pid_path, error_path, door_controller):
+def start_metrics(daemon, path, interval, cleanup):
+    """
+    Starts writing the metrics of `daemon` to `path`, if it's given, and
+    adds writing them one last time to `cleanup`.
+    """
+    if path is None:
+        return
 
-    exit_callback = partial(exit_gracefully, pid_path, door_controller)
-    # check SIGINT (ctrl-c)
-    signal.signal(signal.SIGINT, exit_callback)
-    signal.signal(signal.SIGTERM, exit_callback)
+    from hocuspocus.metrics import TextfileExporter, format_textfile
 
-    if os.path.exists(pid_path):
-        sys.exit('PID file already exists! ({})'.format(pid_path))
+    exporter = TextfileExporter(path, partial(format_textfile, daemon),
+                                interval, daemon.clock)
+    exporter.start()
+    cleanup.append(exporter.stop)
 
-    door_controller.turn_on_led(door_controller.red_pin)
 
-    lock = threading.Lock()
+def open_history(daemon, path, records, cleanup):
+    """
+    Records the relay errors of `daemon` in the error history at `path`, if
+    it's given.
+    """
+    if path is None:
+        return
 
-    create_pid_file(pid_path)
+    from hocuspocus.history import ErrorHistory
 
-    signal.signal(signal.SIGUSR1,
-                  partial(handle_usr1, lock, door_controller, error_path))
+    history = ErrorHistory(path, records)
+    daemon.recorders.append(history)
+    cleanup.append(history.close)
 
-    print('starting while')
+
+def open_status(door_controller, path):
+    """
+    Publishes the status of the door to a `StatusBoard` at `path`, if it's
+    given. Returns the board.
+    """
+    if path is None:
+        return None
+
+    from hocuspocus.status import StatusBoard
+
+    door_controller.status = StatusBoard(path)
+    return door_controller.status
+
+
+def open_journal(door_controller, path, cleanup):
+    """
+    Journals the unlock phases of the door to an `UnlockJournal` at `path`,
+    if it's given.
+    """
+    if path is None:
+        return
+
+    from hocuspocus.journal import UnlockJournal
+
+    door_controller.journal = UnlockJournal(path)
+    cleanup.append(door_controller.journal.close)
+
+
+def open_access_list(options, cleanup):
+    """
+    Returns an `AccessList` with `options`, if they're given, reloaded
+    every `interval` seconds by an `AccessWatcher`.
+    """
+    if options is None:
+        return None
+
+    from hocuspocus.access import AccessList, AccessWatcher
+
+    options = dict(options)
+    interval = options.pop('interval', 5)
+    try:
+        access = AccessList(**options)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    watcher = AccessWatcher(access, interval)
+    watcher.start()
+    cleanup.append(watcher.stop)
+    return access
+
+
+def schedule_doors(doors, schedules, cleanup):
+    """
+    Returns a `ScheduleEngine` that holds the `doors` unlocked for their
+    `schedules` (by door name), if there are any.
+    """
+    if not schedules:
+        return None
+
+    from hocuspocus.schedule import ScheduledDoor, ScheduleEngine
+
+    names = [door.name for door in doors]
+    for name in schedules:
+        if name not in names:
+            sys.exit('Unknown door in [schedule]! ({})'.format(name))
+
+    engine = ScheduleEngine([
+        ScheduledDoor(door.name, schedules[door.name], door.daemon)
+        for door in doors if door.name in schedules
+    ], clock=doors[0].door_controller.clock)
+    cleanup.append(engine.stop)
+    return engine
+
+
+def open_monitor(door_controller, options, cleanup, error_display=None):
+    """
+    Returns a `RelayMonitor` with `options`, if they're given, started once
+    the daemon has the doors (the relays may still be engaged by the
+    daemon being handed off from). Faults are logged and shown on
+    `error_display`.
+    """
+    if options is None:
+        return None
+
+    from hocuspocus.monitor import RelayMonitor
+
+    def on_fault(relay_error):
+        RelayMonitor.log_fault(relay_error)
+        if error_display is not None:
+            error_display.show(relay_error)
+
+    monitor = RelayMonitor(door_controller, on_fault=on_fault, **options)
+    cleanup.append(monitor.stop)
+    return monitor
+
+
+def main(pid_path, error_path, door_controller, check_kwargs=None,
+         queue_size=1, overflow=COALESCE, max_hold_ms=0,
+         error_repeats=0, mode=THREADED, hold_ms=5000, control_path=None,
+         metrics_path=None, metrics_interval=15, log_options=None,
+         history_path=None, history_records=65536, monitor_options=None,
+         doors=None, status_path=None, startup=None, reload_path=None,
+         handoff=False, journal_path=None, access_options=None,
+         admission_options=None, schedules=None):
+    """
+    Runs the daemon.
+
+    `check_kwargs` - options used for every `check_relays` call (see the
+    `[relays]` config section)
+
+    `queue_size` & `overflow` - size and overflow policy of the queue of
+    unlock requests waiting for the worker (see `RequestQueue`)
+
+    `hold_ms` - default time the door is held unlocked for
+
+    `max_hold_ms` - if greater than the hold time, requests that arrive while
+    the door is held unlocked extend the hold up to this many milliseconds
+    instead of starting another unlock cycle
+
+    `error_repeats` - number of times an error code is flashed on the red
+    led, 0 flashes it until the next unlock request
+
+    `mode` - 'threaded' serves requests from an `UnlockWorker` thread,
+    'asyncio' serves them from an event loop (see `hocuspocus.aio`)
+
+    `control_path` - path of the unix socket unlock requests are accepted on
+    (see `hocuspocus.control`), `None` only accepts SIGUSR1
+
+    `metrics_path` - node_exporter textfile collector file the metrics are
+    written to every `metrics_interval` seconds, `None` doesn't write them
+
+    `log_options` - `setup_logging` options (see the `[logging]` config
+    section), relay errors are logged to `error_path` as well
+
+    `history_path` - ring file the last `history_records` relay errors are
+    kept in (see `hocuspocus.history`), `None` doesn't keep them
+
+    `monitor_options` - `RelayMonitor` options (see the `[monitor]` config
+    section), `None` doesn't monitor the relays between unlocks
+
+    `doors` - the `Door`s served by the daemon (see `load_doors`), each
+    with its own queue, worker, error display, relay monitor, metrics and
+    error history (the door's name is appended to `history_path` if there
+    is more than one). Defaults to `door_controller` alone, held unlocked
+    for `hold_ms` and `max_hold_ms`. SIGUSR1 unlocks the first door.
+
+    `status_path` - file (under /dev/shm) the status of the door is
+    published to (see `hocuspocus.status`), the door's name is appended if
+    there is more than one. `None` doesn't publish it
+
+    `startup` - `StartupTimer` the startup phases before `main` were timed
+    with, the time to ready (until SIGUSR1 is handled) is logged once the
+    daemon is running
+
+    `reload_path` - config file re-read on SIGHUP (see `Reloader`), `None`
+    ignores SIGHUP
+
+    `handoff` - if the pid file exists, take the doors over from the daemon
+    it names instead of refusing to start (see `take_over`). The new control
+    socket replaces the old one right away and requests are queued until
+    the old daemon has served its own and exited, the pins, status boards,
+    journals and relay monitors are only set up then. SIGUSR2 hands the
+    doors off to the daemon taking over
+
+    `journal_path` - file the phase of the unlock in progress is journaled
+    to (see `hocuspocus.journal`), the door's name is appended if there is
+    more than one. An unlock that didn't end is recovered once the daemon
+    has the doors (see `recover_unlock`). `None` doesn't journal them
+
+    `access_options` - `AccessList` options and the `interval` its file is
+    checked for changes at (see the `[access]` config section), the
+    credentials of unlock requests are checked before they're queued.
+    `None` serves every request
+
+    `admission_options` - `Admission` options of every door (see the
+    `[admission]` config section), `None` admits every request and lets it
+    wait for its cycle as long as it takes
+
+    `schedules` - `Schedule` of the windows each door is held unlocked for,
+    by door name (see `hocuspocus.schedule`)
+    """
+    if mode not in MODES:
+        sys.exit('Unknown mode! ({})'.format(mode))
+
+    startup = startup or StartupTimer()
+
+    doors = doors or [Door(DEFAULT_DOOR, door_controller, hold_ms,
+                           max_hold_ms)]
+
+    cleanup = []
+    for door in doors:
+        if door.door_controller is not door_controller:
+            cleanup.append(door.door_controller.clean_up)
+    exit_callback = partial(exit_gracefully, pid_path, door_controller,
+                            cleanup=cleanup)
+    # check SIGINT (ctrl-c)
+    signal.signal(signal.SIGINT, exit_callback)
+    signal.signal(signal.SIGTERM, exit_callback)
+    # blocked until the daemon is running, the threads started from here
+    # on keep them blocked so they're all delivered to the main thread
+    signal.pthread_sigmask(signal.SIG_BLOCK, SIGNALS)
+
+    # a pid file that isn't locked was left behind and is replaced
+    old_pid, old_pid_fd = running_daemon(pid_path)
+    if old_pid is not None and not handoff:
+        sys.exit('Already running with pid {}! ({})'.format(old_pid,
+                                                           pid_path))
+
+    setup_logging(error_path=error_path, **(log_options or {}))
+    startup.mark('logging')
+
+    def door_path(path, door):
+        if path is None or len(doors) == 1:
+            return path
+        return '{}.{}'.format(path, door.name)
+
+    if old_pid is None and os.path.exists(pid_path):
+        logger.warning('stale pid file', extra={'path': pid_path})
+
+    # the pins, status boards and journals are only set up once the daemon
+    # handed off from, which used them until it exited, is gone. Returns the
+    # (door, `RelayError`) of the recovered unlocks that didn't release
+    def take_over_doors():
+        # the daemon handed off from turns the leds off as it exits
+        handed_off = old_pid is None or take_over(old_pid, old_pid_fd)
+        errors = []
+        for door in doors:
+            door_controller = door.door_controller
+            door_controller.setup_pins()
+            if not handed_off:
+                door_controller.clean_up()
+            board = open_status(door_controller,
+                                door_path(status_path, door))
+            if board is not None:
+                door.daemon.recorders.append(board)
+            open_journal(door_controller, door_path(journal_path, door),
+                         cleanup)
+
+            door_controller.turn_on_led(door_controller.red_pin)
+            relay_error = recover_unlock(door_controller, door.check_kwargs)
+            if relay_error is not None:
+                errors.append((door, relay_error))
+        return errors
+
+    if mode == ASYNCIO:
+        from hocuspocus import aio
+
+        daemons = []
+        for door in doors:
+            daemon = aio.AsyncDaemon(
+                door.door_controller,
+                RequestQueue(queue_size, overflow),
+                check_kwargs=dict(check_kwargs or {}),
+                hold_ms=door.hold_ms,
+                max_hold_ms=door.max_hold_ms,
+                error_repeats=error_repeats,
+                monitor=open_monitor(door.door_controller, monitor_options,
+                                     cleanup),
+                admission=Admission(clock=door.door_controller.clock,
+                                    **(admission_options or {}))
+            )
+            open_history(daemon, door_path(history_path, door),
+                         history_records, cleanup)
+            door.daemon, door.check_kwargs = daemon, daemon.check_kwargs
+            daemons.append((door.name, daemon))
+
+        router = Doors(daemons, open_access_list(access_options, cleanup))
+        start_metrics(router, metrics_path, metrics_interval, cleanup)
+
+        on_reload = None
+        if reload_path is not None:
+            from hocuspocus.reload import Reloader
+            on_reload = Reloader(reload_path, doors).reload
+
+        errors = []
+
+        # in an executor thread, the loop keeps accepting requests while
+        # the old daemon finishes its own
+        def on_ready():
+            create_pid_file(pid_path)
+            startup.mark('daemon')
+            errors.extend(take_over_doors())
+
+        # the monitors are started by the daemons, on the loop
+        def on_serving():
+            for door, relay_error in errors:
+                door.daemon.show_error(relay_error)
+            startup.mark('ready')
+            startup.log()
+
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, SIGNALS)
+        aio.run(router, exit_callback, control_path, on_ready, on_reload,
+                schedule_doors(doors, schedules, cleanup), on_serving)
+        return
+
+    workers, monitors = [], []
+    for door in doors:
+        error_display = ErrorDisplay(door.door_controller, error_repeats)
+        monitor = open_monitor(door.door_controller, monitor_options,
+                               cleanup, error_display)
+        door.check_kwargs = dict(check_kwargs or {})
+        worker = UnlockWorker(
+            RequestQueue(queue_size, overflow),
+            partial(process_request, door.door_controller,
+                    door.check_kwargs, error_display, monitor=monitor),
+            hold_ms=door.hold_ms,
+            max_hold_ms=door.max_hold_ms,
+            clock=door.door_controller.clock,
+            admission=Admission(clock=door.door_controller.clock,
+                                **(admission_options or {}))
+        )
+        open_history(worker, door_path(history_path, door),
+                     history_records, cleanup)
+        door.daemon, door.error_display = worker, error_display
+        workers.append((door.name, worker))
+        monitors.append(monitor)
+
+    router = Doors(workers, open_access_list(access_options, cleanup))
+    start_metrics(router, metrics_path, metrics_interval, cleanup)
+
+    control_server = None
+    if control_path is not None:
+        from hocuspocus.control import ControlServer
+
+        control_server = ControlServer(control_path, router.submit,
+                                       router.stats, router.clock,
+                                       router.latency)
+        control_server.start()
+        cleanup.append(control_server.close)
+
+    signal.signal(signal.SIGUSR1, partial(handle_usr1, router))
+    signal.signal(signal.SIGUSR2, partial(hand_off, router, exit_callback,
+                                          control_server=control_server))
+    if reload_path is not None:
+        from hocuspocus.reload import Reloader
+        signal.signal(signal.SIGHUP,
+                      partial(handle_hup, Reloader(reload_path, doors)))
+
+    create_pid_file(pid_path)
+    startup.mark('daemon')
+
+    for door, relay_error in take_over_doors():
+        door.error_display.show(relay_error)
+    for monitor in monitors:
+        if monitor is not None:
+            monitor.start()
+    for door in doors:
+        door.daemon.start()
+    engine = schedule_doors(doors, schedules, cleanup)
+    if engine is not None:
+        engine.start()
+    startup.mark('ready')
+    startup.log()
+
+    # waits for the blocked signals instead of `signal.pause`, which misses
+    # a signal handled just before it's called
+    handled = [signum for signum in SIGNALS
+               if callable(signal.getsignal(signum))]
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, set(SIGNALS) - set(handled))
+
+    logger.info('running', extra={'mode': mode})
     while True:
-        signal.pause()
-        print('Processed signal')
+        signum = signal.sigwait(handled)
+        signal.getsignal(signum)(signum, None)
+        logger.debug('processed signal')
@@ -0,0 +1,286 @@
+import os
+import threading
+
+from collections import Counter, OrderedDict
+
+from hocuspocus.clock import MONOTONIC
+
+
+# phases of an `UnlockRequest` that are timed, in order, `time_to_open` is
+# from the request being received until the door is held open and `total`
+# until the request has finished
+PHASES = (
+    'received',
+    'started',
+    'pre_check',
+    'engage',
+    'verify',
+    'hold',
+    'release',
+    'post_check',
+    'time_to_open',
+    'total',
+)
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram():
+    """
+    HDR style histogram of latencies in milliseconds that uses a fixed
+    amount of memory however many values are recorded.
+
+    Values are counted in `unit_ms` units, exactly up to 2 ** `precision`
+    units and in log-linear buckets above that, which keeps the error of
+    every percentile under 1 / 2 ** (`precision` - 1) of its value. Values
+    above `highest_ms` are counted as `highest_ms`.
+    """
+
+    def __init__(self, highest_ms=3600000, precision=6, unit_ms=0.01):
+        self.unit_ms = unit_ms
+        self.precision = precision
+        self.highest = int(highest_ms / unit_ms)
+        self._sub_buckets = 1 << precision
+        self._half = self._sub_buckets // 2
+        self.counts = [0] * (self._index(self.highest) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._sub_buckets:
+            return value
+        exponent = value.bit_length() - self.precision
+        return (self._sub_buckets + (exponent - 1) * self._half +
+                (value >> exponent) - self._half)
+
+    def _highest_equivalent(self, index):
+        if index < self._sub_buckets:
+            return index
+        exponent, sub_bucket = divmod(index - self._sub_buckets, self._half)
+        exponent += 1
+        return ((sub_bucket + self._half + 1) << exponent) - 1
+
+    def record(self, ms):
+        value = min(max(int(ms / self.unit_ms), 0), self.highest)
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum_ms += value * self.unit_ms
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percentile):
+        """
+        Returns the value in milliseconds that `percentile` percent of the
+        recorded values are less than or equal to, `None` if nothing has been
+        recorded.
+        """
+        if not self.total:
+            return None
+
+        rank = max(1, int(round(percentile / 100 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                value = min(self._highest_equivalent(index), self.max)
+                return value * self.unit_ms
+
+    def summary(self):
+        """
+        Returns the count, min, max and `PERCENTILES` (ie. `p99`) in
+        milliseconds.
+        """
+        summary = OrderedDict([
+            ('count', self.total),
+            ('min', self.min * self.unit_ms if self.total else None),
+            ('max', self.max * self.unit_ms if self.total else None),
+        ])
+        for percentile in PERCENTILES:
+            key = 'p{}'.format(percentile).replace('.', '')
+            summary[key] = self.percentile(percentile)
+        return summary
+
+
+class PhaseLatency():
+    """
+    A `LatencyHistogram` for each of the unlock `PHASES`, fed with the
+    timings of every request the daemon serves. Scheduled windows (see
+    `WindowRequest`) aren't latencies, they're left out.
+    """
+
+    def __init__(self, **kwargs):
+        self.histograms = OrderedDict(
+            (phase, LatencyHistogram(**kwargs)) for phase in PHASES)
+        self._lock = threading.Lock()
+
+    def record(self, request):
+        if request.window is not None:
+            return
+
+        phases = dict(request.phases)
+        received = phases['received']
+
+        with self._lock:
+            for phase, ms in request.timings():
+                if phase in self.histograms:
+                    self.histograms[phase].record(ms)
+
+            if 'hold' in phases:
+                self.histograms['time_to_open'].record(
+                    (phases['hold'] - received) * 1000)
+            if 'done' in phases:
+                self.histograms['total'].record(
+                    (phases['done'] - received) * 1000)
+
+    def dump(self):
+        """
+        Returns the summary of every phase that has been recorded.
+        """
+        with self._lock:
+            return OrderedDict(
+                (phase, histogram.summary())
+                for phase, histogram in self.histograms.items()
+                if histogram.total
+            )
+
+
+class UnlockCounters():
+    """
+    Counts the requests the daemon has served by their status (merged
+    requests included) and the `RelayError`s by relay and test number.
+    """
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.relay_errors = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, request):
+        with self._lock:
+            self.statuses[request.status] += 1 + request.coalesced
+            if request.relay_error is not None:
+                self.relay_errors[request.relay_error.codes] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.statuses), dict(self.relay_errors)
+
+
+def format_textfile(daemon):
+    """
+    Returns the metrics of an `UnlockWorker` or `AsyncDaemon` in the
+    Prometheus text format read by node_exporter's textfile collector. Given
+    `Doors` that serve more than one door, every sample is labelled with
+    its door.
+    """
+    daemons = list(getattr(daemon, 'daemons', {None: daemon}).items())
+    if len(daemons) == 1:
+        daemons = [(None, daemons[0][1])]
+    lines = []
+
+    def metric(name, kind, help_text, sample):
+        lines.append('# HELP hocuspocus_{} {}'.format(name, help_text))
+        lines.append('# TYPE hocuspocus_{} {}'.format(name, kind))
+        for door, door_daemon in daemons:
+            door_labels = (('door', door),) if door is not None else ()
+            for suffix, labels, value in sample(door_daemon):
+                label_text = ','.join(
+                    '{}="{}"'.format(key, label)
+                    for key, label in door_labels + labels)
+                lines.append('hocuspocus_{}{}{} {}'.format(
+                    name, suffix, '{' + label_text + '}' if label_text else '',
+                    value))
+
+    def received(daemon):
+        return [('', (), daemon.queue.stats()['received'] + daemon.extended)]
+
+    def finished(daemon):
+        statuses, _ = daemon.counters.snapshot()
+        return [('', (('status', status),), count)
+                for status, count in sorted(statuses.items())]
+
+    def dropped(daemon):
+        queue = daemon.queue.stats()
+        return [('', (), queue['dropped_newest'] + queue['dropped_oldest'])]
+
+    def relay_errors(daemon):
+        _, relay_errors = daemon.counters.snapshot()
+        return [('', (('relay', codes.relay), ('test', codes.test)), count)
+                for codes, count in sorted(relay_errors.items())]
+
+    def phases(daemon):
+        samples = []
+        for phase, summary in daemon.latency.dump().items():
+            histogram = daemon.latency.histograms[phase]
+            for percentile in PERCENTILES:
+                value = summary['p{}'.format(percentile).replace('.', '')]
+                samples.append((
+                    '', (('phase', phase), ('quantile', percentile / 100)),
+                    value / 1000))
+            samples.append(('_sum', (('phase', phase),),
+                            histogram.sum_ms / 1000))
+            samples.append(('_count', (('phase', phase),),
+                            summary['count']))
+        return samples
+
+    metric('unlock_requests_received_total', 'counter',
+           'Unlock requests received.', received)
+    metric('unlock_requests_total', 'counter',
+           'Unlock requests finished, by status.', finished)
+    metric('unlock_requests_dropped_total', 'counter',
+           'Unlock requests dropped because the queue was full.', dropped)
+    metric('relay_errors_total', 'counter',
+           'Relay errors, by failed relay and test number.', relay_errors)
+    metric('unlock_phase_seconds', 'summary',
+           'Time spent in each phase of the unlock.', phases)
+
+    return '\n'.join(lines) + '\n'
+
+
+class TextfileExporter(threading.Thread):
+    """
+    Writes `render()` to `path` every `interval` seconds, so however busy
+    the door is the file is written at most once per interval (and only if
+    the metrics changed). The file is replaced atomically by writing a
+    temporary file next to it and renaming it.
+    """
+
+    def __init__(self, path, render, interval=15, clock=MONOTONIC):
+        super(TextfileExporter, self).__init__(name='TextfileExporter',
+                                               daemon=True)
+        self.path = path
+        self.render = render
+        self.interval = interval
+        self.clock = clock
+        self.writes = 0
+        self._last = None
+        self._stopped = threading.Event()
+
+    def write(self):
+        text = self.render()
+        if text == self._last:
+            return False
+
+        temp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, self.path)
+
+        self._last = text
+        self.writes += 1
+        return True
+
+    def run(self):
+        while not self.clock.wait_event(self._stopped, self.interval):
+            self.write()
+
+    def stop(self):
+        """
+        Stops the thread and writes the final metrics.
+        """
+        self._stopped.set()
+        self.write()
@@ -0,0 +1,143 @@
+import logging
+import threading
+
+from hocuspocus.main import log_error, read_relays, relay_error_for
+
+
+logger = logging.getLogger(__name__)
+
+
+class RelayMonitor():
+    """
+    Samples the read pins of both relays every `interval_ms` milliseconds
+    (a timer on the door's clock, see `hocuspocus.timers`, rather than a
+    thread per door) while the door is idle and keeps the last state that
+    `samples` reads in a row agreed on, with the time it was last confirmed.
+
+    An unlock `claim`s the monitor, which stops the sampling until it's
+    `release`d. If the relays were confirmed released within the last
+    `max_age_ms` milliseconds the unlock can skip its pre-check.
+
+    `on_fault` is called with the `RelayError` (test 1) as soon as a relay
+    settles in the wrong state while the door is idle, so a stuck relay is
+    reported before anyone is waiting at the door. It's logged by default.
+    """
+
+    def __init__(self, door_controller, interval_ms=100, samples=3,
+                 max_age_ms=500, on_fault=None):
+        self.door_controller = door_controller
+        self.clock = door_controller.clock
+        self.interval_ms = interval_ms
+        self.samples = max(samples, 1)
+        self.max_age_ms = max_age_ms
+        self.on_fault = on_fault or self.log_fault
+        self.state = None
+        self.confirmed_at = None
+        self.faults = 0
+        self._reading = None
+        self._count = 0
+        self._claimed = False
+        self._lock = threading.Lock()
+        self._timer = None
+        self._next = None
+        self._call_at = None
+        # bumped by `start` and `stop`, a sample already running when they
+        # are called doesn't schedule the next one
+        self._generation = 0
+        self._scheduling = threading.Lock()
+
+    @staticmethod
+    def log_fault(relay_error):
+        log_error(relay_error, source='monitor')
+
+    def sample(self):
+        """
+        Reads the relays once, unless the monitor is claimed. Returns the
+        `RelayError` if the relays just settled in the wrong state.
+        """
+        door_controller = self.door_controller
+        with self._lock:
+            if self._claimed:
+                return None
+
+            relay = read_relays(door_controller, door_controller.low,
+                                door_controller.low)
+            if relay == self._reading:
+                self._count += 1
+            else:
+                self._reading, self._count = relay, 1
+
+            if self._count < self.samples:
+                return None
+
+            previous, self.state = self.state, relay
+            self.confirmed_at = self.clock.now()
+            if relay == previous:
+                return None
+
+        if relay == 0:
+            if previous is not None:
+                logger.info('relays recovered')
+            return None
+
+        relay_error = relay_error_for(relay, 1)
+        self.faults += 1
+        self.on_fault(relay_error)
+        return relay_error
+
+    def claim(self):
+        """
+        Stops the sampling until `release` is called and returns True if the
+        relays were confirmed released within the last `max_age_ms`.
+        """
+        with self._lock:
+            self._claimed = True
+            return (self.state == 0 and self.confirmed_at is not None and
+                    (self.clock.now() - self.confirmed_at) * 1000 <=
+                    self.max_age_ms)
+
+    def release(self):
+        """
+        Restarts the sampling, the state has to be confirmed again before
+        the next unlock can skip its pre-check.
+        """
+        with self._lock:
+            self._claimed = False
+            self.confirmed_at = None
+            self._reading, self._count = None, 0
+
+    def start(self, call_at=None):
+        """
+        Starts sampling, scheduled with `call_at`: the clock's `call_at` by
+        default, the event loop's in asyncio mode, so the relays are read
+        between its unlocks rather than from another thread.
+        """
+        with self._scheduling:
+            self._cancel()
+            self._call_at = call_at or self.clock.call_at
+            self._next = self.clock.now()
+            self._schedule()
+
+    def _schedule(self):
+        # from the last deadline, a late sample doesn't shift the next ones
+        self._next += self.interval_ms/1000
+        self._timer = self._call_at(self._next, self._tick, self._generation)
+
+    def _cancel(self):
+        self._generation += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _tick(self, generation):
+        try:
+            self.sample()
+        except Exception:
+            logger.exception('relay monitor failed')
+        with self._scheduling:
+            if generation == self._generation:
+                self._schedule()
+
+    def stop(self):
+        with self._scheduling:
+            self._cancel()
@@ -0,0 +1,184 @@
+import logging
+import configparser
+
+from collections import namedtuple
+from functools import partial
+
+from hocuspocus.doors import DEFAULT_DOOR, DoorConfig, read_doors
+
+
+logger = logging.getLogger(__name__)
+
+# options `Reloader` applies by section, besides every `[relays]` and
+# `[door:<name>]` option, the others only take effect on a restart
+RELOADED = {
+    'hold': ('ms', 'max_ms'),
+    'errors': ('display_repeats',),
+}
+
+# `check_kwargs` - `[relays]` options, see `check_relays`
+# `hold_ms` & `max_hold_ms` - `[hold]` times of the doors without their own
+# `error_repeats` - times each error code is displayed
+# `doors` - a `DoorConfig` for each `[door:<name>]` section
+Settings = namedtuple('Settings',
+                      'check_kwargs hold_ms max_hold_ms error_repeats doors')
+
+
+def read_config(path):
+    config = configparser.ConfigParser()
+    with open(path) as f:
+        config.read_file(f)
+    return config
+
+
+def read_settings(config):
+    """
+    Returns the `Settings` of `config`. Raises a `ValueError` if they aren't
+    valid.
+    """
+    check_kwargs = {}
+    if config.has_section('relays'):
+        check_kwargs = {
+            option: config.getint('relays', option)
+            for option in config.options('relays')
+        }
+
+    hold_ms = config.getint('hold', 'ms', fallback=5000)
+    max_hold_ms = config.getint('hold', 'max_ms', fallback=0)
+    if hold_ms <= 0:
+        raise ValueError('[hold] ms must be positive')
+
+    error_repeats = config.getint('errors', 'display_repeats', fallback=0)
+    if error_repeats < 0:
+        raise ValueError('[errors] display_repeats can\'t be negative')
+
+    return Settings(check_kwargs, hold_ms, max_hold_ms, error_repeats,
+                    read_doors(config, hold_ms, max_hold_ms))
+
+
+def reloaded(section, option):
+    """
+    Returns True if `Reloader` applies the `option` of `section`.
+    """
+    if section == 'relays' or section.startswith('door:'):
+        return True
+    return option in RELOADED.get(section, ())
+
+
+def restart_options(config):
+    """
+    Returns the options of `config` that only take effect on a restart, by
+    (section, option).
+    """
+    return dict(
+        ((section, option), value)
+        for section in config.sections()
+        for option, value in config.items(section)
+        if not reloaded(section, option)
+    )
+
+
+def reconfigure(door, settings, door_config):
+    """
+    Applies the reloaded `settings` and `door_config` to `door`, has to be
+    called between unlock cycles (see `UnlockWorker.apply`). If the door
+    moved to other pins, the error code being displayed is cancelled and
+    the red led is turned on on its new pin.
+    """
+    daemon = door.daemon
+    door.hold_ms = daemon.hold_ms = door_config.hold_ms
+    door.max_hold_ms = daemon.max_hold_ms = door_config.max_hold_ms
+    door.check_kwargs.clear()
+    door.check_kwargs.update(settings.check_kwargs)
+    if door.error_display is not None:
+        door.error_display.repeats = settings.error_repeats
+    else:
+        daemon.error_repeats = settings.error_repeats
+
+    door_controller = door.door_controller
+    moved = [
+        name for name, pin in door_config.pins.items()
+        if door_controller.pins.get(name) != pin
+    ]
+    if not moved:
+        return
+
+    if door.error_display is not None:
+        door.error_display.cancel()
+    else:
+        daemon.cancel_error_display()
+    door_controller.set_pins(**door_config.pins)
+    door_controller.turn_on_led(door_controller.red_pin)
+    logger.info('pins moved', extra={'door': door.name,
+                                     'pins': sorted(moved)})
+
+
+class Reloader():
+    """
+    Re-reads the config file at `path` and applies the settings that can
+    change while the daemon runs to the `Door`s it serves: the `[relays]`
+    options, the hold times, `[errors] display_repeats` and the pins of
+    each door. Each door is changed between two of its unlock cycles, only
+    the pins that moved are set up again.
+
+    Nothing is applied if the settings aren't valid or if doors were added,
+    removed or reordered. The other options only take effect on a restart,
+    changing them is logged.
+    """
+
+    def __init__(self, path, doors):
+        self.path = path
+        self.doors = doors
+        self.reloaded = 0
+        self.failed = 0
+        self._restart = restart_options(read_config(path))
+
+    def door_configs(self, settings):
+        """
+        Returns the `DoorConfig` of each door served, in order. Raises a
+        `ValueError` if the doors changed.
+        """
+        configs = settings.doors or [
+            DoorConfig(DEFAULT_DOOR, {}, settings.hold_ms,
+                       settings.max_hold_ms)
+        ]
+
+        names = [door_config.name for door_config in configs]
+        served = [door.name for door in self.doors]
+        if names != served:
+            raise ValueError(
+                'The doors changed from {} to {}, that takes a '
+                'restart'.format(', '.join(served), ', '.join(names)))
+
+        return configs
+
+    def reload(self):
+        """
+        Returns True if the settings were valid and will be applied.
+        """
+        try:
+            config = read_config(self.path)
+            settings = read_settings(config)
+            door_configs = self.door_configs(settings)
+        except (OSError, configparser.Error, ValueError) as e:
+            self.failed += 1
+            logger.error('config not reloaded', extra={'path': self.path,
+                                                       'error': str(e)})
+            return False
+
+        for door, door_config in zip(self.doors, door_configs):
+            door.daemon.apply(partial(reconfigure, door, settings,
+                                      door_config))
+
+        restart = restart_options(config)
+        changed = sorted(
+            key for key in set(restart) | set(self._restart)
+            if restart.get(key) != self._restart.get(key)
+        )
+        if changed:
+            logger.warning('restart needed', extra={'options': [
+                '[{}] {}'.format(*key) for key in changed]})
+
+        self.reloaded += 1
+        logger.info('config reloaded', extra={'path': self.path})
+        return True
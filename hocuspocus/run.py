@@ -1,22 +1,150 @@
+import time
+
+# before anything else is imported, so the imports are timed
+STARTED = time.monotonic()
+
 import argparse
 import configparser
-from main import main
-from door_controller import DoorController
-import Adafruit_BBIO.GPIO as GPIO
+from hocuspocus.main import main, THREADED
+from hocuspocus.door_controller import DoorController
+from hocuspocus.doors import load_doors
+from hocuspocus.reload import read_settings
+from hocuspocus.startup import StartupTimer
+from hocuspocus.worker import COALESCE
+from hocuspocus.backends import create_backend
 
 
 if __name__ == '__main__':
+    startup = StartupTimer(STARTED)
+    startup.mark('imports')
+
     parser = argparse.ArgumentParser(description='Door controller daemon')
     parser.add_argument('ini_file', type=argparse.FileType('r'))
+    parser.add_argument('--handoff', action='store_true',
+                        help='take over from the running daemon')
     args = parser.parse_args()
 
     config = configparser.ConfigParser()
     config.read_file(args.ini_file)
 
-    door_controller = DoorController(GPIO)
+    # the options SIGHUP reloads: [relays] check_relays options (e.g.
+    # samples/poll_ms/timeout_ms), [hold], [errors] display_repeats and the
+    # optional [door:<name>] sections
+    settings = read_settings(config)
+
+    # optional [logging] options, see `setup_logging`
+    log_options = {}
+    if config.has_section('logging'):
+        logging_config = config['logging']
+        log_options = {
+            'path': logging_config.get('file'),
+            'style': logging_config.get('format', 'json'),
+            'level': logging_config.get('level', 'info'),
+            'queue_size': logging_config.getint('queue_size', 1024),
+            'max_bytes': logging_config.getint('max_bytes', 1048576),
+            'backup_count': logging_config.getint('backup_count', 5),
+            'fsync_every': logging_config.getint('fsync_every', 16),
+            'fsync_interval': logging_config.getfloat('fsync_interval', 5),
+        }
+
+    # optional [monitor] options, see `RelayMonitor`
+    monitor_options = None
+    if config.has_section('monitor'):
+        monitor_options = {
+            option: config.getint('monitor', option)
+            for option in config.options('monitor')
+        }
+
+    # optional [access] allow-list of credentials, see `AccessList`
+    access_options = None
+    if config.has_section('access'):
+        access_config = config['access']
+        access_options = {
+            'path': access_config.get('file'),
+            'required': access_config.getboolean('required', False),
+            'bloom_bits': access_config.getint('bloom_bits', 0),
+            'bloom_hashes': access_config.getint('bloom_hashes', 3),
+            'interval': access_config.getfloat('reload_interval', 5),
+        }
+
+    # optional [admission] control of each door, see `Admission`
+    admission_options = None
+    if config.has_section('admission'):
+        admission_config = config['admission']
+        admission_options = {
+            'rate': admission_config.getfloat('rate', 0),
+            'burst': admission_config.getint('burst', 1),
+            'max_cycles_per_minute': admission_config.getfloat(
+                'max_cycles_per_minute', 0),
+            'cycle_burst': admission_config.getint('cycle_burst', 1),
+            'deadline_ms': admission_config.getint('deadline_ms', 0),
+        }
+
+    # optional [schedule] windows each door is held unlocked for, by name
+    schedules = None
+    if config.has_section('schedule'):
+        from hocuspocus.schedule import Schedule
+        schedules = {
+            door: Schedule.parse(text)
+            for door, text in config.items('schedule')
+        }
+
+    pid_path = config.get('paths', 'pid_file')
+    control_path = config.get('paths', 'control_socket', fallback=None)
+    if control_path is None:
+        from hocuspocus.control import default_control_path
+        control_path = default_control_path(pid_path)
+    journal_path = config.get('paths', 'journal_file', fallback=None)
+    if journal_path is None:
+        from hocuspocus.journal import default_journal_path
+        journal_path = default_journal_path(pid_path)
+    startup.mark('config')
+
+    gpio_options = {}
+    if config.has_section('gpio'):
+        gpio_options = dict(config.items('gpio'))
+    GPIO = create_backend(gpio_options.pop('backend', 'adafruit'),
+                          gpio_options)
+    startup.mark('gpio')
+
+    # optional [door:<name>] sections, one door without them. The pins of
+    # a daemon taking over are set up once the old one has exited
+    setup = not args.handoff
+    doors = load_doors(config, GPIO, settings.hold_ms, settings.max_hold_ms,
+                       setup=setup)
+    if doors:
+        door_controller = doors[0].door_controller
+    else:
+        door_controller = DoorController(GPIO, setup=setup)
+    startup.mark('pin_setup')
 
     main(
-        config.get('paths', 'pid_file'),
+        pid_path,
         config.get('paths', 'error_file'),
-        door_controller
+        door_controller,
+        check_kwargs=settings.check_kwargs,
+        queue_size=config.getint('queue', 'size', fallback=1),
+        overflow=config.get('queue', 'overflow', fallback=COALESCE),
+        max_hold_ms=settings.max_hold_ms,
+        error_repeats=settings.error_repeats,
+        mode=config.get('daemon', 'mode', fallback=THREADED),
+        hold_ms=settings.hold_ms,
+        control_path=control_path,
+        metrics_path=config.get('metrics', 'textfile', fallback=None),
+        metrics_interval=config.getfloat('metrics', 'interval',
+                                         fallback=15),
+        log_options=log_options,
+        history_path=config.get('errors', 'history_file', fallback=None),
+        history_records=config.getint('errors', 'history_records',
+                                      fallback=65536),
+        monitor_options=monitor_options,
+        doors=doors,
+        status_path=config.get('status', 'path', fallback=None),
+        startup=startup,
+        reload_path=args.ini_file.name,
+        handoff=args.handoff,
+        journal_path=journal_path,
+        access_options=access_options,
+        admission_options=admission_options,
+        schedules=schedules,
     )
@@ -0,0 +1,204 @@
+import bisect
+import logging
+import datetime
+import threading
+
+from hocuspocus.clock import MONOTONIC
+
+
+logger = logging.getLogger(__name__)
+
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+
+def parse_time(text):
+    """
+    Returns the seconds since midnight of `HH:MM`, `24:00` included.
+    """
+    try:
+        hours, minutes = (int(part) for part in text.split(':'))
+    except ValueError:
+        raise ValueError('Invalid time: {}'.format(text))
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or (
+            hours == 24 and minutes):
+        raise ValueError('Invalid time: {}'.format(text))
+    return (hours * 60 + minutes) * 60
+
+
+def parse_days(text):
+    """
+    Returns the day numbers (monday is 0) of `mon`, `mon-fri` or
+    `mon,wed,fri` (ranges can wrap around the week, ie. `sat-mon`).
+    """
+    days = []
+    for part in text.split(','):
+        first, _, last = part.strip().partition('-')
+        try:
+            first = DAYS.index(first)
+            last = DAYS.index(last) if last else first
+        except ValueError:
+            raise ValueError('Invalid days: {}'.format(text))
+        days.extend(day % 7 for day in range(first, first + 1 +
+                                             (last - first) % 7))
+    return days
+
+
+def parse_schedule(text):
+    """
+    Parses the windows of a `[schedule]` option, separated by `;`:
+
+        mon-fri 08:00-18:00; sat 10:00-14:00; fri 22:00-02:00
+
+    A window that ends before it starts ends the next day. Returns the
+    (start, end) seconds since monday midnight of the windows, sorted with
+    the overlapping and adjacent ones merged. Raises a `ValueError` if the
+    text isn't valid.
+    """
+    windows = []
+    for part in text.split(';'):
+        if not part.strip():
+            continue
+        try:
+            days, times = part.split()
+            start, end = (parse_time(time) for time in times.split('-'))
+        except ValueError:
+            raise ValueError('Invalid window: {}'.format(part.strip()))
+        if start == end:
+            raise ValueError('Empty window: {}'.format(part.strip()))
+        if end < start:
+            end += DAY
+
+        for day in parse_days(days):
+            start_s, end_s = day * DAY + start, day * DAY + end
+            # split at the end of the week
+            if end_s > WEEK:
+                windows.append((0, end_s - WEEK))
+                end_s = WEEK
+            windows.append((start_s, end_s))
+
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Schedule():
+    """
+    Weekly schedule of the windows a door is held unlocked for, see
+    `parse_schedule`. Times are local.
+    """
+
+    def __init__(self, windows):
+        self.windows = windows
+        self._starts = [start for start, _ in windows]
+
+    @classmethod
+    def parse(cls, text):
+        return cls(parse_schedule(text))
+
+    def state(self, when):
+        """
+        Returns whether the door is scheduled to be unlocked at the datetime
+        `when` and the seconds until that changes, `None` if it never does.
+        """
+        if not self.windows:
+            return False, None
+        if self.windows == [(0, WEEK)]:
+            return True, None
+
+        midnight = when.replace(hour=0, minute=0, second=0, microsecond=0)
+        now = when.weekday() * DAY + (when - midnight).total_seconds()
+
+        index = bisect.bisect_right(self._starts, now) - 1
+        if index >= 0 and now < self.windows[index][1]:
+            end = self.windows[index][1]
+            # carries on past the end of the week
+            if end == WEEK and self.windows[0][0] == 0:
+                end += self.windows[0][1]
+            return True, end - now
+
+        if index + 1 < len(self.windows):
+            return False, self.windows[index + 1][0] - now
+        return False, self.windows[0][0] + WEEK - now
+
+
+class ScheduledDoor():
+    """
+    A door's `Schedule`, its daemon and the `ScheduledWindow` it's held
+    for, if it is.
+    """
+
+    def __init__(self, name, schedule, daemon):
+        self.name = name
+        self.schedule = schedule
+        self.daemon = daemon
+        self.window = None
+
+
+class ScheduleEngine(threading.Thread):
+    """
+    Holds each `ScheduledDoor` unlocked for the windows of its schedule.
+    The time until the next window opens or closes is worked out from the
+    sorted schedule and waited for, the schedule isn't polled. It's checked
+    against the wall clock at least every `max_wait` seconds though, to
+    follow the clock being set (ie. by NTP once the board has booted).
+
+    A window whose unlock failed is tried again at the next check. In
+    asyncio mode `tick` is called from the event loop (see
+    `hocuspocus.aio.run`) instead of starting the thread.
+    """
+
+    def __init__(self, doors, clock=MONOTONIC, now=datetime.datetime.now,
+                 max_wait=300):
+        super(ScheduleEngine, self).__init__(name='ScheduleEngine',
+                                             daemon=True)
+        self.doors = doors
+        self.clock = clock
+        self.now = now
+        self.max_wait = max_wait
+        self._stopped = threading.Event()
+
+    def tick(self):
+        """
+        Opens and closes the windows that are due. Returns the seconds until
+        the next one is.
+        """
+        when = self.now()
+        wait = self.max_wait
+        for door in self.doors:
+            scheduled, remaining = door.schedule.state(when)
+            window = door.window
+            if scheduled and (window is None or window.closed):
+                logger.info('window opening', extra={
+                    'door': door.name, 'seconds': remaining})
+                door.window = door.daemon.open_window(
+                    WEEK if remaining is None else remaining)
+            elif not scheduled and window is not None and not window.closed:
+                logger.info('window closing', extra={'door': door.name})
+                window.close()
+
+            if remaining is not None:
+                wait = min(wait, remaining)
+        return wait
+
+    def close(self):
+        """
+        Ends the windows that are open.
+        """
+        for door in self.doors:
+            if door.window is not None:
+                door.window.close()
+
+    def run(self):
+        wait = self.tick()
+        while not self.clock.wait_event(self._stopped, wait):
+            wait = self.tick()
+
+    def stop(self):
+        self._stopped.set()
+        self.close()
@@ -0,0 +1,68 @@
+import os
+import logging
+
+from hocuspocus.clock import MONOTONIC
+
+
+logger = logging.getLogger(__name__)
+
+
+def process_age(proc='/proc'):
+    """
+    Returns the seconds since the process was started, from the kernel's
+    process accounting (10ms resolution), `None` if `proc` isn't there.
+    """
+    try:
+        with open(os.path.join(proc, 'self', 'stat')) as f:
+            # the command name can contain spaces, it's in parentheses
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(os.path.join(proc, 'uptime')) as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+
+    # starttime is the 22nd field, the 20th after the command name
+    started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    return max(uptime - started, 0.0)
+
+
+class StartupTimer():
+    """
+    Times the phases of the daemon's startup, each `mark` ends the phase
+    named and starts the next one. `started` is the monotonic time the
+    first phase started at, now if it's not given.
+
+    The time the interpreter took to start, before `started`, is counted as
+    the `interpreter` phase when the kernel can tell.
+    """
+
+    def __init__(self, started=None, clock=MONOTONIC, age=process_age):
+        self.clock = clock
+        now = clock.now()
+        self.started = now if started is None else started
+        self.phases = []
+
+        interpreter = age()
+        if interpreter is not None:
+            self.phases.append(
+                ('interpreter', max(interpreter - (now - self.started), 0)))
+        self._last = self.started
+
+    def mark(self, phase):
+        now = self.clock.now()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def timings(self):
+        """
+        Returns (phase, milliseconds) pairs and `time_to_ready` in total.
+        """
+        timings = [(phase, seconds * 1000) for phase, seconds in self.phases]
+        timings.append(('time_to_ready',
+                        sum(seconds for _, seconds in self.phases) * 1000))
+        return timings
+
+    def log(self):
+        logger.info('ready', extra=dict(
+            ('{}_ms'.format(phase), round(ms, 3))
+            for phase, ms in self.timings()))
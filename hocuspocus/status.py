@@ -0,0 +1,184 @@
+import os
+import mmap
+import time
+import struct
+import threading
+
+from collections import namedtuple
+
+from hocuspocus.worker import FAILED, UNLOCKED
+
+
+MAGIC = b'HPSTATUS'
+VERSION = 1
+
+# phases of the door, `idle` between unlocks, the others as in `unlock_door`
+PHASES = (
+    'idle',
+    'pre_check',
+    'engage',
+    'verify',
+    'hold',
+    'release',
+    'post_check',
+)
+
+# magic, version and sequence number, followed by the fields of `Status`
+HEADER = struct.Struct('<8sII')
+BODY = struct.Struct('<dQQQdBBBBBBBB')
+SIZE = HEADER.size + BODY.size
+SEQUENCE_OFFSET = 12
+
+# `updated` - unix time of the last change
+# `served`, `unlocked` & `failed` - requests served (merged ones included)
+# and how many of them unlocked the door or failed
+# `error_time`, `error_relay` & `error_test` - unix time and code of the
+# last `RelayError`, 0 if there hasn't been one
+# `phase` - name of the current phase, see `PHASES`
+# `relay_1` & `relay_2` - level last read back from each relay
+# `engaged` - level last written to the relay engage pins
+# `green` & `red` - levels of the leds
+Status = namedtuple('Status', 'updated served unlocked failed error_time '
+                              'phase error_relay error_test relay_1 relay_2 '
+                              'engaged green red')
+PHASE = Status._fields.index('phase')
+
+
+class StatusBoard():
+    """
+    Publishes the status of a door in a small fixed layout file at `path`
+    (under /dev/shm, so it never touches the disk) that any number of
+    readers can map and sample without going through the daemon, see
+    `StatusReader`.
+
+    Every change rewrites the whole record behind a seqlock: the sequence
+    number is odd while the record is being written and is bumped again
+    once it's done, so a reader that sees the same even number before and
+    after copying the record has a consistent snapshot.
+    """
+
+    def __init__(self, path, now=time.time):
+        self.path = path
+        self.now = now
+        self._values = dict.fromkeys(Status._fields, 0)
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+        # not truncated, readers still mapping the file of a previous run
+        # would fault
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, SIZE)
+            self._map = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+
+        self._map[:HEADER.size] = HEADER.pack(MAGIC, VERSION, 0)
+        self.update()
+
+    def update(self, **fields):
+        """
+        Changes the given `Status` fields, `phase` by name.
+        """
+        with self._lock:
+            if 'phase' in fields:
+                fields['phase'] = PHASES.index(fields['phase'])
+            self._values.update(fields)
+            self._values['updated'] = self.now()
+            body = BODY.pack(*(self._values[field]
+                               for field in Status._fields))
+
+            self._bump()
+            self._map[HEADER.size:SIZE] = body
+            self._bump()
+
+    def _bump(self):
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        struct.pack_into('<I', self._map, SEQUENCE_OFFSET, self._sequence)
+
+    def on_phase(self, mark):
+        """
+        Returns an `unlock_door` `on_phase` callback that calls `mark` and
+        publishes the phase.
+        """
+        def on_phase(phase):
+            mark(phase)
+            self.update(phase=phase)
+        return on_phase
+
+    def record(self, request):
+        """
+        Publishes the outcome of a served `UnlockRequest`, the door is idle
+        again.
+        """
+        served = 1 + request.coalesced
+        fields = {
+            'phase': 'idle',
+            'served': self._values['served'] + served,
+        }
+        if request.status == UNLOCKED:
+            fields['unlocked'] = self._values['unlocked'] + served
+        elif request.status == FAILED:
+            fields['failed'] = self._values['failed'] + served
+
+        relay_error = request.relay_error
+        if relay_error is not None:
+            fields.update(error_time=self.now(),
+                          error_relay=relay_error.codes.relay,
+                          error_test=relay_error.codes.test)
+        self.update(**fields)
+
+    def close(self):
+        self._map.close()
+
+
+class StatusReader():
+    """
+    Reads the `StatusBoard` at `path`. The file is mapped once, after that
+    `read` only copies memory.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), SIZE, access=mmap.ACCESS_READ)
+
+        magic, version, _ = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a status board'.format(path))
+
+    def read(self, retries=1000):
+        """
+        Returns a consistent `Status`, retrying while the daemon is writing
+        it. Raises a `RuntimeError` if it doesn't get one in `retries`
+        tries.
+        """
+        for _ in range(retries):
+            before = struct.unpack_from('<I', self._map, SEQUENCE_OFFSET)[0]
+            if before % 2:
+                continue
+            values = BODY.unpack_from(self._map, HEADER.size)
+            after = struct.unpack_from('<I', self._map, SEQUENCE_OFFSET)[0]
+            if before == after:
+                values = list(values)
+                values[PHASE] = PHASES[values[PHASE]]
+                return Status(*values)
+
+        raise RuntimeError('The status board kept changing')
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_status(path):
+    """
+    Returns the `Status` of the board at `path`, for one-off reads.
+    """
+    with StatusReader(path) as reader:
+        return reader.read()
@@ -0,0 +1,212 @@
+import math
+import time
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class Timer():
+    """
+    A callback scheduled on a `TimerWheel`, runs at the monotonic time
+    `when` unless it's `cancel`led first.
+    """
+
+    __slots__ = ('when', 'tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, tick, callback, args):
+        self.when = when
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel(threading.Thread):
+    """
+    Hashed timer wheel: a single thread that runs callbacks at monotonic
+    deadlines. Time is cut into `tick` second ticks and a timer goes into
+    the bucket of its deadline's tick (of `slots` buckets, a timer more
+    than a turn of the wheel away waits in its bucket for the turns to
+    pass), so scheduling and cancelling a timer is O(1) however many are
+    pending. Deadlines are rounded up to the next tick.
+
+    The thread sleeps until the next tick that has a timer in its bucket,
+    an idle wheel doesn't wake up. Callbacks run on the wheel's thread one
+    after the other, they have to be quick (ie. switching a led).
+    """
+
+    def __init__(self, tick=0.001, slots=4096, now=time.monotonic):
+        super(TimerWheel, self).__init__(name='TimerWheel', daemon=True)
+        self.tick = tick
+        self.slots = slots
+        self.now = now
+        self.pending = 0
+        self._buckets = [[] for _ in range(slots)]
+        self._current = int(now() / tick)
+        self._wakeup = None
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    def call_at(self, when, callback, *args):
+        """
+        Schedules `callback(*args)` to run at the monotonic time `when`.
+        Returns the `Timer`.
+        """
+        with self._condition:
+            tick = max(int(math.ceil(when / self.tick)), self._current + 1)
+            timer = Timer(when, tick, callback, args)
+            self._buckets[tick % self.slots].append(timer)
+            self.pending += 1
+            if self._wakeup is None or tick < self._wakeup:
+                self._condition.notify()
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now() + delay, callback, *args)
+
+    def _expire(self, now_tick):
+        """
+        Takes the timers that are due by `now_tick` out of their buckets.
+        """
+        due = []
+        # a bucket is only looked at once even if the wheel fell behind by
+        # more than a turn
+        first = max(self._current + 1, now_tick - self.slots + 1)
+        for tick in range(first, now_tick + 1):
+            bucket = self._buckets[tick % self.slots]
+            if not bucket:
+                continue
+            waiting = [timer for timer in bucket if timer.tick > now_tick]
+            if len(waiting) < len(bucket):
+                due.extend(timer for timer in bucket
+                           if timer.tick <= now_tick)
+                bucket[:] = waiting
+        self._current = now_tick
+        self.pending -= len(due)
+        return sorted(due, key=lambda timer: timer.when)
+
+    def _next_tick(self):
+        """
+        Returns the next tick with a timer in its bucket, `None` if there
+        are no timers.
+        """
+        if not self.pending:
+            return None
+        for offset in range(1, self.slots + 1):
+            if self._buckets[(self._current + offset) % self.slots]:
+                return self._current + offset
+        return None
+
+    def run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                due = self._expire(int(self.now() / self.tick))
+                if not due:
+                    self._wakeup = self._next_tick()
+                    timeout = None
+                    if self._wakeup is not None:
+                        timeout = max(
+                            self._wakeup * self.tick - self.now(), 0)
+                    self._condition.wait(timeout)
+                    self._wakeup = None
+                    continue
+
+            for timer in due:
+                if timer.cancelled:
+                    continue
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    logger.exception('timer failed')
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+
+_wheel = None
+_wheel_lock = threading.Lock()
+
+
+def shared_wheel():
+    """
+    Returns the `TimerWheel` of the process, started on first use.
+    """
+    global _wheel
+    with _wheel_lock:
+        if _wheel is None:
+            _wheel = TimerWheel()
+            _wheel.start()
+        return _wheel
+
+
+class Timeline():
+    """
+    Runs `steps`, (seconds, callback) pairs in order, that many seconds
+    after the timeline is started on `clock` (see `MonotonicClock.call_at`),
+    `repeats` times (0 repeats it until it's cancelled), each pass
+    `duration` seconds after the last one started. Every deadline is
+    worked out from the start, a step that runs late doesn't push the ones
+    after it back. Only the next step is scheduled at any time.
+
+    `on_done` is called once the timeline has ended or was cancelled.
+    """
+
+    def __init__(self, clock, steps, duration, repeats=1, on_done=None):
+        self.clock = clock
+        self.steps = steps
+        self.duration = duration
+        self.repeats = repeats
+        self.on_done = on_done
+        self.started = None
+        self.done = threading.Event()
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def start(self):
+        self.started = self.clock.now()
+        self._schedule(0)
+        return self
+
+    def _schedule(self, index):
+        passes, step = divmod(index, len(self.steps))
+        if self.repeats and passes >= self.repeats:
+            self._timer = self.clock.call_at(
+                self.started + passes * self.duration, self._finish)
+            return
+        offset = passes * self.duration + self.steps[step][0]
+        self._timer = self.clock.call_at(self.started + offset, self._run,
+                                         index)
+
+    def _run(self, index):
+        with self._lock:
+            if self.done.is_set():
+                return
+            self.steps[index % len(self.steps)][1]()
+            self._schedule(index + 1)
+
+    def _finish(self):
+        with self._lock:
+            if self.done.is_set():
+                return
+            self.done.set()
+            if self.on_done is not None:
+                self.on_done()
+
+    def cancel(self):
+        """
+        Stops the timeline, once it returns no step runs anymore and
+        `on_done` has been called.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._finish()
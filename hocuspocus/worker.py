@@ -0,0 +1,694 @@
+import logging
+import threading
+
+from collections import Counter, deque
+from functools import partial
+
+from hocuspocus.clock import MONOTONIC
+from hocuspocus.metrics import PhaseLatency, UnlockCounters
+
+
+logger = logging.getLogger(__name__)
+
+
+DROP_NEWEST = 'drop-newest'
+DROP_OLDEST = 'drop-oldest'
+COALESCE = 'coalesce'
+
+OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST, COALESCE)
+
+# `UnlockRequest` outcomes
+UNLOCKED = 'ok'
+FAILED = 'error'
+DROPPED = 'dropped'
+DENIED = 'denied'
+REJECTED = 'rejected'
+
+# reasons a request is `REJECTED` for, see `Admission`
+RATE_LIMITED = 'rate_limited'
+DEADLINE = 'deadline'
+CYCLE_LIMIT = 'cycle_limit'
+REASONS = (RATE_LIMITED, DEADLINE, CYCLE_LIMIT)
+
+
+class UnlockRequest():
+    """
+    A single request to unlock the door.
+
+    `source` - where the request came from (ie. 'signal' or 'socket')
+    `request_id` - id given by the requester, if any
+    `hold_ms` - how long to hold the door unlocked for, `None` uses the
+    daemon's hold time
+    `received` - monotonic time the request was received at
+    `coalesced` - number of later requests that were merged into this one
+    `phases` - (phase, monotonic time) pairs of when each phase started
+    `status`, `relay_error` & `reason` - the outcome, set by `finish`
+    `clock` - clock the phases are timed with
+    `door` - name of the door to unlock, `None` is the default door (see
+    `Doors`)
+    `credential` - badge number or PIN hash the request was made with, if
+    any, checked against the `AccessList` if there is one
+    `deadline_ms` - how long the request can wait for its unlock cycle to
+    start, `None` uses the daemon's (see `Admission`). `deadline` is the
+    monotonic time that is, once it's admitted
+    `window` - the `ScheduledWindow` of a `WindowRequest`, `None` otherwise
+    """
+
+    window = None
+
+    def __init__(self, source='signal', request_id=None, hold_ms=None,
+                 clock=MONOTONIC, door=None, credential=None,
+                 deadline_ms=None):
+        self.source = source
+        self.request_id = request_id
+        self.hold_ms = hold_ms
+        self.door = door
+        self.credential = credential
+        self.deadline_ms = deadline_ms
+        self.deadline = None
+        self.clock = clock
+        self.received = clock.now()
+        self.coalesced = 0
+        self.merged = []
+        self.phases = [('received', self.received)]
+        self.status = None
+        self.relay_error = None
+        self.reason = None
+        self._callbacks = []
+
+    def merge(self, request):
+        """
+        Merges a request that arrived while this one was still pending or
+        being served. It'll finish with the same outcome as this one, it
+        has until the later of their deadlines to start.
+        """
+        self.coalesced += 1 + request.coalesced
+        self.merged.append(request)
+        if self.deadline is not None:
+            self.deadline = (None if request.deadline is None
+                             else max(self.deadline, request.deadline))
+
+    def mark(self, phase):
+        """
+        Records the start of `phase`, can be used as `unlock_door`'s
+        `on_phase` callback.
+        """
+        self.phases.append((phase, self.clock.now()))
+
+    def timings(self):
+        """
+        Returns (phase, milliseconds) pairs of the time spent in each phase.
+        """
+        return [
+            (phase, (end - start) * 1000)
+            for (phase, start), (_, end) in zip(self.phases, self.phases[1:])
+        ]
+
+    def add_done_callback(self, callback):
+        """
+        `callback(request)` is called once the request has finished.
+        """
+        self._callbacks.append(callback)
+
+    def finish(self, status, relay_error=None, reason=None):
+        """
+        Sets the outcome of the request and of every request merged into
+        it, then calls their done callbacks. `reason` is why a `REJECTED`
+        request was rejected.
+        """
+        self.mark('done')
+        self.status = status
+        self.relay_error = relay_error
+        self.reason = reason
+
+        for callback in self._callbacks:
+            callback(self)
+
+        for request in self.merged:
+            request.phases.extend(
+                phase for phase in self.phases[1:-1]
+                if phase[1] >= request.received
+            )
+            request.finish(status, relay_error, reason)
+
+
+def fail_request(request):
+    """
+    Logs the exception being handled and finishes `request` (and the
+    requests merged into it) as failed if the handler hadn't finished it, so
+    the worker and anyone waiting on the request can carry on.
+    """
+    logger.exception('failed to serve request',
+                     extra={'request_id': request.request_id})
+    if request.status is None:
+        request.finish(FAILED)
+
+
+class RequestQueue():
+    """
+    Bounded, thread safe FIFO of `UnlockRequest`s.
+
+    `maxsize` - the number of requests that can be waiting at once
+
+    `policy` - what to do with a request that arrives while the queue is full
+        - drop-newest: the new request is dropped
+        - drop-oldest: the oldest waiting request is dropped
+        - coalesce: the new request is merged into the newest waiting one,
+          both are served by the same unlock
+
+    Once it's `close`d, requests are dropped and `get` stops blocking when
+    the queue is empty.
+    """
+
+    def __init__(self, maxsize=1, policy=COALESCE):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy: {}'.format(policy))
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.received = 0
+        self.dropped_newest = 0
+        self.dropped_oldest = 0
+        self.coalesced = 0
+        self.closed = False
+        self._requests = deque()
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._requests)
+
+    @property
+    def dropped(self):
+        return self.dropped_newest + self.dropped_oldest
+
+    def put(self, request):
+        """
+        Adds the request without blocking. Returns False if the request was
+        dropped, True if it'll be served (on its own or coalesced). Dropped
+        requests are finished with the `DROPPED` status.
+        """
+        with self._condition:
+            self.received += 1
+
+            if self.closed:
+                self.dropped_newest += 1
+                request.finish(DROPPED)
+                return False
+
+            if len(self._requests) < self.maxsize:
+                self._requests.append(request)
+                self._condition.notify()
+                return True
+
+            if self.policy == DROP_NEWEST:
+                self.dropped_newest += 1
+                request.finish(DROPPED)
+                return False
+
+            if self.policy == DROP_OLDEST:
+                self._requests.popleft().finish(DROPPED)
+                self._requests.append(request)
+                self.dropped_oldest += 1
+                return True
+
+            self._requests[-1].merge(request)
+            self.coalesced += 1
+            return True
+
+    def put_front(self, request):
+        """
+        Adds the request ahead of the ones waiting, even if the queue is
+        full. Returns False if the queue is closed.
+        """
+        with self._condition:
+            if self.closed:
+                return False
+            self._requests.appendleft(request)
+            self._condition.notify()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Removes and returns the oldest request. Blocks until one is
+        available or `timeout` seconds have passed, in which case `None` is
+        returned. Returns `None` right away if the queue is closed and empty.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._requests or self.closed, timeout):
+                return None
+            if not self._requests:
+                return None
+            return self._requests.popleft()
+
+    def close(self):
+        """
+        Stops accepting requests, the ones waiting can still be taken.
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'depth': len(self._requests),
+                'maxsize': self.maxsize,
+                'received': self.received,
+                'dropped_newest': self.dropped_newest,
+                'dropped_oldest': self.dropped_oldest,
+                'coalesced': self.coalesced,
+            }
+
+
+class HoldWindow():
+    """
+    The time the door is held unlocked for during one unlock cycle.
+
+    The door is held for `ms` milliseconds. While it's held, `extend` pushes
+    the re-lock deadline out to `ms` milliseconds from now, as long as the
+    door won't have been held for more than `max_ms` in total.
+    """
+
+    def __init__(self, ms, max_ms, clock=MONOTONIC):
+        self.ms = ms
+        self.clock = clock
+        self.max_ms = max(ms, max_ms)
+        self.started = None
+        self.deadline = None
+        self.extended = 0
+        self._condition = threading.Condition()
+
+    def wait(self):
+        """
+        Blocks until the (possibly extended) deadline has passed.
+        """
+        with self._condition:
+            self.started = self.clock.now()
+            self.deadline = self.started + self.ms/1000
+
+            while True:
+                remaining = self.deadline - self.clock.now()
+                if remaining <= 0:
+                    break
+                self.clock.wait(self._condition, remaining)
+
+            self.deadline = None
+
+    def extend(self, on_extend=None):
+        """
+        Returns True if the door is being held and will stay unlocked for
+        another `ms` milliseconds, otherwise False. `on_extend` is called
+        before the window can close if it was extended.
+        """
+        with self._condition:
+            if self.deadline is None:
+                return False
+
+            deadline = self.clock.now() + self.ms/1000
+            if deadline > self.started + self.max_ms/1000:
+                return False
+
+            self.deadline = max(self.deadline, deadline)
+            self.extended += 1
+            if on_extend is not None:
+                on_extend()
+            self._condition.notify()
+            return True
+
+
+class ScheduledWindow(HoldWindow):
+    """
+    `HoldWindow` of a scheduled unlock (see `hocuspocus.schedule`), the
+    door is held until the monotonic time `end` or until it's `close`d.
+    While it's held every `extend` succeeds, so requests are answered right
+    away (see `WindowRequest`) instead of being queued.
+    """
+
+    def __init__(self, end, clock=MONOTONIC):
+        super(ScheduledWindow, self).__init__(0, 0, clock)
+        self.end = end
+        self.closed = False
+
+    def wait(self):
+        with self._condition:
+            self.started = self.clock.now()
+            self.deadline = self.end
+
+            while not self.closed:
+                remaining = self.end - self.clock.now()
+                if remaining <= 0:
+                    break
+                self.clock.wait(self._condition, remaining)
+
+            self.deadline = None
+
+    def extend(self, on_extend=None):
+        with self._condition:
+            if self.deadline is None:
+                return False
+
+            self.extended += 1
+            if on_extend is not None:
+                on_extend()
+            return True
+
+    def close(self):
+        """
+        Ends the window now, or before it starts if it hasn't yet.
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class WindowRequest(UnlockRequest):
+    """
+    Request that unlocks the door for a `ScheduledWindow`. The relays are
+    checked on the way in and out of the window only, the requests merged
+    into it once the door is held are answered as unlocked right away (and
+    counted as merged).
+    """
+
+    def __init__(self, window, clock=MONOTONIC):
+        super(WindowRequest, self).__init__('schedule', clock=clock)
+        self.window = window
+        self.held = False
+        self.add_done_callback(lambda request: window.close())
+
+    def _answer(self, request):
+        request.phases.append(('hold', self.clock.now()))
+        request.finish(UNLOCKED)
+
+    def mark(self, phase):
+        super(WindowRequest, self).mark(phase)
+        if phase == 'hold':
+            self.held = True
+            merged, self.merged = self.merged, []
+            for request in merged:
+                self._answer(request)
+        elif phase == 'release':
+            self.held = False
+
+    def merge(self, request):
+        if not self.held:
+            return super(WindowRequest, self).merge(request)
+        self.coalesced += 1 + request.coalesced
+        self._answer(request)
+
+
+def reject_request(request, reason):
+    """
+    Logs and finishes `request` as `REJECTED` for `reason`.
+    """
+    logger.warning('request rejected',
+                   extra={'request_id': request.request_id,
+                          'source': request.source, 'reason': reason})
+    request.finish(REJECTED, reason=reason)
+
+
+class TokenBucket():
+    """
+    Allows `rate` events per second on average, in bursts of up to `burst`
+    events. Starts full.
+    """
+
+    def __init__(self, rate, burst=1, clock=MONOTONIC):
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate must be positive and burst at least 1')
+
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock.now()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock.now()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self):
+        """
+        Returns the seconds until a token can be taken, 0 if one can be now.
+        """
+        with self._lock:
+            self._refill()
+            return max(1 - self._tokens, 0) / self.rate
+
+    def take(self):
+        """
+        Takes a token, returns False if there wasn't one.
+        """
+        with self._lock:
+            self._refill()
+            # the time slept for by `delay` can come up a hair short
+            if self._tokens < 1 - 1e-9:
+                return False
+            self._tokens = max(self._tokens - 1, 0)
+            return True
+
+
+class Admission():
+    """
+    Admission control in front of the unlock cycles of a door.
+
+    `rate` & `burst` - requests admitted per second on average and at once
+    (see `TokenBucket`), the others are rejected as `RATE_LIMITED` when
+    they're submitted. 0 admits every request
+    `max_cycles_per_minute` & `cycle_burst` - relay cycles the door is
+    unlocked for at most, to cap the wear on the relays. Requests wait in
+    the queue for their cycle, 0 doesn't cap them
+    `deadline_ms` - how long a request can wait for its cycle to start,
+    unless it has its own. One that can't start in time is rejected as
+    `DEADLINE`, or as `CYCLE_LIMIT` when the cap would hold it up past its
+    deadline. 0 lets requests wait as long as it takes
+    """
+
+    def __init__(self, rate=0, burst=1, max_cycles_per_minute=0,
+                 cycle_burst=1, deadline_ms=0, clock=MONOTONIC):
+        self.requests = None
+        if rate > 0:
+            self.requests = TokenBucket(rate, burst, clock)
+        self.cycles = None
+        if max_cycles_per_minute > 0:
+            self.cycles = TokenBucket(max_cycles_per_minute/60, cycle_burst,
+                                      clock)
+        self.deadline_ms = deadline_ms
+        self.clock = clock
+        self.rejected = Counter()
+        self._lock = threading.Lock()
+
+    def _reject(self, reason):
+        with self._lock:
+            self.rejected[reason] += 1
+        return reason
+
+    def admit(self, request):
+        """
+        Sets the deadline of `request` as it's submitted. Returns the reason
+        it's rejected for, `None` if it's admitted.
+        """
+        deadline_ms = request.deadline_ms or self.deadline_ms
+        if deadline_ms:
+            request.deadline = request.received + deadline_ms/1000
+
+        if self.requests is not None and not self.requests.take():
+            return self._reject(RATE_LIMITED)
+        return None
+
+    def wait_time(self, request):
+        """
+        Returns the seconds `request` has to wait for its cycle to start and
+        the reason it's rejected for, `None` if it can start in time.
+        """
+        now = self.clock.now()
+        deadline = request.deadline
+        if deadline is not None and now > deadline:
+            return 0, self._reject(DEADLINE)
+
+        delay = 0 if self.cycles is None else self.cycles.delay()
+        if deadline is not None and now + delay > deadline:
+            return 0, self._reject(CYCLE_LIMIT)
+        return delay, None
+
+    def start_cycle(self):
+        """
+        Counts a relay cycle starting, once `wait_time` has passed.
+        """
+        if self.cycles is not None:
+            self.cycles.take()
+
+    def stats(self):
+        with self._lock:
+            return {reason: self.rejected[reason] for reason in REASONS}
+
+
+class UnlockWorker(threading.Thread):
+    """
+    Long lived thread that serves the requests in `queue` one at a time by
+    calling `handler(request, hold)`.
+
+    Requests without their own hold time are held for `hold_ms`. If
+    `max_hold_ms` is greater than the hold time the request is served with a
+    `HoldWindow` and requests submitted while the door is being held extend
+    that window instead of being queued for another unlock cycle. Otherwise
+    `hold` is `None`.
+
+    Requests are admitted into the queue and their cycles started by
+    `admission` (see `Admission`), the ones it rejects are finished with
+    the `REJECTED` status.
+
+    Every request served is recorded by each of the `recorders`, the phase
+    timings in `latency` and the outcomes in `counters` to begin with.
+
+    The worker stops once its queue is closed and empty, see `stop`.
+    """
+
+    def __init__(self, queue, handler, hold_ms=5000, max_hold_ms=0,
+                 clock=MONOTONIC, admission=None):
+        super(UnlockWorker, self).__init__(name='UnlockWorker', daemon=True)
+        self.queue = queue
+        self.handler = handler
+        self.hold_ms = hold_ms
+        self.max_hold_ms = max_hold_ms
+        self.clock = clock
+        self.admission = admission or Admission(clock=clock)
+        self.extended = 0
+        self.latency = PhaseLatency()
+        self.counters = UnlockCounters()
+        self.recorders = [self.latency, self.counters]
+        self._current = None
+        self._hold = None
+        self._cycle = threading.Lock()
+        self._changes = []
+
+    def hold_time(self, request):
+        """
+        Returns how long to hold the door for `request`, requests can't ask
+        for more than `max_hold_ms` (or `hold_ms` if that's larger).
+        """
+        if request.hold_ms is None:
+            return self.hold_ms
+        return min(request.hold_ms, max(self.hold_ms, self.max_hold_ms))
+
+    def stats(self):
+        return {
+            'queue': self.queue.stats(),
+            'extended': self.extended,
+            'rejected': self.admission.stats(),
+        }
+
+    def submit(self, request):
+        hold, current = self._hold, self._current
+        if hold is not None and hold.extend(partial(current.merge, request)):
+            self.extended += 1
+            return True
+
+        reason = self.admission.admit(request)
+        if reason is not None:
+            reject_request(request, reason)
+            return False
+        return self.queue.put(request)
+
+    def apply(self, change):
+        """
+        Calls `change()` between unlock cycles: now if the door is idle,
+        otherwise as soon as the cycle in progress has ended.
+        """
+        self._changes.append(change)
+        if self._cycle.acquire(blocking=False):
+            try:
+                self._apply_changes()
+            finally:
+                self._cycle.release()
+
+    def _apply_changes(self):
+        while self._changes:
+            self._changes.pop(0)()
+
+    def open_window(self, seconds):
+        """
+        Holds the door unlocked for the next `seconds`, ahead of the requests
+        waiting in the queue. Returns the `ScheduledWindow`, `None` if the
+        worker is stopping.
+        """
+        window = ScheduledWindow(self.clock.now() + seconds, self.clock)
+        if not self.queue.put_front(WindowRequest(window, self.clock)):
+            return None
+        return window
+
+    def close_window(self):
+        """
+        Ends the scheduled window the door is held for, if it is.
+        """
+        current = self._current
+        if current is not None and current.window is not None:
+            current.window.close()
+
+    def stop(self, timeout=None):
+        """
+        Closes the queue and waits up to `timeout` seconds for the worker to
+        serve the requests still in it and end the cycle in progress (a
+        scheduled window is ended early). Returns True if it stopped.
+        """
+        self.queue.close()
+        self.close_window()
+        if self.ident is not None:
+            self.join(timeout)
+        return not self.is_alive()
+
+    def serve_one(self, timeout=None):
+        """
+        Serves the next request in the queue, waiting up to `timeout`
+        seconds for one. Returns the request, or `None` if there wasn't one.
+        """
+        request = self.queue.get(timeout)
+        if request is None:
+            return None
+
+        if request.window is not None and request.window.closed:
+            request.finish(DROPPED)
+            return request
+
+        delay, reason = self.admission.wait_time(request)
+        if reason is not None:
+            reject_request(request, reason)
+            return request
+        if delay > 0:
+            self.clock.sleep(delay)
+        self.admission.start_cycle()
+
+        request.mark('started')
+        request.hold_ms = self.hold_time(request)
+
+        hold = request.window
+        if hold is None and self.max_hold_ms > request.hold_ms:
+            hold = HoldWindow(request.hold_ms, self.max_hold_ms, self.clock)
+
+        with self._cycle:
+            self._apply_changes()
+            self._current, self._hold = request, hold
+            try:
+                self.handler(request, hold)
+            except Exception:
+                fail_request(request)
+            finally:
+                self._current, self._hold = None, None
+
+        # changes that came in too late to be applied by `apply`
+        if self._changes:
+            with self._cycle:
+                self._apply_changes()
+
+        for recorder in self.recorders:
+            recorder.record(request)
+        return request
+
+    def run(self):
+        while self.serve_one() is not None or not self.queue.closed:
+            pass
@@ -41,11 +41,16 @@ setup(
     author='Randy Topliffe',
     author_email='randytopliffe@gamil.com',
     url='https://github.com/Taar/HocusPocus',
-    packages=['hocuspocus'],
+    packages=['hocuspocus', 'hocuspocus.backends'],
     setup_requires=setup_requires,
     install_requires=install_requires,
     tests_require=tests_require,
     cmdclass={'test': PyTest},
+    entry_points={
+        'console_scripts': [
+            'hocuspocus-errors = hocuspocus.history:main',
+        ],
+    },
     test_suite="tests",
     classifiers=[
         'Development Status :: 1 - Alpha',
@@ -1,9 +1,16 @@
+import sys
 import pytest
 
 from mock import MagicMock, PropertyMock
 from itertools import cycle
 
 
+# the asyncio mode uses async/await
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_aio.py')
+
+
 @pytest.fixture
 def GPIO():
     mock = MagicMock()
@@ -21,8 +28,14 @@ def GPIO():
 
 @pytest.fixture
 def door_controller():
+    from hocuspocus.clock import MONOTONIC
     from hocuspocus.door_controller import DoorController
-    return MagicMock(spec=DoorController)
+    mock = MagicMock(spec=DoorController)
+    # the tests patch `time.sleep`/`asyncio.sleep` or set their own clock
+    mock.clock = MONOTONIC
+    mock.status = None
+    mock.journal = None
+    return mock
 
 
 @pytest.fixture
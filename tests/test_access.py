@@ -0,0 +1,135 @@
+import os
+import pytest
+
+from mock import MagicMock
+
+
+def write_list(path, text):
+    path.write(text)
+    # the mtime alone may not change between two writes
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+
+class TestReadAccessList():
+
+    def test_doors_per_credential(self, tmpdir):
+        from hocuspocus.access import read_access_list
+
+        path = tmpdir.join('allow.list')
+        path.write('# badges\n'
+                   'badge-1234\n'
+                   '\n'
+                   'badge-5678 front back  # night shift\n')
+
+        assert read_access_list(str(path)) == {
+            'badge-1234': None,
+            'badge-5678': frozenset(['front', 'back']),
+        }
+
+    def test_credential_listed_twice(self, tmpdir):
+        from hocuspocus.access import read_access_list
+
+        path = tmpdir.join('allow.list')
+        path.write('badge-1234\nbadge-1234 front\n')
+
+        with pytest.raises(ValueError):
+            read_access_list(str(path))
+
+
+class TestBloomFilter():
+
+    def test_no_false_negatives(self):
+        from hocuspocus.access import BloomFilter
+
+        items = ['badge-{}'.format(number) for number in range(1000)]
+        bloom = BloomFilter(16384, 4, items)
+
+        assert all(item in bloom for item in items)
+        false_positives = sum('pin-{}'.format(number) in bloom
+                              for number in range(1000))
+        assert false_positives < 50
+
+
+class TestAccessList():
+
+    @pytest.mark.parametrize('bloom_bits', [0, 4096])
+    def test_check(self, tmpdir, bloom_bits):
+        from hocuspocus.access import AccessList
+
+        path = tmpdir.join('allow.list')
+        path.write('badge-1234\nbadge-5678 back\n')
+        access = AccessList(str(path), bloom_bits=bloom_bits)
+
+        assert access.check('badge-1234', 'front')
+        assert access.check('badge-5678', 'back')
+        assert not access.check('badge-5678', 'front')
+        assert not access.check('badge-0000', 'front')
+        assert access.check(None, 'front')
+        assert access.stats() == {
+            'entries': 2, 'allowed': 3, 'denied': 2, 'reloads': 1}
+
+    def test_required_denies_requests_without_a_credential(self, tmpdir):
+        from hocuspocus.access import AccessList
+
+        path = tmpdir.join('allow.list')
+        path.write('badge-1234\n')
+
+        assert not AccessList(str(path), required=True).check(None, 'front')
+
+    @pytest.mark.parametrize('bloom_bits', [0, 4096])
+    def test_reload_applies_the_changes(self, tmpdir, bloom_bits):
+        from hocuspocus.access import AccessList
+
+        path = tmpdir.join('allow.list')
+        path.write('badge-1234\nbadge-5678 back\n')
+        access = AccessList(str(path), bloom_bits=bloom_bits)
+        index = access._index
+
+        assert access.reload()
+        assert access.reloads == 1
+
+        write_list(path, 'badge-5678\nbadge-9012 front\n')
+        assert access.reload()
+
+        assert access._index is index
+        assert not access.check('badge-1234', 'front')
+        assert access.check('badge-5678', 'front')
+        assert access.check('badge-9012', 'front')
+        assert access.reloads == 2
+
+    def test_unreadable_file_keeps_the_index(self, tmpdir):
+        from hocuspocus.access import AccessList
+
+        path = tmpdir.join('allow.list')
+        path.write('badge-1234\n')
+        access = AccessList(str(path))
+
+        write_list(path, 'badge-1234\nbadge-1234\n')
+        assert not access.reload()
+        path.remove()
+        assert not access.reload()
+
+        assert access.check('badge-1234', 'front')
+
+    def test_missing_file(self, tmpdir):
+        from hocuspocus.access import AccessList
+
+        with pytest.raises(ValueError):
+            AccessList(str(tmpdir.join('allow.list')))
+
+    def test_watcher_reloads(self, tmpdir):
+        from hocuspocus.access import AccessList, AccessWatcher
+
+        path = tmpdir.join('allow.list')
+        path.write('badge-1234\n')
+        access = AccessList(str(path))
+        write_list(path, 'badge-5678\n')
+
+        # stopped after one interval
+        clock = MagicMock()
+        clock.wait_event.side_effect = [False, True]
+        AccessWatcher(access, interval=5, clock=clock).run()
+
+        assert access.check('badge-5678', 'front')
+        assert clock.wait_event.call_args[0][1] == 5
@@ -0,0 +1,232 @@
+import asyncio
+import pytest
+
+from mock import MagicMock, call, patch
+
+
+def gpio_calls(door_controller):
+    return [c for c in door_controller.mock_calls
+            if c[0] != 'test_relay_state']
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def sleep():
+    calls = []
+
+    async def fake_sleep(seconds):
+        calls.append(seconds)
+
+    with patch('asyncio.sleep', fake_sleep):
+        yield calls
+
+
+class TestCheckRelaysAsync():
+
+    def test_fixed_delay(self, door_controller, sleep):
+        from hocuspocus.aio import check_relays_async
+
+        door_controller.test_relay_state = MagicMock(return_value=False)
+
+        relay_error = run(check_relays_async(door_controller, 3))
+        assert relay_error.code == '3 3'
+        assert sleep == [1.0]
+
+    def test_settle(self, door_controller, sleep):
+        from hocuspocus.aio import check_relays_async
+
+        door_controller.test_relay_state = MagicMock(return_value=True)
+
+        relay_error = run(check_relays_async(door_controller, 1, samples=3,
+                                             poll_ms=10))
+        assert relay_error.code == '0 1'
+        assert sleep == [0.01, 0.01]
+
+
+class TestUnlockDoorAsync():
+
+    def test_successful_unlock(self, door_controller, sleep):
+        from hocuspocus.aio import unlock_door_async
+
+        door_controller.test_relay_state = MagicMock(return_value=True)
+
+        assert run(unlock_door_async(door_controller)) is None
+        assert gpio_calls(door_controller) == [
+            call.relays(activate=True),
+            call.turn_on_led(door_controller.green_pin),
+            call.turn_off_led(door_controller.green_pin),
+            call.relays(activate=False),
+        ]
+        assert sleep == [1.0, 1.0, 5.0, 1.0]
+
+    def test_second_relay_check_fails(self, door_controller, sleep):
+        from hocuspocus.aio import unlock_door_async
+
+        # relays are off, then only the first one engages
+        door_controller.test_relay_state = MagicMock(
+            side_effect=[True, True, True, False])
+
+        relay_error = run(unlock_door_async(door_controller))
+        assert relay_error.code == '2 2'
+        assert gpio_calls(door_controller) == [
+            call.relays(activate=True),
+            call.relays(activate=False),
+        ]
+
+
+class TestAsyncDaemon():
+
+    def test_failed_unlock_is_logged_and_displayed(
+            self, door_controller, sleep):
+        from hocuspocus.aio import AsyncDaemon
+        from hocuspocus.worker import RequestQueue, UnlockRequest
+
+        daemon = AsyncDaemon(door_controller, RequestQueue(),
+                             error_repeats=1)
+        door_controller.test_relay_state = MagicMock(return_value=False)
+
+        async def scenario():
+            with patch('hocuspocus.aio.log_error') as log_error:
+                await daemon.process(UnlockRequest())
+            assert log_error.call_count == 1
+            display = daemon._error_display
+            await display
+            assert display.done()
+
+        run(scenario())
+        assert door_controller.mock_calls[-1] == call.turn_on_led(
+            door_controller.red_pin)
+
+    def test_changes_wait_for_the_unlock_cycle(self, door_controller,
+                                               sleep):
+        from hocuspocus.aio import AsyncDaemon
+        from hocuspocus.worker import RequestQueue, UnlockRequest
+
+        daemon = AsyncDaemon(door_controller, RequestQueue())
+        door_controller.test_relay_state = MagicMock(return_value=True)
+        applied = []
+
+        async def process(request, hold=None):
+            daemon.apply(lambda: applied.append('change'))
+            applied.append('cycle')
+
+        daemon.process = process
+        daemon.apply(lambda: applied.append('idle'))
+        daemon.queue.put(UnlockRequest())
+        daemon.stop()
+
+        run(daemon.serve())
+        assert applied == ['idle', 'cycle', 'change']
+
+    def test_cycles_wait_for_the_cycle_cap(self, door_controller, sleep):
+        from hocuspocus.aio import AsyncDaemon
+        from hocuspocus.worker import (
+            Admission, RequestQueue, UnlockRequest, REJECTED, CYCLE_LIMIT)
+
+        daemon = AsyncDaemon(door_controller, RequestQueue(maxsize=4),
+                             admission=Admission(max_cycles_per_minute=6))
+        served = []
+
+        async def process(request, hold=None):
+            served.append(request)
+
+        daemon.process = process
+        first, second = UnlockRequest(), UnlockRequest()
+        hurried = UnlockRequest(deadline_ms=1000)
+        for request in (first, second, hurried):
+            daemon.submit(request)
+        daemon.stop()
+
+        with patch('hocuspocus.worker.logger'):
+            run(daemon.serve())
+
+        # the fake sleep doesn't move the clock, the cap is still 10s away
+        assert served == [first, second]
+        assert sleep == [pytest.approx(10, abs=0.1)]
+        assert hurried.status == REJECTED
+        assert hurried.reason == CYCLE_LIMIT
+
+    def test_requests_during_a_window_are_answered_right_away(
+            self, door_controller):
+        from hocuspocus.aio import AsyncDaemon
+        from hocuspocus.worker import RequestQueue, UnlockRequest, UNLOCKED
+
+        daemon = AsyncDaemon(door_controller, RequestQueue())
+        during = UnlockRequest()
+
+        async def process(request, hold=None):
+            request.mark('hold')
+            asyncio.get_event_loop().call_soon(daemon.submit, during)
+            await hold.wait()
+            request.finish(UNLOCKED)
+
+        daemon.process = process
+
+        async def scenario():
+            window = daemon.open_window(60)
+            serving = asyncio.ensure_future(daemon.serve())
+            await asyncio.sleep(0.01)
+            assert during.status == UNLOCKED
+            assert not window.closed
+            daemon.stop()
+            await serving
+            return window
+
+        assert run(scenario()).closed
+
+
+class TestMonitor():
+
+    def test_monitor_samples_on_the_loop(self, door_controller):
+        from hocuspocus.aio import AsyncDaemon
+        from hocuspocus.worker import RequestQueue
+
+        monitor = MagicMock()
+        daemon = AsyncDaemon(door_controller, RequestQueue(),
+                             monitor=monitor)
+
+        async def scenario():
+            serving = asyncio.ensure_future(daemon.serve())
+            await asyncio.sleep(0)
+            daemon.stop()
+            await serving
+            return asyncio.get_event_loop()
+
+        loop = run(scenario())
+
+        monitor.start.assert_called_once_with(loop.call_at)
+        monitor.stop.assert_called_once_with()
+
+
+class TestRun():
+
+    def test_on_ready_runs_off_the_loop(self):
+        import os
+        import signal
+        import threading
+        from hocuspocus import aio
+
+        doors = MagicMock()
+        doors.daemons = {}
+        on_exit = MagicMock()
+        threads = []
+
+        def on_ready():
+            threads.append(threading.current_thread())
+
+        def on_serving():
+            threads.append(threading.current_thread())
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        aio.run(doors, on_exit, on_ready=on_ready, on_serving=on_serving)
+
+        assert threads[0] is not threading.main_thread()
+        assert threads[1] is threading.main_thread()
+        on_exit.assert_called_once_with()
@@ -0,0 +1,322 @@
+import struct
+import pytest
+
+from mock import MagicMock, call, patch
+
+
+@pytest.fixture
+def register_file(tmpdir):
+    """
+    An ordinary file standing in for /dev/mem with the four GPIO banks
+    mapped back to back.
+    """
+    path = tmpdir.join('mem')
+    path.write_binary(b'\0' * 0x4000)
+    return str(path)
+
+
+def read_register(path, bank, offset):
+    with open(path, 'rb') as f:
+        f.seek(bank * 0x1000 + offset)
+        return struct.unpack('I', f.read(4))[0]
+
+
+def write_register(path, bank, offset, value):
+    with open(path, 'r+b') as f:
+        f.seek(bank * 0x1000 + offset)
+        f.write(struct.pack('I', value))
+
+
+class TestMmapGPIO():
+
+    @pytest.yield_fixture
+    def gpio(self, register_file):
+        from hocuspocus.backends.memory import MmapGPIO
+
+        gpio = MmapGPIO(register_file, banks=(0, 0x1000, 0x2000, 0x3000))
+        yield gpio
+        gpio.cleanup()
+
+    def test_setup_sets_output_enable(self, gpio, register_file):
+        from hocuspocus.backends.memory import OE
+
+        write_register(register_file, 1, OE, 0xFFFFFFFF)
+        # P8_15 is GPIO 47, bank 1 bit 15
+        gpio.setup('P8_15', gpio.OUT)
+        assert read_register(register_file, 1, OE) == 0xFFFFFFFF ^ (1 << 15)
+        # P8_16 is GPIO 46, bank 1 bit 14
+        gpio.setup('P8_16', gpio.IN)
+        assert read_register(register_file, 1, OE) & (1 << 14)
+
+    def test_input_reads_datain(self, gpio, register_file):
+        from hocuspocus.backends.memory import DATAIN
+
+        # P8_18 is GPIO 65, bank 2 bit 1
+        assert gpio.input('P8_18') == gpio.LOW
+        write_register(register_file, 2, DATAIN, 1 << 1)
+        assert gpio.input('P8_18') == gpio.HIGH
+
+    def test_output_writes_set_and_clear_registers(self, gpio,
+                                                   register_file):
+        from hocuspocus.backends.memory import SETDATAOUT, CLEARDATAOUT
+
+        # P8_11 is GPIO 45, bank 1 bit 13
+        gpio.output('P8_11', gpio.HIGH)
+        assert read_register(register_file, 1, SETDATAOUT) == 1 << 13
+        gpio.output('P8_11', gpio.LOW)
+        assert read_register(register_file, 1, CLEARDATAOUT) == 1 << 13
+
+    def test_red_led_uses_the_muxed_gpio(self, gpio, register_file):
+        from hocuspocus.backends.memory import SETDATAOUT
+
+        # the overlay muxes P8_9 to gpio2_5 (GPIO 69)
+        gpio.output('P8_9', gpio.HIGH)
+        assert read_register(register_file, 2, SETDATAOUT) == 1 << 5
+
+    def test_output_many_writes_each_bank_once(self, gpio, register_file):
+        from hocuspocus.backends.memory import SETDATAOUT
+
+        # GPIO 45 & 47 share bank 1, GPIO 27 is in bank 0
+        gpio.output_many(('P8_11', 'P8_15', 'P8_17'), gpio.HIGH)
+        assert read_register(register_file, 1, SETDATAOUT) == (
+            1 << 13 | 1 << 15)
+        assert read_register(register_file, 0, SETDATAOUT) == 1 << 27
+
+    def test_handles_are_resolved_once(self, gpio, register_file):
+        from hocuspocus.backends.memory import DATAIN, SETDATAOUT
+
+        red, relay = gpio.handle('P8_9'), gpio.handle('P8_18')
+        gpio.pins = {}
+        gpio.output_many((red,), gpio.HIGH)
+        assert read_register(register_file, 2, SETDATAOUT) == 1 << 5
+        write_register(register_file, 2, DATAIN, 1 << 1)
+        assert gpio.input(relay) == gpio.HIGH
+
+
+class TestDoorControllerWithBackend():
+
+    def test_relays_switch_together(self):
+        from hocuspocus.backends import GPIOBackend
+        from hocuspocus.door_controller import DoorController
+
+        GPIO = MagicMock(spec=GPIOBackend)
+        GPIO.HIGH, GPIO.LOW = 1, 0
+        GPIO.handle.side_effect = lambda pin: 'handle:' + pin
+        door_controller = DoorController(GPIO)
+        GPIO.reset_mock()
+        door_controller.relays(activate=True)
+
+        assert GPIO.mock_calls == [
+            call.output_many(('handle:P8_15', 'handle:P8_17'), 1),
+        ]
+
+
+class TestCreateBackend():
+
+    def test_unknown_backend(self):
+        from hocuspocus.backends import create_backend
+
+        with pytest.raises(ValueError):
+            create_backend('carrier-pigeon')
+
+    def test_mmap_backend_options(self, register_file):
+        from hocuspocus.backends import create_backend
+
+        gpio = create_backend('mmap', {
+            'path': register_file,
+            'banks': '0x0, 0x1000, 0x2000, 0x3000',
+            'pins': 'P8_11=44',
+        })
+        try:
+            assert gpio.banks == (0, 0x1000, 0x2000, 0x3000)
+            assert gpio.pins['P8_9'] == 69
+            assert gpio.pins['P8_11'] == 44
+        finally:
+            gpio.cleanup()
+
+
+@pytest.fixture
+def sysfs(tmpdir):
+    """
+    A directory shaped like /sys/class/gpio with the pins exported by
+    dto_files/rc.local.sh.
+    """
+    root = tmpdir.mkdir('gpio')
+    root.join('export').write('')
+    for number in (45, 47, 46, 27, 65, 70):
+        gpio = root.mkdir('gpio{}'.format(number))
+        gpio.join('direction').write('in')
+        gpio.join('value').write('0\n')
+    return root
+
+
+class TestSysfsGPIO():
+
+    def test_pins_match_rc_local(self):
+        from hocuspocus.backends import PINS
+
+        assert sorted(PINS.values()) == sorted([45, 47, 46, 27, 65, 70])
+
+    def test_setup_sets_direction(self, sysfs):
+        from hocuspocus.backends.sysfs import SysfsGPIO
+
+        gpio = SysfsGPIO(str(sysfs))
+        gpio.setup('P8_15', gpio.OUT)
+        gpio.setup('P8_16', gpio.IN)
+        gpio.cleanup()
+
+        assert sysfs.join('gpio47', 'direction').read() == 'out'
+        assert sysfs.join('gpio46', 'direction').read() == 'in'
+
+    def test_configured_pins_are_not_set_up_again(self, sysfs):
+        from hocuspocus.backends.sysfs import SysfsGPIO
+
+        sysfs.join('gpio47', 'direction').write('out')
+        sysfs.join('gpio47', 'value').write('1\n')
+        gpio = SysfsGPIO(str(sysfs))
+        with patch('hocuspocus.backends.sysfs.open', create=True,
+                   side_effect=open) as opened:
+            gpio.setup('P8_15', gpio.OUT)
+        gpio.cleanup()
+
+        assert [args[1:] for args, _ in opened.call_args_list] == [()]
+        assert sysfs.join('gpio47', 'value').read()[0] == '0'
+
+    def test_input_and_output_use_cached_descriptors(self, sysfs):
+        from hocuspocus.backends.sysfs import SysfsGPIO
+
+        gpio = SysfsGPIO(str(sysfs))
+        gpio.setup('P8_11', gpio.OUT)
+        gpio.setup('P8_18', gpio.IN)
+
+        gpio.output('P8_11', gpio.HIGH)
+        assert sysfs.join('gpio45', 'value').read()[0] == '1'
+        gpio.output('P8_11', gpio.LOW)
+        assert sysfs.join('gpio45', 'value').read()[0] == '0'
+
+        assert gpio.input('P8_18') == gpio.LOW
+        sysfs.join('gpio65', 'value').write('1\n')
+        assert gpio.input('P8_18') == gpio.HIGH
+        assert gpio.input(gpio.handle('P8_18')) == gpio.HIGH
+        gpio.cleanup()
+
+    def test_unexported_pin_is_exported(self, sysfs):
+        from hocuspocus.backends.sysfs import SysfsGPIO
+
+        sysfs.join('gpio70').remove()
+        gpio = SysfsGPIO(str(sysfs), export_timeout=0)
+        with pytest.raises(OSError):
+            gpio.setup('P8_9', gpio.OUT)
+
+        assert sysfs.join('export').read() == '70'
+
+
+@pytest.yield_fixture
+def fake_time():
+    """
+    Patches `time.sleep` to advance a fake clock instead of sleeping.
+    """
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    with patch('time.sleep', sleep):
+        yield lambda: now[0]
+
+
+class TestSimulatedRelay():
+
+    def test_actuation_and_release_delay(self):
+        from hocuspocus.backends.simulator import SimulatedRelay
+
+        relay = SimulatedRelay('E', 'R', actuate_ms=15, release_ms=10)
+        assert relay.level(0.0) == 0
+        relay.drive(True, 1.0)
+        assert relay.level(1.014) == 0
+        assert relay.level(1.0151) == 1
+        relay.drive(False, 2.0)
+        assert relay.level(2.009) == 1
+        assert relay.level(2.0101) == 0
+
+    def test_contact_bounce(self):
+        from hocuspocus.backends.simulator import SimulatedRelay
+
+        relay = SimulatedRelay('E', 'R', actuate_ms=10, bounce_ms=4)
+        relay.drive(True, 0.0)
+        levels = [relay.level(ms / 1000) for ms in range(9, 16)]
+        assert levels == [0, 1, 0, 1, 0, 1, 1]
+
+    def test_stuck_relays(self):
+        from hocuspocus.backends.simulator import SimulatedRelay
+
+        high = SimulatedRelay('E', 'R', fault='high')
+        low = SimulatedRelay('E', 'R', fault='low')
+        for relay in (high, low):
+            relay.drive(True, 0.0)
+        assert high.level(1.0) == 1
+        assert low.level(1.0) == 0
+
+        with pytest.raises(ValueError):
+            SimulatedRelay('E', 'R', fault='on-fire')
+
+    def test_weld_latches_without_reads(self):
+        from hocuspocus.backends.simulator import SimulatedRelay, WELDED
+
+        relay = SimulatedRelay('E', 'R', actuate_ms=15, fault=WELDED)
+        relay.drive(True, 0.0)
+        relay.drive(False, 0.010)
+        assert relay.level(1.0) == 0
+
+        relay.drive(True, 2.0)
+        relay.drive(False, 2.020)
+        assert relay.level(3.0) == 1
+
+
+class TestSimulatedGPIO():
+
+    def test_successful_unlock(self, fake_time):
+        from hocuspocus.backends.simulator import SimulatedGPIO, default_relays
+        from hocuspocus.door_controller import DoorController
+        from hocuspocus.main import unlock_door
+
+        gpio = SimulatedGPIO(default_relays(), now=fake_time)
+        door_controller = DoorController(gpio)
+        assert unlock_door(door_controller) is None
+        assert gpio.leds == {door_controller.red_pin: 0,
+                             door_controller.green_pin: 0}
+
+    def test_welded_relay_reproduces_error_2_3(self, fake_time, tmpdir):
+        from hocuspocus.backends.simulator import SimulatedGPIO
+        from hocuspocus.door_controller import DoorController
+        from hocuspocus.main import unlock_door
+
+        config = tmpdir.join('simulator.ini')
+        config.write(
+            '[relay:2]\n'
+            'engage = P8_17\n'
+            'read = P8_18\n'
+            'actuate_ms = 20\n'
+            'fault = weld\n'
+        )
+        gpio = SimulatedGPIO.from_file(str(config))
+        gpio.now = fake_time
+        door_controller = DoorController(gpio)
+
+        relay_error = unlock_door(door_controller,
+                                  check_kwargs={'samples': 3, 'poll_ms': 5,
+                                                'timeout_ms': 50})
+        assert relay_error.code == '2 3'
+
+    def test_relays_can_be_any_iterable(self):
+        from hocuspocus.backends.simulator import SimulatedGPIO, default_relays
+
+        gpio = SimulatedGPIO(relay for relay in default_relays())
+        gpio.output('P8_15', gpio.HIGH)
+        assert gpio.relays[0].engaged
+
+    def test_create_backend(self):
+        from hocuspocus.backends import create_backend
+        from hocuspocus.backends.simulator import SimulatedGPIO
+
+        assert isinstance(create_backend('simulator'), SimulatedGPIO)
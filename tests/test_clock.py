@@ -0,0 +1,127 @@
+import pytest
+
+from functools import partial
+from mock import MagicMock, patch
+
+
+class TestVirtualClock():
+
+    def test_events_run_in_order_while_sleeping(self):
+        from hocuspocus.clock import VirtualClock
+
+        clock = VirtualClock()
+        ran = []
+        clock.call_later(2, lambda: ran.append(('b', clock.now())))
+        clock.call_later(1, lambda: ran.append(('a', clock.now())))
+        clock.call_at(5, lambda: ran.append(('c', clock.now())))
+
+        clock.sleep(3)
+
+        assert ran == [('a', 1), ('b', 2)]
+        assert clock.now() == 3
+
+        clock.run()
+
+        assert ran[-1] == ('c', 5)
+
+    def test_cancelled_events_dont_run(self):
+        from hocuspocus.clock import VirtualClock
+
+        clock = VirtualClock()
+        callback = MagicMock()
+        clock.call_later(1, callback).cancel()
+        clock.run()
+
+        assert not callback.called
+
+    def test_monotonic_clock_sleeps(self):
+        from hocuspocus.clock import MONOTONIC
+
+        with patch('time.sleep') as sleep:
+            MONOTONIC.sleep(0.5)
+        sleep.assert_called_once_with(0.5)
+
+
+class TestSimulation():
+
+    def test_hold_window_extended_by_a_scheduled_request(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.worker import HoldWindow
+
+        clock = VirtualClock()
+        hold = HoldWindow(5000, 12000, clock)
+        clock.call_later(3, hold.extend)
+
+        hold.wait()
+
+        assert clock.now() == pytest.approx(8)
+
+    def test_error_display_takes_simulated_time(self):
+        from hocuspocus.backends.simulator import SimulatedGPIO
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.door_controller import DoorController
+        from hocuspocus.main import RelayError, display_error_code
+
+        clock = VirtualClock()
+        door_controller = DoorController(SimulatedGPIO([], now=clock.now),
+                                         clock=clock)
+
+        with patch('time.sleep') as sleep:
+            display_error_code(RelayError('3 3'), door_controller,
+                               loop=iter((True, False)))
+
+        assert not sleep.called
+        assert clock.now() > 10
+
+    def test_signal_requests_use_the_worker_clock(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.main import handle_usr1
+
+        worker = MagicMock()
+        worker.clock = VirtualClock(start=100)
+
+        handle_usr1(worker)
+
+        assert worker.submit.call_args[0][0].received == 100
+
+    def test_soak(self):
+        from hocuspocus.backends.simulator import (
+            SimulatedGPIO, WELDED, default_relays)
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.door_controller import DoorController
+        from hocuspocus.main import process_request
+        from hocuspocus.worker import (
+            RequestQueue, UnlockRequest, UnlockWorker, UNLOCKED, FAILED)
+
+        clock = VirtualClock()
+        relays = default_relays()
+        door_controller = DoorController(
+            SimulatedGPIO(relays, now=clock.now), clock=clock)
+        worker = UnlockWorker(
+            RequestQueue(),
+            partial(process_request, door_controller,
+                    {'samples': 3, 'poll_ms': 5, 'timeout_ms': 100},
+                    MagicMock()),
+            clock=clock
+        )
+
+        # a request every 7 seconds, the first relay welds after 900
+        requests = [UnlockRequest('soak', clock=clock) for _ in range(1000)]
+        for i, request in enumerate(requests):
+            clock.call_at(i * 7, worker.submit, request)
+        clock.call_at(900 * 7 - 1, setattr, relays[0], 'fault', WELDED)
+
+        served = 0
+        with patch('hocuspocus.main.log_error'):
+            while served < len(requests):
+                if worker.serve_one(timeout=0) is None:
+                    clock.advance(1)
+                else:
+                    served += 1
+
+        statuses = [request.status for request in requests]
+        assert statuses[:900] == [UNLOCKED] * 900
+        assert statuses[900:] == [FAILED] * 100
+        # almost two hours of simulated unlocks
+        assert clock.now() >= 999 * 7
+        assert dict(requests[0].timings())['hold'] == pytest.approx(5000)
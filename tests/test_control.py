@@ -0,0 +1,185 @@
+import json
+import socket
+import pytest
+
+from mock import MagicMock
+
+
+class TestParseMessage():
+
+    def test_unlock_is_the_default_op(self):
+        from hocuspocus.control import parse_message
+
+        message = parse_message(b'{"id": "abc", "hold_ms": 3000}\n')
+        assert message == {'op': 'unlock', 'id': 'abc', 'hold_ms': 3000}
+
+    def test_credential_is_carried_on_the_request(self):
+        from hocuspocus.control import parse_message, unlock_request
+
+        request = unlock_request(parse_message(
+            b'{"id": "abc", "credential": "badge-1234", '
+            b'"deadline_ms": 2000}\n'))
+        assert request.credential == 'badge-1234'
+        assert request.deadline_ms == 2000
+        assert request.source == 'socket'
+
+    @pytest.mark.parametrize('line', [
+        b'not json\n',
+        b'[1, 2]\n',
+        b'{"op": "open-sesame"}\n',
+        b'{"hold_ms": -1}\n',
+        b'{"hold_ms": "5000"}\n',
+        b'{"door": 2}\n',
+        b'{"credential": 1234}\n',
+        b'{"credential": ""}\n',
+        b'{"deadline_ms": 0}\n',
+    ])
+    def test_invalid_messages(self, line):
+        from hocuspocus.control import parse_message
+
+        with pytest.raises(ValueError):
+            parse_message(line)
+
+
+class TestFormatReply():
+
+    def test_failed_request(self):
+        from hocuspocus.control import format_reply
+        from hocuspocus.main import RelayError
+        from hocuspocus.worker import UnlockRequest, FAILED
+
+        request = UnlockRequest('socket', request_id='abc')
+        request.mark('pre_check')
+        request.finish(FAILED, RelayError('2 1'))
+
+        reply = json.loads(format_reply(request).decode('utf-8'))
+        assert reply['id'] == 'abc'
+        assert reply['status'] == 'error'
+        assert reply['code'] == '2 1'
+        assert reply['message'] == (
+            "Relay Failure on test number [1]: "
+            "Relays in wrong state: [second]"
+        )
+        assert sorted(reply['timings']) == ['pre_check', 'received']
+        assert reply['reason'] is None
+
+    def test_rejected_request(self):
+        from hocuspocus.control import format_reply
+        from hocuspocus.worker import UnlockRequest, REJECTED, DEADLINE
+
+        request = UnlockRequest('socket', request_id='abc')
+        request.finish(REJECTED, reason=DEADLINE)
+
+        reply = json.loads(format_reply(request).decode('utf-8'))
+        assert reply['status'] == 'rejected'
+        assert reply['reason'] == 'deadline'
+        assert reply['code'] is None
+
+
+class TestControlServer():
+
+    def test_unlock_and_stats(self, tmpdir):
+        from hocuspocus.control import ControlServer
+        from hocuspocus.worker import UNLOCKED
+
+        path = str(tmpdir.join('door_controller.sock'))
+        submitted = []
+
+        def submit(request):
+            submitted.append(request)
+            request.mark('pre_check')
+            request.finish(UNLOCKED)
+            return True
+
+        server = ControlServer(path, submit, MagicMock(return_value={
+            'queue': {'depth': 0}}), latency=MagicMock(return_value={
+                'hold': {'count': 1}}))
+        server.start()
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            reader = client.makefile('rb')
+            client.sendall(b'{"id": 7, "hold_ms": 2500}\n{"op": "stats"}\n'
+                           b'{"op": "latency"}\n{"op": "nope"}\n')
+
+            unlocked = json.loads(reader.readline().decode('utf-8'))
+            stats = json.loads(reader.readline().decode('utf-8'))
+            latency = json.loads(reader.readline().decode('utf-8'))
+            invalid = json.loads(reader.readline().decode('utf-8'))
+            client.close()
+        finally:
+            server.shutdown()
+            server.close()
+
+        assert submitted[0].request_id == 7
+        assert submitted[0].hold_ms == 2500
+        assert unlocked['id'] == 7
+        assert unlocked['status'] == 'ok'
+        assert unlocked['code'] is None
+        assert stats == {'queue': {'depth': 0}}
+        assert latency == {'hold': {'count': 1}}
+        assert invalid['status'] == 'invalid'
+        assert not tmpdir.join('door_controller.sock').exists()
+
+    def test_requests_are_routed_by_door(self, tmpdir):
+        from hocuspocus.control import ControlServer
+        from hocuspocus.doors import Doors
+        from hocuspocus.worker import RequestQueue, UnlockWorker, UNLOCKED
+
+        def handler(request, hold):
+            request.finish(UNLOCKED)
+
+        front = UnlockWorker(RequestQueue(), handler)
+        back = UnlockWorker(RequestQueue(), handler)
+        doors = Doors([('front', front), ('back', back)])
+
+        path = str(tmpdir.join('door_controller.sock'))
+        server = ControlServer(path, doors.submit, doors.stats, doors.clock,
+                               doors.latency)
+        server.start()
+        back.start()
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            reader = client.makefile('rb')
+            client.sendall(b'{"door": "back"}\n{"door": "side", "id": 1}\n'
+                           b'{"op": "stats", "door": "back"}\n'
+                           b'{"op": "stats"}\n')
+
+            unlocked = json.loads(reader.readline().decode('utf-8'))
+            unknown = json.loads(reader.readline().decode('utf-8'))
+            back_stats = json.loads(reader.readline().decode('utf-8'))
+            front_stats = json.loads(reader.readline().decode('utf-8'))
+            client.close()
+        finally:
+            server.shutdown()
+            server.close()
+
+        assert unlocked['status'] == 'ok'
+        assert unknown == {'id': 1, 'status': 'invalid',
+                           'error': 'Unknown door: side'}
+        assert back_stats['queue']['received'] == 1
+        assert front_stats['queue']['received'] == 0
+
+    def test_socket_taken_over_is_left_alone(self, tmpdir):
+        from hocuspocus.control import ControlServer
+
+        path = str(tmpdir.join('door_controller.sock'))
+        old = ControlServer(path, MagicMock(), MagicMock(return_value={}))
+        new = ControlServer(path, MagicMock(), MagicMock(return_value={
+            'queue': {'depth': 0}}))
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            client.sendall(b'{"op": "stats"}\n')
+            new.handle_request()
+            stats = json.loads(client.makefile('rb').readline().decode())
+            client.close()
+        finally:
+            old.close()
+
+        assert stats == {'queue': {'depth': 0}}
+        assert not old.stats.called
+        assert tmpdir.join('door_controller.sock').exists()
+        new.close()
+        assert tmpdir.listdir() == []
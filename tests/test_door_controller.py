@@ -43,6 +43,45 @@ class TestDoorController():
         for expected, actual in zip(expected_calls, GPIO.mock_calls):
             assert actual == expected
 
+    def test_only_moved_pins_are_set_up(self, GPIO):
+        from hocuspocus.door_controller import DoorController, Relay
+
+        door_controller = DoorController(GPIO)
+        GPIO.reset_mock()
+
+        moved = door_controller.set_pins(relay_1=Relay('P8_16', 'P8_15'),
+                                         relay_2=Relay('P9_14', 'P9_13'),
+                                         red_pin='P9_16')
+
+        assert moved == ['red_pin', 'relay_2']
+        assert sorted(GPIO.output.call_args_list) == sorted([
+            call('P8_17', GPIO.LOW),
+            call('P8_9', GPIO.LOW),
+        ])
+        assert GPIO.setup.call_args_list == [
+            call('P9_14', GPIO.IN, pull_up_down=GPIO.PUD_DOWN),
+            call('P9_13', GPIO.OUT, pull_up_down=GPIO.PUD_DOWN),
+            call('P9_16', GPIO.OUT, pull_up_down=GPIO.PUD_DOWN),
+        ]
+
+        door_controller.relays(activate=True)
+        GPIO.output.assert_called_with('P9_13', GPIO.HIGH)
+        assert door_controller.set_pins(red_pin='P9_16') == []
+
+    def test_pins_can_be_set_up_later(self, GPIO):
+        from hocuspocus.door_controller import DoorController
+
+        door_controller = DoorController(GPIO, red_pin='P9_16', setup=False)
+        door_controller.clean_up()
+
+        assert GPIO.mock_calls == []
+
+        assert door_controller.setup_pins() == [
+            'green_pin', 'red_pin', 'relay_1', 'relay_2']
+        assert GPIO.setup.call_count == 6
+        assert door_controller.setup_pins() == []
+        assert GPIO.setup.call_count == 6
+
 
 class TestActivatePin():
 
@@ -0,0 +1,115 @@
+import configparser
+import pytest
+
+from mock import MagicMock
+
+
+DOORS = '''
+[hold]
+ms = 3000
+
+[door:front]
+relay_1_read = P8_16
+relay_1_engage = P8_15
+relay_2_read = P8_18
+relay_2_engage = P8_17
+green_led = P8_11
+red_led = P8_9
+
+[door:back]
+relay_1_read = P9_12
+relay_1_engage = P9_11
+relay_2_read = P9_14
+relay_2_engage = P9_13
+green_led = P9_15
+red_led = P9_16
+hold_ms = 8000
+'''
+
+
+def parse(text):
+    config = configparser.ConfigParser()
+    config.read_string(text)
+    return config
+
+
+class TestLoadDoors():
+
+    def test_doors_are_loaded_in_order(self, GPIO):
+        from hocuspocus.doors import load_doors
+
+        doors = load_doors(parse(DOORS), GPIO, hold_ms=3000)
+
+        assert [door.name for door in doors] == ['front', 'back']
+        assert [door.hold_ms for door in doors] == [3000, 8000]
+        back = doors[1].door_controller
+        assert back.relay_1 == ('P9_12', 'P9_11')
+        assert back.relay_2 == ('P9_14', 'P9_13')
+        assert (back.green_pin, back.red_pin) == ('P9_15', 'P9_16')
+
+        back.relays(activate=True)
+        GPIO.output.assert_called_with('P9_13', 1)
+
+    def test_no_door_sections(self, GPIO):
+        from hocuspocus.doors import load_doors
+
+        assert load_doors(parse('[hold]\nms = 3000\n'), GPIO) == []
+
+    @pytest.mark.parametrize('text, error', [
+        (DOORS.replace('red_led = P9_16', 'red_led = P8_9'),
+         'P8_9 is already used by front'),
+        (DOORS.replace('green_led = P9_15\n', ''),
+         '[door:back] is missing green_led'),
+    ])
+    def test_invalid_doors(self, GPIO, text, error):
+        from hocuspocus.doors import load_doors
+
+        with pytest.raises(ValueError) as e:
+            load_doors(parse(text), GPIO)
+        assert error in str(e.value)
+
+
+class TestDoors():
+
+    def test_requests_go_to_their_door(self):
+        from hocuspocus.doors import Doors
+        from hocuspocus.worker import UnlockRequest
+
+        front, back = MagicMock(), MagicMock()
+        doors = Doors([('front', front), ('back', back)])
+
+        doors.submit(UnlockRequest(door='back'))
+        doors.submit(UnlockRequest())
+
+        assert back.submit.call_count == 1
+        assert front.submit.call_count == 1
+        assert doors.clock is front.clock
+        with pytest.raises(ValueError):
+            doors.submit(UnlockRequest(door='side'))
+
+    def test_requests_are_checked_against_the_access_list(self):
+        from hocuspocus.doors import Doors
+        from hocuspocus.worker import UnlockRequest, DENIED
+
+        front, back = MagicMock(), MagicMock()
+        access = MagicMock()
+        access.check.side_effect = lambda credential, door: door == 'back'
+        access.stats.return_value = {'denied': 1}
+        front.stats.return_value = {'extended': 0}
+        doors = Doors([('front', front), ('back', back)], access)
+
+        denied = UnlockRequest(credential='badge-1234')
+        assert not doors.submit(denied)
+        doors.submit(UnlockRequest(door='back', credential='badge-1234'))
+
+        assert denied.status == DENIED
+        assert access.check.call_args_list[0][0] == ('badge-1234', 'front')
+        assert not front.submit.called
+        assert back.submit.call_count == 1
+        assert doors.stats() == {'extended': 0, 'access': {'denied': 1}}
+
+    def test_needs_a_door(self):
+        from hocuspocus.doors import Doors
+
+        with pytest.raises(ValueError):
+            Doors([])
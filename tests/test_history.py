@@ -0,0 +1,117 @@
+import pytest
+
+from mock import MagicMock
+
+
+class TestErrorHistory():
+
+    def test_ring_keeps_the_newest_records(self, tmpdir):
+        from hocuspocus.history import ErrorHistory, read_history
+        from hocuspocus.main import RelayError
+
+        path = str(tmpdir.join('errors.ring'))
+        history = ErrorHistory(path, capacity=3)
+        for timestamp, code in enumerate(('1 1', '2 1', '3 2', '2 3')):
+            history.append(RelayError(code), 12.5, timestamp=timestamp)
+        history.close()
+
+        records = read_history(path)
+        assert [(r.sequence, r.relay, r.test) for r in records] == [
+            (2, 2, 1), (3, 3, 2), (4, 2, 3)]
+        assert records[0].duration_ms == 12.5
+        assert tmpdir.join('errors.ring').size() == 16 + 3 * 28
+
+    def test_reopening_continues_the_sequence(self, tmpdir):
+        from hocuspocus.history import ErrorHistory
+        from hocuspocus.main import RelayError
+
+        path = str(tmpdir.join('errors.ring'))
+        history = ErrorHistory(path, capacity=4)
+        history.append(RelayError('1 1'))
+        history.close()
+
+        # the capacity the file was created with is kept
+        history = ErrorHistory(path, capacity=100)
+        assert history.capacity == 4
+        assert history.append(RelayError('1 2')) == 2
+        history.close()
+
+    def test_torn_records_are_ignored(self, tmpdir):
+        from hocuspocus.history import ErrorHistory, HEADER, read_history
+        from hocuspocus.main import RelayError
+
+        path = tmpdir.join('errors.ring')
+        history = ErrorHistory(str(path), capacity=4)
+        history.append(RelayError('1 1'))
+        history.append(RelayError('2 2'))
+        history.close()
+
+        data = bytearray(path.read_binary())
+        data[HEADER.size + 28 + 8] ^= 0xFF
+        path.write_binary(bytes(data))
+
+        assert [r.sequence for r in read_history(str(path))] == [1]
+
+    def test_records_failed_requests(self, tmpdir):
+        from hocuspocus.history import ErrorHistory
+        from hocuspocus.main import RelayError
+
+        history = ErrorHistory(str(tmpdir.join('errors.ring')), capacity=4)
+        failed = MagicMock(relay_error=RelayError('2 3'),
+                           phases=[('received', 1.0), ('done', 1.25)])
+        history.record(failed)
+        history.record(MagicMock(relay_error=None))
+
+        records = history.records()
+        assert len(records) == 1
+        assert records[0].duration_ms == pytest.approx(250)
+        history.close()
+
+    def test_file_without_a_header_is_created_again(self, tmpdir):
+        from hocuspocus.history import ErrorHistory
+        from hocuspocus.main import RelayError
+
+        # truncated to size, then the daemon crashed
+        path = tmpdir.join('errors.ring')
+        path.write_binary(b'\0' * (16 + 3 * 28))
+        history = ErrorHistory(str(path), capacity=5)
+
+        assert history.capacity == 5
+        assert history.append(RelayError('1 1')) == 1
+        history.close()
+        assert tmpdir.listdir() == [path]
+
+    def test_not_a_history_file(self, tmpdir):
+        from hocuspocus.history import ErrorHistory
+
+        path = tmpdir.join('errors.ring')
+        path.write('2 1\nRelay Failure on test number [1]\n')
+        with pytest.raises(ValueError):
+            ErrorHistory(str(path))
+
+
+class TestCommand():
+
+    def test_filters_records(self, tmpdir, capsys):
+        from hocuspocus.history import ErrorHistory, main
+        from hocuspocus.main import RelayError
+
+        path = str(tmpdir.join('errors.ring'))
+        history = ErrorHistory(path, capacity=8)
+        history.append(RelayError('2 3'), timestamp=100)
+        history.append(RelayError('1 3'), timestamp=200)
+        history.append(RelayError('2 1'), timestamp=300)
+        history.close()
+
+        main([path, '--relay', '2', '--since', '150'])
+
+        lines = capsys.readouterr()[0].splitlines()
+        assert len(lines) == 1
+        assert 'code="2 1"' in lines[0]
+
+    def test_missing_file(self, tmpdir):
+        from hocuspocus.history import main
+
+        with pytest.raises(SystemExit) as e:
+            main([str(tmpdir.join('missing.ring'))])
+        assert e.value.code == 1
@@ -0,0 +1,48 @@
+from mock import patch
+
+
+class TestUnlockJournal():
+
+    def test_pending_phase_survives_a_restart(self, tmpdir):
+        from hocuspocus.journal import UnlockJournal
+
+        path = str(tmpdir.join('door_controller.journal'))
+        journal = UnlockJournal(path)
+        assert journal.pending() is None
+
+        journal.write('engage')
+        journal.write('hold')
+        journal.close()
+
+        journal = UnlockJournal(path)
+        assert journal.pending() == 'hold'
+        journal.idle()
+        journal.close()
+
+        assert UnlockJournal(path).pending() is None
+
+    def test_torn_record_is_pending(self, tmpdir):
+        from hocuspocus.journal import UnlockJournal, UNKNOWN, pack_record
+
+        path = tmpdir.join('door_controller.journal')
+        record = pack_record('idle')
+        path.write_binary(record[:-1] + bytes([record[-1] ^ 0xFF]))
+        assert UnlockJournal(str(path)).pending() == UNKNOWN
+
+        path.write_binary(record[:8])
+        assert UnlockJournal(str(path)).pending() == UNKNOWN
+
+    def test_only_engage_is_synced(self, tmpdir):
+        from hocuspocus.journal import UnlockJournal
+
+        journal = UnlockJournal(str(tmpdir.join('door_controller.journal')))
+        marked = []
+        on_phase = journal.on_phase(marked.append)
+
+        with patch('os.fdatasync') as fdatasync:
+            for phase in ('pre_check', 'engage', 'verify', 'hold'):
+                on_phase(phase)
+            journal.idle()
+
+        assert marked == ['pre_check', 'engage', 'verify', 'hold']
+        assert fdatasync.call_count == 1
@@ -0,0 +1,104 @@
+import json
+import queue
+import logging
+import pytest
+
+from mock import patch
+
+
+def make_record(message='unlocking door', **extra):
+    record = logging.LogRecord('hocuspocus.main', logging.INFO, __file__, 1,
+                               message, (), None)
+    record.created = 1.5
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+class TestStructuredFormatter():
+
+    def test_json(self):
+        from hocuspocus.log import StructuredFormatter
+
+        line = StructuredFormatter('json').format(
+            make_record(request_id='badge-1'))
+        assert json.loads(line) == {
+            'time': 1.5,
+            'level': 'info',
+            'logger': 'hocuspocus.main',
+            'message': 'unlocking door',
+            'request_id': 'badge-1',
+        }
+
+    def test_logfmt(self):
+        from hocuspocus.log import StructuredFormatter
+
+        line = StructuredFormatter('logfmt').format(
+            make_record(code='2 1', relay=2))
+        assert line == ('time=1.5 level=info logger=hocuspocus.main '
+                        'message="unlocking door" code="2 1" relay=2')
+
+    def test_unknown_format(self):
+        from hocuspocus.log import StructuredFormatter
+
+        with pytest.raises(ValueError):
+            StructuredFormatter('xml')
+
+
+class TestDroppingQueueHandler():
+
+    def test_full_queue_drops_records(self):
+        from hocuspocus.log import DroppingQueueHandler
+
+        handler = DroppingQueueHandler(queue.Queue(1))
+        handler.handle(make_record())
+        handler.handle(make_record())
+
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 1
+
+
+class TestSyncingFileHandler():
+
+    def test_fsyncs_in_batches_and_rotates(self, tmpdir):
+        from hocuspocus.log import SyncingFileHandler
+
+        path = tmpdir.join('hocuspocus.log')
+        handler = SyncingFileHandler(str(path), max_bytes=100,
+                                     backup_count=2, fsync_every=3,
+                                     fsync_interval=0)
+        with patch('os.fsync') as fsync:
+            for _ in range(7):
+                handler.handle(make_record())
+            assert fsync.call_count == 2
+            handler.close()
+            assert fsync.call_count == 3
+
+        assert tmpdir.join('hocuspocus.log.1').exists()
+        assert not tmpdir.join('hocuspocus.log.3').exists()
+
+
+class TestSetupLogging():
+
+    def test_errors_are_written_to_the_error_file(self, tmpdir):
+        from hocuspocus.log import setup_logging
+        from hocuspocus.main import RelayError, log_error
+
+        log_path = tmpdir.join('hocuspocus.log')
+        error_path = tmpdir.join('errors.log')
+        listener = setup_logging(str(log_path), str(error_path))
+        try:
+            logging.getLogger('hocuspocus.main').info('unlocking door')
+            log_error(RelayError('2 3'), request_id='badge-1')
+            log_error(RelayError('1 1'))
+        finally:
+            listener.stop()
+            logger = logging.getLogger('hocuspocus')
+            logger.handlers = []
+            logger.propagate = True
+
+        errors = [json.loads(line) for line in error_path.readlines()]
+        assert [error['code'] for error in errors] == ['2 3', '1 1']
+        assert errors[0]['request_id'] == 'badge-1'
+        assert errors[0]['relay'] == 2
+        assert len(log_path.readlines()) == 3
@@ -1,4 +1,5 @@
 import os
+import fcntl
 import pytest
 import shutil
 
@@ -129,6 +130,154 @@ class TestPidFileExists():
         assert not pid_file_exists('/some/random/path')
 
 
+class TestHandOff():
+
+    def test_pid_file_is_only_removed_by_its_daemon(self, tmpdir):
+        from hocuspocus.main import (
+            create_pid_file, read_pid_file, remove_pid_file)
+
+        path = str(tmpdir.join('door_controller.pid'))
+        os.close(create_pid_file(path))
+        assert read_pid_file(path) == os.getpid()
+
+        # written by the daemon the doors were handed off to
+        with open(path, 'w') as f:
+            f.write('1')
+        remove_pid_file(path)
+        assert read_pid_file(path) == 1
+
+        os.close(create_pid_file(path))
+        remove_pid_file(path)
+        assert read_pid_file(path) is None
+        assert tmpdir.listdir() == []
+
+    def test_running_daemon_holds_its_pid_file(self, tmpdir):
+        from hocuspocus.main import create_pid_file, running_daemon
+
+        path = str(tmpdir.join('door_controller.pid'))
+        assert running_daemon(path) == (None, None)
+
+        fd = create_pid_file(path)
+        pid, pid_fd = running_daemon(path)
+        os.close(pid_fd)
+        assert pid == os.getpid()
+
+        # killed, the lock went away with it
+        os.close(fd)
+        assert running_daemon(path) == (None, None)
+
+    def test_take_over_waits_for_the_daemon_to_exit(self):
+        import signal
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.main import take_over
+
+        clock = VirtualClock()
+        running = iter([True, True, False])
+        with patch('os.kill') as kill, patch('os.close') as close, \
+                patch('hocuspocus.main.locked',
+                      side_effect=lambda fd: next(running)):
+            assert take_over(1234, 5, clock=clock)
+
+        kill.assert_called_once_with(1234, signal.SIGUSR2)
+        close.assert_called_once_with(5)
+        assert clock.now() == pytest.approx(0.1)
+
+    def test_daemon_is_killed_if_it_does_not_hand_off(self):
+        import signal
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.main import take_over
+
+        clock = VirtualClock()
+        with patch('os.kill') as kill, patch('os.close'), \
+                patch('fcntl.flock') as flock, \
+                patch('hocuspocus.main.locked', return_value=True):
+            assert not take_over(1234, 5, timeout=1, clock=clock)
+
+        assert kill.call_args_list == [call(1234, signal.SIGUSR2),
+                                       call(1234, signal.SIGKILL)]
+        # waits for it to be gone
+        flock.assert_called_once_with(5, fcntl.LOCK_SH)
+
+    def test_gone_daemon_is_taken_over_at_once(self):
+        from hocuspocus.main import take_over
+
+        with patch('os.kill', side_effect=ProcessLookupError), \
+                patch('os.close') as close:
+            assert take_over(1234, 5)
+        close.assert_called_once_with(5)
+
+    def test_hand_off_serves_the_queue_and_exits(self):
+        from hocuspocus.doors import Doors
+        from hocuspocus.main import hand_off
+
+        daemon, control_server = MagicMock(), MagicMock()
+        exit_callback = MagicMock()
+        hand_off(Doors([('front', daemon)]), exit_callback, 12, None,
+                 control_server=control_server)
+
+        assert control_server.shutdown.called
+        assert daemon.stop.called
+        assert exit_callback.called
+
+
+class TestHandleUsr1():
+
+    def test_denied_signal_is_not_a_drop(self, tmpdir):
+        from hocuspocus.access import AccessList
+        from hocuspocus.doors import Doors
+        from hocuspocus.main import handle_usr1
+        from hocuspocus.worker import RequestQueue, UnlockWorker
+
+        path = tmpdir.join('allow.list')
+        path.write('badge-1234\n')
+        worker = UnlockWorker(RequestQueue(), MagicMock())
+        doors = Doors([('front', worker)],
+                      AccessList(str(path), required=True))
+
+        with patch('hocuspocus.main.logger') as logger:
+            handle_usr1(doors)
+
+        assert worker.queue.stats()['received'] == 0
+        assert not logger.warning.called
+        assert doors.stats()['access']['denied'] == 1
+
+    def test_dropped_signal_is_logged(self):
+        from hocuspocus.doors import Doors
+        from hocuspocus.main import handle_usr1
+        from hocuspocus.worker import RequestQueue, UnlockWorker, DROP_NEWEST
+
+        worker = UnlockWorker(RequestQueue(1, DROP_NEWEST), MagicMock())
+        doors = Doors([('front', worker)])
+
+        with patch('hocuspocus.main.logger') as logger:
+            handle_usr1(doors)
+            handle_usr1(doors)
+
+        assert logger.warning.call_count == 1
+
+
+class TestRelayError():
+
+    def test_outcomes_are_interned(self, door_controller, result_cycler):
+        from hocuspocus.main import check_relays, relay_error_for
+
+        door_controller.test_relay_state = MagicMock(
+            side_effect=result_cycler(False, False))
+
+        relay_state = check_relays(door_controller, 3, ms=0)
+        assert relay_state is relay_error_for(3, 3)
+        assert check_relays(door_controller, 3, ms=0) is relay_state
+
+    def test_is_immutable(self):
+        from hocuspocus.main import RelayError, relay_error_for
+
+        relay_error = relay_error_for(1, 2)
+        with pytest.raises(AttributeError):
+            relay_error.code = '0 0'
+        assert relay_error.code == RelayError('1 2').code == '1 2'
+        assert not hasattr(relay_error, '__dict__')
+
+
 class TestCheckRelays():
 
     @pytest.yield_fixture(autouse=True)
@@ -215,19 +364,79 @@ class TestCheckRelays():
             "Relays in wrong state: [both]"
         )
 
+    def test_settle_returns_after_consecutive_samples(self,
+                                                      door_controller):
+        from hocuspocus.main import check_relays
+        from hocuspocus.clock import VirtualClock
+
+        door_controller.clock = VirtualClock()
+        door_controller.test_relay_state = MagicMock(return_value=True)
+
+        relay_state = check_relays(door_controller,
+                                   2,
+                                   first=door_controller.high,
+                                   second=door_controller.high,
+                                   samples=3,
+                                   poll_ms=5)
+        assert relay_state.code == '0 2'
+        assert door_controller.test_relay_state.call_count == 6
+        assert door_controller.clock.now() == pytest.approx(0.01)
+        assert not self.sleep.called
+
+    def test_settle_restarts_count_on_bounce(self,
+                                             door_controller,
+                                             result_cycler):
+        from hocuspocus.main import check_relays
+        from hocuspocus.clock import VirtualClock
+
+        door_controller.clock = VirtualClock()
+        door_controller.test_relay_state = MagicMock(
+            side_effect=result_cycler(True, True, False, True,
+                                      True, True, True, True))
+
+        relay_state = check_relays(door_controller,
+                                   2,
+                                   samples=2,
+                                   poll_ms=5)
+        assert relay_state.code == '0 2'
+        assert door_controller.test_relay_state.call_count == 8
+
+    def test_settle_fails_when_deadline_expires(self,
+                                                door_controller,
+                                                result_cycler):
+        from hocuspocus.main import check_relays
+        from hocuspocus.clock import VirtualClock
+
+        door_controller.clock = VirtualClock()
+        door_controller.test_relay_state = MagicMock(
+            side_effect=result_cycler(True, False))
+
+        relay_state = check_relays(door_controller,
+                                   3,
+                                   samples=3,
+                                   poll_ms=100,
+                                   timeout_ms=300)
+        assert relay_state.code == '2 3'
+        assert relay_state.message == (
+            "Relay Failure on test number [3]: "
+            "Relays in wrong state: [second]"
+        )
+        assert door_controller.clock.now() == pytest.approx(0.3)
+
 
 class TestLogError():
 
-    def test_logging_error_message_into_pid_file(self,
-                                                 real_pid_file,
-                                                 relay_error_factory):
+    def test_logging_error_with_its_codes(self, relay_error_factory):
         from hocuspocus.main import log_error
 
         relay_error = relay_error_factory('2 1', 2, 1, "Mock Message")
+        relay_error.code = '2 1'
 
-        with real_pid_file() as path:
-            log_error(path, relay_error)
-            pid_contains(path, ['2 1\n', 'Mock Message'])
+        with patch('hocuspocus.main.error_logger') as error_logger:
+            log_error(relay_error, request_id='abc')
+
+        error_logger.error.assert_called_once_with('Mock Message', extra={
+            'code': '2 1', 'relay': 2, 'test': 1, 'request_id': 'abc'})
 
 
 class TestUnlockDoor():
@@ -266,6 +475,19 @@ class TestUnlockDoor():
             second=door_controller.low
         )
 
+    def test_pre_checked_unlock_skips_the_first_check(self,
+                                                      door_controller,
+                                                      relay_error):
+        from hocuspocus.main import unlock_door
+        self.check_relays.return_value = relay_error
+        on_phase = MagicMock()
+
+        assert unlock_door(door_controller, on_phase=on_phase,
+                           pre_checked=True) is None
+        assert [args[1] for args, kwargs in
+                self.check_relays.call_args_list] == [2, 3]
+        assert call('pre_check') not in on_phase.mock_calls
+
     def test_door_is_held_open_for_the_given_seconds(self,
                                                      door_controller,
                                                      relay_error_generator):
@@ -279,7 +501,27 @@ class TestUnlockDoor():
         call_list = door_controller.mock_calls
         assert call_list == [
             call.relays(activate=True),
-            call.activate_pin(door_controller.green_pin, ms=5000),
+            call.activate_pin(door_controller.green_pin, ms=10000),
+            call.relays(activate=False),
+        ]
+
+    def test_door_is_held_open_for_the_hold_window(self,
+                                                   door_controller,
+                                                   relay_error_generator):
+        from hocuspocus.main import unlock_door
+        self.check_relays.side_effect = relay_error_generator(
+            [
+                ('0 1', 0, 1, "Mock Message"),
+            ]
+        )
+        hold = MagicMock()
+        assert unlock_door(door_controller, hold=hold) is None
+        assert hold.wait.call_count == 1
+        call_list = door_controller.mock_calls
+        assert call_list == [
+            call.relays(activate=True),
+            call.turn_on_led(door_controller.green_pin),
+            call.turn_off_led(door_controller.green_pin),
             call.relays(activate=False),
         ]
 
@@ -316,7 +558,7 @@ class TestUnlockDoor():
         call_list = door_controller.mock_calls
         assert call_list == [
             call.relays(activate=True),
-            call.activate_pin(door_controller.green_pin, ms=5000),
+            call.activate_pin(door_controller.green_pin, ms=10000),
             call.relays(activate=False),
         ]
 
@@ -803,3 +1045,210 @@ class TestDisplayErrorCode():
         ]
 
         assert expected_calls == call_list
+
+
+class TestErrorDisplay():
+
+    def test_steps_match_the_flashes(self, relay_error_factory):
+        from hocuspocus.main import error_code_steps
+
+        steps, duration = error_code_steps(
+            relay_error_factory('1 2', 1, 2, "Mock Message"))
+
+        assert steps == [
+            (0, True), (2, False),
+            (4, True), (5, False),
+            (7, True), (8, False),
+            (8, True), (9, False),
+        ]
+        assert duration == 11
+
+    def test_display_stops_after_repeats(self,
+                                         door_controller,
+                                         relay_error_factory):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.main import ErrorDisplay
+
+        door_controller.clock = clock = VirtualClock()
+        relay_error = relay_error_factory('1 1', 1, 1, "Mock Message")
+        error_display = ErrorDisplay(door_controller, repeats=2)
+        error_display.show(relay_error)
+        clock.run()
+
+        assert door_controller.turn_off_led.call_count == 6
+        # 2 passes of 2s + 1s + 1s flashes, 2s after each
+        assert clock.now() == pytest.approx(20)
+        assert door_controller.mock_calls[-1] == call.turn_on_led(
+            door_controller.red_pin)
+        assert error_display._timeline.done.is_set()
+
+    def test_cancel_stops_the_display(self,
+                                      door_controller,
+                                      relay_error_factory):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.main import ErrorDisplay
+
+        door_controller.clock = clock = VirtualClock()
+        relay_error = relay_error_factory('1 1', 1, 1, "Mock Message")
+        error_display = ErrorDisplay(door_controller)
+        error_display.show(relay_error)
+        # the first flash is 2 seconds long
+        clock.advance(1)
+        error_display.cancel()
+        clock.advance(30)
+
+        assert door_controller.mock_calls == [
+            call.turn_on_led(door_controller.red_pin),
+            call.turn_on_led(door_controller.red_pin),
+        ]
+
+    def test_new_error_replaces_the_displayed_one(self,
+                                                  door_controller,
+                                                  relay_error_factory):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.main import ErrorDisplay
+
+        door_controller.clock = clock = VirtualClock()
+        error_display = ErrorDisplay(door_controller)
+        error_display.show(relay_error_factory('1 1', 1, 1, "Mock Message"))
+        first = error_display._timeline
+        error_display.show(relay_error_factory('2 3', 2, 3, "Mock Message"))
+
+        assert first.done.is_set()
+        assert not error_display._timeline.done.is_set()
+        clock.advance(60)
+        error_display.cancel()
+        assert error_display._timeline.done.is_set()
+
+    def test_display_runs_on_the_timer_wheel(self,
+                                             door_controller,
+                                             relay_error_factory):
+        from hocuspocus.main import ErrorDisplay
+
+        error_display = ErrorDisplay(door_controller, repeats=1)
+        with patch('hocuspocus.main.error_code_steps',
+                   return_value=([(0, True), (0.01, False)], 0.02)):
+            error_display.show(
+                relay_error_factory('1 1', 1, 1, "Mock Message"))
+
+        assert error_display._timeline.done.wait(1)
+        assert door_controller.mock_calls == [
+            call.turn_on_led(door_controller.red_pin),
+            call.turn_off_led(door_controller.red_pin),
+            call.turn_on_led(door_controller.red_pin),
+        ]
+
+
+class TestProcessRequest():
+
+    def test_failed_unlock_is_logged_and_displayed(self, door_controller):
+        from hocuspocus.main import process_request
+
+        error_display = MagicMock()
+        request = MagicMock()
+        with patch('hocuspocus.main.unlock_door') as unlock_door, \
+                patch('hocuspocus.main.log_error') as log_error:
+            unlock_door.return_value = relay_error = MagicMock()
+            process_request(door_controller, {'ms': 0}, error_display,
+                            request)
+
+        unlock_door.assert_called_with(door_controller,
+                                       ms=request.hold_ms,
+                                       hold=None,
+                                       on_phase=request.mark,
+                                       check_kwargs={'ms': 0},
+                                       pre_checked=False)
+        log_error.assert_called_with(relay_error,
+                                     request_id=request.request_id)
+        request.finish.assert_called_with('error', relay_error)
+        assert error_display.mock_calls == [
+            call.cancel(),
+            call.show(relay_error),
+        ]
+
+    def test_monitor_is_claimed_for_the_unlock(self, door_controller):
+        from hocuspocus.main import process_request
+
+        monitor = MagicMock()
+        monitor.claim.return_value = True
+        with patch('hocuspocus.main.unlock_door') as unlock_door:
+            unlock_door.side_effect = RuntimeError
+            with pytest.raises(RuntimeError):
+                process_request(door_controller, {}, MagicMock(),
+                                MagicMock(), monitor=monitor)
+
+        assert unlock_door.call_args[1]['pre_checked'] is True
+        assert monitor.mock_calls == [call.claim(), call.release()]
+
+    def test_successful_unlock_cancels_display(self, door_controller):
+        from hocuspocus.main import process_request
+
+        error_display = MagicMock()
+        request = MagicMock()
+        with patch('hocuspocus.main.unlock_door') as unlock_door:
+            unlock_door.return_value = None
+            process_request(door_controller, {}, error_display, request)
+
+        request.finish.assert_called_with('ok')
+        assert error_display.mock_calls == [call.cancel()]
+
+    def test_unlock_is_journaled(self, door_controller, tmpdir):
+        from hocuspocus.journal import UnlockJournal
+        from hocuspocus.main import process_request
+
+        door_controller.journal = UnlockJournal(str(tmpdir.join('journal')))
+        request = MagicMock()
+
+        def unlock_door(door_controller, on_phase, **kwargs):
+            on_phase('engage')
+            # the daemon is killed mid-unlock
+            assert door_controller.journal.pending() == 'engage'
+            raise RuntimeError
+
+        with patch('hocuspocus.main.unlock_door', unlock_door):
+            with pytest.raises(RuntimeError):
+                process_request(door_controller, {}, MagicMock(), request)
+        request.mark.assert_called_with('engage')
+        assert door_controller.journal.pending() == 'engage'
+
+        with patch('hocuspocus.main.unlock_door', return_value=None):
+            process_request(door_controller, {}, MagicMock(), request)
+        assert door_controller.journal.pending() is None
+
+
+class TestRecoverUnlock():
+
+    def test_cycle_cut_short_is_locked(self, door_controller, tmpdir):
+        from hocuspocus.journal import UnlockJournal
+        from hocuspocus.main import recover_unlock, relay_error_for
+
+        door_controller.journal = UnlockJournal(str(tmpdir.join('journal')))
+        door_controller.journal.write('hold')
+
+        with patch('hocuspocus.main.check_relays') as check_relays, \
+                patch('hocuspocus.main.log_error') as log_error:
+            check_relays.return_value = relay_error_for(1, 3)
+            relay_error = recover_unlock(door_controller, {'ms': 0})
+
+        assert relay_error is relay_error_for(1, 3)
+        log_error.assert_called_with(relay_error, recovered_phase='hold')
+        check_relays.assert_called_with(door_controller, 3,
+                                        first=door_controller.low,
+                                        second=door_controller.low, ms=0)
+        assert door_controller.mock_calls[:2] == [
+            call.turn_off_led(door_controller.green_pin),
+            call.relays(activate=False),
+        ]
+        assert door_controller.journal.pending() is None
+
+    def test_ended_cycle_is_left_alone(self, door_controller, tmpdir):
+        from hocuspocus.journal import UnlockJournal
+        from hocuspocus.main import recover_unlock
+
+        assert recover_unlock(door_controller) is None
+
+        door_controller.journal = UnlockJournal(str(tmpdir.join('journal')))
+        assert recover_unlock(door_controller) is None
+        door_controller.journal.idle()
+        assert recover_unlock(door_controller) is None
+        assert not door_controller.relays.called
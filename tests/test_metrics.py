@@ -0,0 +1,155 @@
+import pytest
+
+from mock import MagicMock
+
+
+class TestLatencyHistogram():
+
+    def test_small_values_are_exact(self):
+        from hocuspocus.metrics import LatencyHistogram
+
+        histogram = LatencyHistogram()
+        for ms in (0.1, 0.2, 0.3, 0.4):
+            histogram.record(ms)
+
+        assert histogram.percentile(50) == pytest.approx(0.2)
+        assert histogram.percentile(100) == pytest.approx(0.4)
+        assert histogram.summary()['min'] == pytest.approx(0.1)
+
+    def test_percentiles_within_precision(self):
+        from hocuspocus.metrics import LatencyHistogram
+
+        histogram = LatencyHistogram(precision=6)
+        size = len(histogram.counts)
+        for ms in range(1, 10001):
+            histogram.record(ms)
+
+        assert len(histogram.counts) == size
+        for percentile in (50, 90, 99, 99.9):
+            expected = percentile * 100
+            assert abs(histogram.percentile(percentile) - expected) <= (
+                expected / 32)
+        assert histogram.percentile(100) == pytest.approx(10000)
+
+    def test_values_above_highest_are_clamped(self):
+        from hocuspocus.metrics import LatencyHistogram
+
+        histogram = LatencyHistogram(highest_ms=1000)
+        histogram.record(60000)
+        assert histogram.summary()['max'] == pytest.approx(1000)
+
+    def test_empty_summary(self):
+        from hocuspocus.metrics import LatencyHistogram
+
+        summary = LatencyHistogram().summary()
+        assert summary['count'] == 0
+        assert summary['p99'] is None
+
+
+class TestPhaseLatency():
+
+    def test_records_each_phase(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.metrics import PhaseLatency
+        from hocuspocus.worker import UnlockRequest, UNLOCKED
+
+        clock = VirtualClock()
+        request = UnlockRequest(clock=clock)
+        for phase, seconds in (('started', 0.001), ('pre_check', 0.002),
+                               ('engage', 0.02), ('verify', 0.001),
+                               ('hold', 0.02), ('release', 5),
+                               ('post_check', 0.001)):
+            clock.sleep(seconds)
+            request.mark(phase)
+        clock.sleep(0.02)
+        request.finish(UNLOCKED)
+
+        latency = PhaseLatency()
+        latency.record(request)
+        dump = latency.dump()
+
+        assert list(dump) == ['received', 'started', 'pre_check', 'engage',
+                              'verify', 'hold', 'release', 'post_check',
+                              'time_to_open', 'total']
+        assert dump['hold']['p50'] == pytest.approx(5000, rel=0.02)
+        assert dump['time_to_open']['max'] == pytest.approx(44, rel=0.02)
+        assert dump['total']['count'] == 1
+
+    def test_failed_requests_have_no_time_to_open(self):
+        from hocuspocus.metrics import PhaseLatency
+        from hocuspocus.worker import UnlockRequest, FAILED
+
+        request = UnlockRequest()
+        request.mark('pre_check')
+        request.finish(FAILED)
+
+        latency = PhaseLatency()
+        latency.record(request)
+
+        assert 'time_to_open' not in latency.dump()
+        assert latency.dump()['total']['count'] == 1
+
+
+class TestTextfile():
+
+    def test_format_textfile(self):
+        from hocuspocus.main import RelayError
+        from hocuspocus.metrics import format_textfile
+        from hocuspocus.worker import (
+            RequestQueue, UnlockRequest, UnlockWorker, FAILED, UNLOCKED)
+
+        def handler(request, hold):
+            request.mark('hold')
+            if request.source == 'broken':
+                request.finish(FAILED, RelayError('2 3'))
+            else:
+                request.finish(UNLOCKED)
+
+        worker = UnlockWorker(RequestQueue(maxsize=2), handler)
+        for source in ('signal', 'broken'):
+            worker.submit(UnlockRequest(source))
+        worker.serve_one(timeout=0)
+        worker.serve_one(timeout=0)
+
+        text = format_textfile(worker)
+        assert 'hocuspocus_unlock_requests_received_total 2\n' in text
+        assert 'hocuspocus_unlock_requests_total{status="ok"} 1\n' in text
+        assert 'hocuspocus_unlock_requests_total{status="error"} 1\n' in text
+        assert 'hocuspocus_relay_errors_total{relay="2",test="3"} 1\n' in (
+            text)
+        assert 'hocuspocus_unlock_phase_seconds_count{phase="hold"} 2\n' in (
+            text)
+        assert ('hocuspocus_unlock_phase_seconds{phase="total",'
+                'quantile="0.99"}') in text
+
+    def test_doors_are_labelled(self):
+        from hocuspocus.doors import Doors
+        from hocuspocus.metrics import format_textfile
+        from hocuspocus.worker import RequestQueue, UnlockRequest, UnlockWorker
+
+        front = UnlockWorker(RequestQueue(), MagicMock())
+        back = UnlockWorker(RequestQueue(), MagicMock())
+        back.submit(UnlockRequest())
+
+        text = format_textfile(Doors([('front', front), ('back', back)]))
+        assert text.count('# HELP hocuspocus_unlock_requests_received') == 1
+        assert ('hocuspocus_unlock_requests_received_total{door="front"} 0'
+                '\n') in text
+        assert ('hocuspocus_unlock_requests_received_total{door="back"} 1'
+                '\n') in text
+
+    def test_exporter_replaces_the_file_when_metrics_change(self, tmpdir):
+        from hocuspocus.metrics import TextfileExporter
+
+        path = tmpdir.join('hocuspocus.prom')
+        metrics = ['a 1\n']
+        exporter = TextfileExporter(str(path), lambda: metrics[-1])
+
+        assert exporter.write()
+        assert not exporter.write()
+        metrics.append('a 2\n')
+        exporter.stop()
+
+        assert path.read() == 'a 2\n'
+        assert exporter.writes == 2
+        assert tmpdir.listdir() == [path]
@@ -0,0 +1,106 @@
+import pytest
+
+from mock import MagicMock
+
+
+@pytest.fixture
+def clock():
+    from hocuspocus.clock import VirtualClock
+    return VirtualClock()
+
+
+@pytest.fixture
+def gpio(clock):
+    from hocuspocus.backends.simulator import SimulatedGPIO, default_relays
+    return SimulatedGPIO(default_relays(), now=clock.now)
+
+
+@pytest.fixture
+def monitor(clock, gpio):
+    from hocuspocus.door_controller import DoorController
+    from hocuspocus.monitor import RelayMonitor
+
+    return RelayMonitor(DoorController(gpio, clock=clock), samples=3,
+                        max_age_ms=500, on_fault=MagicMock())
+
+
+class TestRelayMonitor():
+
+    def test_released_relays_skip_the_pre_check(self, monitor, clock):
+        monitor.sample()
+        monitor.sample()
+        assert not monitor.claim()
+        monitor.release()
+
+        for _ in range(3):
+            monitor.sample()
+        assert monitor.state == 0
+        assert monitor.claim()
+
+    def test_stale_state_is_not_trusted(self, monitor, clock):
+        for _ in range(3):
+            monitor.sample()
+        clock.advance(0.6)
+        assert not monitor.claim()
+
+    def test_release_needs_the_state_confirmed_again(self, monitor):
+        for _ in range(3):
+            monitor.sample()
+        monitor.claim()
+        monitor.sample()
+        monitor.release()
+
+        assert not monitor.claim()
+
+    def test_claimed_monitor_doesnt_read_the_relays(self, monitor, gpio):
+        monitor.claim()
+        gpio.output('P8_15', gpio.HIGH)
+        for _ in range(3):
+            assert monitor.sample() is None
+        assert monitor.state is None
+        assert not monitor.on_fault.called
+
+    def test_idle_fault_is_reported_once(self, monitor, gpio):
+        from hocuspocus.backends.simulator import STUCK_HIGH
+        from hocuspocus.main import relay_error_for
+
+        for _ in range(3):
+            monitor.sample()
+        gpio.relays[1].fault = STUCK_HIGH
+        for _ in range(6):
+            monitor.sample()
+
+        monitor.on_fault.assert_called_once_with(relay_error_for(2, 1))
+        assert monitor.faults == 1
+        assert not monitor.claim()
+
+    def test_samples_until_stopped(self, monitor, clock):
+        monitor.start()
+        clock.advance(0.35)
+        assert monitor.state == 0
+        confirmed_at = monitor.confirmed_at
+
+        monitor.stop()
+        clock.advance(1)
+        assert monitor.confirmed_at == confirmed_at
+        assert not clock._events
+
+    def test_restart_doesnt_sample_twice(self, monitor, clock):
+        monitor.sample = MagicMock()
+        monitor.start()
+        clock.advance(0.15)
+        monitor.stop()
+        monitor.start()
+        clock.advance(1)
+        monitor.stop()
+
+        assert monitor.sample.call_count == 11
+        assert all(timer.cancelled for _, _, timer in clock._events)
+
+    def test_failed_sample_keeps_sampling(self, monitor, clock):
+        monitor.sample = MagicMock(side_effect=[OSError, None, None])
+        monitor.start()
+        clock.advance(0.35)
+        monitor.stop()
+
+        assert monitor.sample.call_count == 3
@@ -0,0 +1,147 @@
+import pytest
+import configparser
+
+from mock import MagicMock, patch
+
+
+CONFIG = '''
+[paths]
+pid_file = /tmp/door_controller.pid
+
+[relays]
+samples = 3
+
+[hold]
+ms = 3000
+
+[door:front]
+relay_1_read = P8_16
+relay_1_engage = P8_15
+relay_2_read = P8_18
+relay_2_engage = P8_17
+green_led = P8_11
+red_led = P8_9
+'''
+
+
+@pytest.fixture
+def config_file(tmpdir):
+    path = tmpdir.join('door_controller.ini')
+    path.write(CONFIG)
+    return path
+
+
+@pytest.fixture
+def front(GPIO):
+    from hocuspocus.door_controller import DoorController, Relay
+    from hocuspocus.doors import Door
+    from hocuspocus.worker import RequestQueue, UnlockWorker
+
+    door = Door('front', DoorController(GPIO), hold_ms=3000)
+    door.daemon = UnlockWorker(RequestQueue(), MagicMock(), hold_ms=3000)
+    door.check_kwargs = {'samples': 3}
+    door.error_display = MagicMock()
+    assert door.door_controller.pins['relay_1'] == Relay('P8_16', 'P8_15')
+    return door
+
+
+class TestReadSettings():
+
+    def test_settings(self):
+        from hocuspocus.reload import read_settings
+
+        config = configparser.ConfigParser()
+        config.read_string(CONFIG + '[errors]\ndisplay_repeats = 2\n')
+        settings = read_settings(config)
+
+        assert settings.check_kwargs == {'samples': 3}
+        assert (settings.hold_ms, settings.max_hold_ms) == (3000, 0)
+        assert settings.error_repeats == 2
+        assert [door.name for door in settings.doors] == ['front']
+
+    def test_restart_options(self):
+        from hocuspocus.reload import restart_options
+
+        config = configparser.ConfigParser()
+        config.read_string(CONFIG)
+
+        assert restart_options(config) == {
+            ('paths', 'pid_file'): '/tmp/door_controller.pid',
+        }
+
+
+class TestReloader():
+
+    def test_settings_are_applied(self, config_file, front, GPIO):
+        from hocuspocus.reload import Reloader
+
+        reloader = Reloader(str(config_file), [front])
+        GPIO.reset_mock()
+        config_file.write(CONFIG.replace('ms = 3000', 'ms = 4000')
+                                .replace('samples = 3', 'samples = 5'))
+        assert reloader.reload()
+
+        assert front.daemon.hold_ms == front.hold_ms == 4000
+        assert front.check_kwargs == {'samples': 5}
+        assert front.error_display.repeats == 0
+        # the pins didn't move
+        assert not GPIO.setup.called
+        assert not front.error_display.cancel.called
+
+    def test_moved_pins_are_set_up(self, config_file, front, GPIO):
+        from hocuspocus.reload import Reloader
+
+        reloader = Reloader(str(config_file), [front])
+        GPIO.reset_mock()
+        config_file.write(CONFIG.replace('P8_9', 'P9_16'))
+        assert reloader.reload()
+
+        GPIO.setup.assert_called_once_with('P9_16', GPIO.OUT,
+                                           pull_up_down=GPIO.PUD_DOWN)
+        front.error_display.cancel.assert_called_once_with()
+        GPIO.output.assert_called_with('P9_16', GPIO.HIGH)
+
+    def test_changes_wait_for_the_unlock_cycle(self, config_file, front):
+        from hocuspocus.reload import Reloader
+
+        reloader = Reloader(str(config_file), [front])
+        config_file.write(CONFIG.replace('ms = 3000', 'ms = 4000'))
+
+        # an unlock cycle is in progress
+        front.daemon._cycle.acquire()
+        assert reloader.reload()
+        assert front.daemon.hold_ms == 3000
+
+        front.daemon._apply_changes()
+        front.daemon._cycle.release()
+        assert front.daemon.hold_ms == 4000
+
+    @pytest.mark.parametrize('config', [
+        CONFIG.replace('ms = 3000', 'ms = soon'),
+        CONFIG.replace('red_led = P8_9', 'red_led = P8_11'),
+        CONFIG.replace('[door:front]', '[door:back]'),
+        CONFIG.replace('[hold]', 'hold]'),
+    ])
+    def test_invalid_settings_are_not_applied(self, config_file, front,
+                                              config):
+        from hocuspocus.reload import Reloader
+
+        reloader = Reloader(str(config_file), [front])
+        config_file.write(config)
+        with patch('hocuspocus.reload.logger') as logger:
+            assert not reloader.reload()
+
+        assert logger.error.called
+        assert reloader.failed == 1
+        assert front.daemon.hold_ms == 3000
+
+    def test_restart_options_are_logged(self, config_file, front):
+        from hocuspocus.reload import Reloader
+
+        reloader = Reloader(str(config_file), [front])
+        config_file.write(CONFIG + '[queue]\nsize = 3\n')
+        with patch('hocuspocus.reload.logger') as logger:
+            assert reloader.reload()
+
+        logger.warning.assert_called_once_with(
+            'restart needed', extra={'options': ['[queue] size']})
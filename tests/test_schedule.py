@@ -0,0 +1,133 @@
+import pytest
+
+from datetime import datetime
+from mock import MagicMock
+
+
+# monday
+MONDAY = datetime(2016, 5, 2)
+
+
+class TestParseSchedule():
+
+    def test_windows_are_sorted_and_merged(self):
+        from hocuspocus.schedule import parse_schedule, DAY
+
+        windows = parse_schedule('sat 10:00-14:00; mon-fri 08:00-12:00; '
+                                 'mon 11:00-18:00')
+        hours = 60 * 60
+
+        assert windows[0] == (8 * hours, 18 * hours)
+        assert windows[1] == (DAY + 8 * hours, DAY + 12 * hours)
+        assert windows[-1] == (5 * DAY + 10 * hours, 5 * DAY + 14 * hours)
+        assert len(windows) == 6
+
+    def test_window_past_midnight_wraps_around_the_week(self):
+        from hocuspocus.schedule import parse_schedule, DAY, WEEK
+
+        assert parse_schedule('sun 22:00-02:00') == [
+            (0, 2 * 60 * 60), (6 * DAY + 22 * 60 * 60, WEEK)]
+        assert parse_schedule('sat-mon 00:00-24:00') == [
+            (0, DAY), (5 * DAY, WEEK)]
+
+    @pytest.mark.parametrize('text', [
+        'mon',
+        'mon 08:00',
+        'someday 08:00-10:00',
+        'mon 8-10',
+        'mon 25:00-26:00',
+        'mon 08:00-08:00',
+    ])
+    def test_invalid_schedules(self, text):
+        from hocuspocus.schedule import parse_schedule
+
+        with pytest.raises(ValueError):
+            parse_schedule(text)
+
+
+class TestSchedule():
+
+    def test_state(self):
+        from hocuspocus.schedule import Schedule
+
+        schedule = Schedule.parse('mon-fri 08:00-18:00')
+
+        assert schedule.state(MONDAY.replace(hour=7)) == (False, 3600)
+        assert schedule.state(MONDAY.replace(hour=8)) == (True, 10 * 3600)
+        assert schedule.state(MONDAY.replace(hour=17, minute=30)) == (
+            True, 1800)
+        # friday evening until monday morning
+        assert schedule.state(datetime(2016, 5, 6, 18)) == (
+            False, 62 * 3600)
+
+    def test_window_carries_on_past_the_end_of_the_week(self):
+        from hocuspocus.schedule import Schedule
+
+        schedule = Schedule.parse('sun 20:00-02:00')
+
+        assert schedule.state(datetime(2016, 5, 8, 23)) == (True, 3 * 3600)
+        assert schedule.state(MONDAY.replace(hour=1)) == (True, 3600)
+
+    def test_never_changes(self):
+        from hocuspocus.schedule import Schedule
+
+        assert Schedule([]).state(MONDAY) == (False, None)
+        assert Schedule.parse('mon-sun 00:00-24:00').state(MONDAY) == (
+            True, None)
+
+
+class TestScheduleEngine():
+
+    def engine(self, text, when):
+        from hocuspocus.schedule import (
+            Schedule, ScheduledDoor, ScheduleEngine)
+
+        daemon = MagicMock()
+        daemon.open_window.side_effect = lambda seconds: MagicMock(
+            closed=False, seconds=seconds)
+        door = ScheduledDoor('front', Schedule.parse(text), daemon)
+        return ScheduleEngine([door], now=lambda: when[0]), door
+
+    def test_windows_are_opened_and_closed_on_time(self):
+        when = [MONDAY.replace(hour=7)]
+        engine, door = self.engine('mon 08:00-18:00', when)
+
+        assert engine.tick() == 300
+        assert door.window is None
+
+        when[0] = MONDAY.replace(hour=7, minute=59)
+        assert engine.tick() == 60
+
+        when[0] = MONDAY.replace(hour=8)
+        assert engine.tick() == 300
+        window = door.window
+        assert window.seconds == 10 * 3600
+
+        # already open
+        assert engine.tick() == 300
+        assert door.daemon.open_window.call_count == 1
+
+        when[0] = MONDAY.replace(hour=18)
+        engine.tick()
+        assert window.close.called
+
+    def test_failed_window_is_opened_again(self):
+        when = [MONDAY.replace(hour=9)]
+        engine, door = self.engine('mon 08:00-18:00', when)
+
+        engine.tick()
+        door.window.closed = True
+        engine.tick()
+
+        assert door.daemon.open_window.call_count == 2
+
+    def test_stop_closes_the_windows(self):
+        when = [MONDAY.replace(hour=9)]
+        engine, door = self.engine('mon 08:00-18:00', when)
+        engine.clock = MagicMock()
+        engine.clock.wait_event.return_value = True
+
+        engine.run()
+        engine.stop()
+
+        assert door.window.close.called
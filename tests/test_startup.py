@@ -0,0 +1,38 @@
+class TestProcessAge():
+
+    def test_reads_proc(self, tmpdir):
+        import os
+        from hocuspocus.startup import process_age
+
+        ticks = os.sysconf('SC_CLK_TCK')
+        tmpdir.mkdir('self').join('stat').write(
+            '42 (python run.py) S' + ' 0' * 18 + ' {} 0 0\n'.format(
+                100 * ticks))
+        tmpdir.join('uptime').write('101.50 200.00\n')
+
+        assert process_age(str(tmpdir)) == 1.5
+
+    def test_without_proc(self, tmpdir):
+        from hocuspocus.startup import process_age
+
+        assert process_age(str(tmpdir)) is None
+
+
+class TestStartupTimer():
+
+    def test_phases_add_up_to_time_to_ready(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.startup import StartupTimer
+
+        clock = VirtualClock(10.0)
+        timer = StartupTimer(9.9, clock=clock, age=lambda: 0.15)
+        clock.advance(0.02)
+        timer.mark('imports')
+        clock.advance(0.5)
+        timer.mark('pin_setup')
+
+        timings = dict(timer.timings())
+        assert round(timings['interpreter'], 6) == 50
+        assert round(timings['imports'], 6) == 120
+        assert round(timings['pin_setup'], 6) == 500
+        assert round(timings['time_to_ready'], 6) == 670
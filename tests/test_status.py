@@ -0,0 +1,87 @@
+import struct
+import pytest
+
+
+@pytest.yield_fixture
+def board(tmpdir):
+    from hocuspocus.status import StatusBoard
+
+    board = StatusBoard(str(tmpdir.join('hocuspocus.status')),
+                        now=lambda: 100.0)
+    yield board
+    board.close()
+
+
+class TestStatusBoard():
+
+    def test_unlock_is_published(self, board):
+        from hocuspocus.backends.simulator import SimulatedGPIO, default_relays
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.door_controller import DoorController
+        from hocuspocus.main import unlock_door
+        from hocuspocus.status import read_status
+        from hocuspocus.worker import UnlockRequest
+
+        clock = VirtualClock()
+        door_controller = DoorController(
+            SimulatedGPIO(default_relays(), now=clock.now), clock=clock)
+        door_controller.status = board
+        request = UnlockRequest(clock=clock)
+        phases = []
+
+        def mark(phase):
+            request.mark(phase)
+            phases.append(read_status(board.path).phase)
+
+        door_controller.turn_on_led(door_controller.red_pin)
+        assert unlock_door(door_controller, on_phase=board.on_phase(mark),
+                           check_kwargs={'ms': 50}) is None
+
+        status = read_status(board.path)
+        assert phases == ['idle', 'pre_check', 'engage', 'verify', 'hold',
+                          'release']
+        assert status.phase == 'post_check'
+        assert (status.relay_1, status.relay_2, status.engaged) == (0, 0, 0)
+        assert (status.green, status.red) == (0, 1)
+        assert status.updated == 100.0
+
+    def test_outcomes_are_counted(self, board):
+        from hocuspocus.main import relay_error_for
+        from hocuspocus.status import read_status
+        from hocuspocus.worker import UnlockRequest, FAILED, UNLOCKED
+
+        ok, failed = UnlockRequest(), UnlockRequest()
+        ok.merge(UnlockRequest())
+        ok.finish(UNLOCKED)
+        failed.finish(FAILED, relay_error_for(2, 3))
+        board.update(phase='hold')
+        board.record(ok)
+        board.record(failed)
+
+        status = read_status(board.path)
+        assert (status.served, status.unlocked, status.failed) == (3, 2, 1)
+        assert (status.error_relay, status.error_test) == (2, 3)
+        assert status.error_time == 100.0
+        assert status.phase == 'idle'
+
+
+class TestStatusReader():
+
+    def test_torn_reads_are_retried(self, board):
+        from hocuspocus.status import StatusReader, SEQUENCE_OFFSET
+
+        with StatusReader(board.path) as reader:
+            assert reader.read().phase == 'idle'
+
+            # the daemon is part way through a write
+            struct.pack_into('<I', board._map, SEQUENCE_OFFSET, 7)
+            with pytest.raises(RuntimeError):
+                reader.read(retries=10)
+
+    def test_not_a_status_board(self, tmpdir):
+        from hocuspocus.status import StatusReader, SIZE
+
+        path = tmpdir.join('other')
+        path.write_binary(b'\0' * SIZE)
+        with pytest.raises(ValueError):
+            StatusReader(str(path))
@@ -0,0 +1,164 @@
+import threading
+
+from mock import MagicMock, call
+
+
+class TestTimerWheel():
+
+    def test_timers_run_in_deadline_order(self):
+        from hocuspocus.timers import TimerWheel
+
+        now = MagicMock(return_value=0.0)
+        wheel = TimerWheel(tick=0.01, slots=8, now=now)
+        callback = MagicMock()
+        # the last two are more than a turn of the wheel away
+        for when in (0.05, 0.02, 0.25, 0.12):
+            wheel.call_at(when, callback, when)
+
+        assert wheel._expire(1) == []
+        due = wheel._expire(25)
+        assert [timer.when for timer in due] == [0.02, 0.05, 0.12, 0.25]
+        assert wheel.pending == 0
+
+    def test_later_turns_wait_in_their_bucket(self):
+        from hocuspocus.timers import TimerWheel
+
+        wheel = TimerWheel(tick=0.01, slots=8, now=lambda: 0.0)
+        wheel.call_at(0.02, MagicMock())
+        wheel.call_at(0.10, MagicMock())
+
+        assert [timer.when for timer in wheel._expire(2)] == [0.02]
+        assert wheel._next_tick() == 10
+        assert [timer.when for timer in wheel._expire(10)] == [0.10]
+        assert wheel._next_tick() is None
+
+    def test_past_deadlines_run_at_the_next_tick(self):
+        from hocuspocus.timers import TimerWheel
+
+        wheel = TimerWheel(tick=0.01, slots=8, now=lambda: 1.0)
+        timer = wheel.call_at(0.5, MagicMock())
+
+        assert timer.tick == wheel._current + 1
+
+    def test_thread_runs_timers_and_skips_cancelled_ones(self):
+        from hocuspocus.timers import TimerWheel
+
+        wheel = TimerWheel()
+        wheel.start()
+        ran = []
+        done = threading.Event()
+        wheel.call_later(0.02, ran.append, 2)
+        wheel.call_later(0.01, ran.append, 1)
+        wheel.call_later(0.015, ran.append, 'cancelled').cancel()
+        wheel.call_later(0.03, done.set)
+
+        assert done.wait(1)
+        wheel.stop()
+        wheel.join(1)
+
+        assert ran == [1, 2]
+        assert not wheel.is_alive()
+
+    def test_failed_callback_doesnt_stop_the_wheel(self):
+        from hocuspocus.timers import TimerWheel
+
+        wheel = TimerWheel()
+        wheel.start()
+        done = threading.Event()
+        wheel.call_later(0.001, MagicMock(side_effect=RuntimeError))
+        wheel.call_later(0.002, done.set)
+
+        assert done.wait(1)
+        wheel.stop()
+        wheel.join(1)
+
+    def test_earlier_timer_wakes_the_wheel(self):
+        from hocuspocus.timers import TimerWheel
+
+        wheel = TimerWheel()
+        wheel.start()
+        done = threading.Event()
+        wheel.call_later(3, MagicMock())
+        wheel.call_later(0.01, done.set)
+
+        assert done.wait(1)
+        wheel.stop()
+        wheel.join(1)
+
+    def test_monotonic_clock_uses_the_shared_wheel(self):
+        from hocuspocus.clock import MONOTONIC
+        from hocuspocus.timers import shared_wheel
+
+        done = threading.Event()
+        timer = MONOTONIC.call_later(0.001, done.set)
+
+        assert done.wait(1)
+        assert shared_wheel().is_alive()
+        assert shared_wheel() is shared_wheel()
+        assert timer.callback == done.set
+
+
+class TestTimeline():
+
+    def test_steps_repeat_from_the_start(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.timers import Timeline
+
+        clock = VirtualClock(10)
+        step = MagicMock()
+        on_done = MagicMock()
+        timeline = Timeline(clock, [(0, step.on), (1, step.off)], 3,
+                            repeats=2, on_done=on_done).start()
+        times = []
+        step.on.side_effect = step.off.side_effect = (
+            lambda: times.append(clock.now()))
+        clock.run()
+
+        assert step.mock_calls == [call.on(), call.off()] * 2
+        assert times == [10, 11, 13, 14]
+        assert clock.now() == 16
+        on_done.assert_called_once_with()
+        assert timeline.done.is_set()
+
+    def test_late_step_doesnt_push_the_next_ones_back(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.timers import Timeline
+
+        clock = VirtualClock()
+        times = []
+
+        def slow():
+            times.append(clock.now())
+            clock._now += 0.5
+
+        Timeline(clock, [(0, slow), (1, slow), (2, slow)], 3).start()
+        clock.run()
+
+        assert times == [0, 1, 2]
+
+    def test_cancel_stops_the_steps(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.timers import Timeline
+
+        clock = VirtualClock()
+        step = MagicMock()
+        on_done = MagicMock()
+        timeline = Timeline(clock, [(0, step), (1, step)], 2, repeats=0,
+                            on_done=on_done).start()
+        clock.advance(4.5)
+        timeline.cancel()
+        timeline.cancel()
+        clock.advance(10)
+
+        assert step.call_count == 5
+        on_done.assert_called_once_with()
+
+    def test_cancel_cancels_the_next_step(self):
+        from hocuspocus.timers import Timeline
+
+        clock = MagicMock()
+        clock.now.return_value = 0
+        timeline = Timeline(clock, [(1, MagicMock())], 1).start()
+        timeline.cancel()
+
+        clock.call_at.return_value.cancel.assert_called_once_with()
@@ -0,0 +1,455 @@
+import pytest
+
+from mock import MagicMock, patch
+
+
+class TestRequestQueue():
+
+    def test_requests_are_served_in_order(self):
+        from hocuspocus.worker import RequestQueue, UnlockRequest
+
+        queue = RequestQueue(maxsize=2)
+        first, second = UnlockRequest(), UnlockRequest()
+        assert queue.put(first)
+        assert queue.put(second)
+        assert len(queue) == 2
+        assert queue.get() is first
+        assert queue.get() is second
+        assert queue.get(timeout=0) is None
+
+    def test_drop_newest(self):
+        from hocuspocus.worker import RequestQueue, UnlockRequest, DROP_NEWEST
+
+        queue = RequestQueue(maxsize=1, policy=DROP_NEWEST)
+        first = UnlockRequest()
+        assert queue.put(first)
+        assert not queue.put(UnlockRequest())
+        assert queue.get() is first
+        assert queue.stats() == {
+            'depth': 0,
+            'maxsize': 1,
+            'received': 2,
+            'dropped_newest': 1,
+            'dropped_oldest': 0,
+            'coalesced': 0,
+        }
+
+    def test_drop_oldest(self):
+        from hocuspocus.worker import RequestQueue, UnlockRequest, DROP_OLDEST
+
+        queue = RequestQueue(maxsize=1, policy=DROP_OLDEST)
+        second = UnlockRequest()
+        assert queue.put(UnlockRequest())
+        assert queue.put(second)
+        assert queue.get() is second
+        assert queue.dropped_oldest == 1
+        assert queue.dropped == 1
+
+    def test_coalesce(self):
+        from hocuspocus.worker import RequestQueue, UnlockRequest, COALESCE
+
+        queue = RequestQueue(maxsize=1, policy=COALESCE)
+        first = UnlockRequest()
+        assert queue.put(first)
+        assert queue.put(UnlockRequest())
+        assert queue.put(UnlockRequest())
+        assert len(queue) == 1
+        assert queue.get() is first
+        assert first.coalesced == 2
+        assert queue.coalesced == 2
+        assert queue.dropped == 0
+
+    def test_invalid_arguments(self):
+        from hocuspocus.worker import RequestQueue
+
+        with pytest.raises(ValueError):
+            RequestQueue(maxsize=0)
+
+        with pytest.raises(ValueError):
+            RequestQueue(policy='drop-everything')
+
+
+class TestUnlockWorker():
+
+    def test_worker_serves_submitted_requests(self):
+        from hocuspocus.worker import RequestQueue, UnlockRequest, UnlockWorker
+
+        handled = []
+        handler = MagicMock(
+            side_effect=lambda request, hold: handled.append(request))
+        worker = UnlockWorker(RequestQueue(maxsize=4), handler)
+        requests = [UnlockRequest(), UnlockRequest()]
+        for request in requests:
+            assert worker.submit(request)
+
+        worker.start()
+        for _ in range(100):
+            if len(handled) == 2:
+                break
+            worker.join(0.01)
+
+        assert handled == requests
+        assert worker.is_alive()
+
+    def test_worker_survives_handler_errors(self):
+        from hocuspocus.worker import (
+            RequestQueue, UnlockRequest, UnlockWorker, FAILED, UNLOCKED)
+
+        def handler(request, hold):
+            if request.source == 'broken':
+                raise OSError('GPIO went away')
+            request.finish(UNLOCKED)
+
+        queue = RequestQueue(maxsize=2)
+        worker = UnlockWorker(queue, handler)
+        broken, merged = UnlockRequest('broken'), UnlockRequest()
+        broken.merge(merged)
+        second = UnlockRequest()
+        queue.put(broken)
+        queue.put(second)
+
+        with patch('hocuspocus.worker.logger') as logger:
+            assert worker.serve_one(timeout=0) is broken
+        assert logger.exception.called
+        assert worker.serve_one(timeout=0) is second
+
+        assert broken.status == FAILED
+        assert merged.status == FAILED
+        assert second.status == UNLOCKED
+
+    def test_changes_are_applied_between_cycles(self):
+        import threading
+        from hocuspocus.worker import (
+            RequestQueue, UnlockRequest, UnlockWorker, UNLOCKED)
+
+        serving, release = threading.Event(), threading.Event()
+        applied = []
+
+        def handler(request, hold):
+            serving.set()
+            release.wait(5)
+            applied.append('cycle')
+            request.finish(UNLOCKED)
+
+        worker = UnlockWorker(RequestQueue(), handler)
+        worker.apply(lambda: applied.append('idle'))
+        assert applied == ['idle']
+
+        worker.queue.put(UnlockRequest())
+        worker.start()
+        assert serving.wait(5)
+        worker.apply(lambda: applied.append('change'))
+        assert applied == ['idle']
+
+        release.set()
+        assert worker.stop(timeout=5)
+        assert applied == ['idle', 'cycle', 'change']
+
+    def test_stop_serves_the_queued_requests(self):
+        from hocuspocus.worker import (
+            RequestQueue, UnlockRequest, UnlockWorker, DROPPED, UNLOCKED)
+
+        worker = UnlockWorker(RequestQueue(maxsize=2),
+                              lambda request, hold: request.finish(UNLOCKED))
+        queued = UnlockRequest()
+        worker.queue.put(queued)
+        worker.start()
+        assert worker.stop(timeout=5)
+
+        late = UnlockRequest()
+        assert not worker.submit(late)
+        assert queued.status == UNLOCKED
+        assert late.status == DROPPED
+
+
+class TestHoldWindow():
+
+    def test_cannot_extend_before_or_after_hold(self):
+        from hocuspocus.worker import HoldWindow
+
+        hold = HoldWindow(ms=0, max_ms=1000)
+        assert not hold.extend()
+        hold.wait()
+        assert not hold.extend()
+
+    def test_extend_pushes_deadline_out(self):
+        from hocuspocus.worker import HoldWindow
+
+        hold = HoldWindow(ms=5000, max_ms=12000)
+        hold.started = 100.0
+        hold.deadline = 105.0
+
+        with patch('time.monotonic', return_value=103.0):
+            assert hold.extend()
+        assert hold.deadline == 108.0
+
+        with patch('time.monotonic', return_value=107.0):
+            assert hold.extend()
+        assert hold.deadline == 112.0
+
+        # would hold the door for longer than max_ms
+        with patch('time.monotonic', return_value=107.5):
+            assert not hold.extend()
+        assert hold.deadline == 112.0
+        assert hold.extended == 2
+
+    def test_worker_extends_current_hold(self):
+        from hocuspocus.worker import RequestQueue, UnlockRequest, UnlockWorker
+
+        worker = UnlockWorker(RequestQueue(), MagicMock(), max_hold_ms=10000)
+        current = UnlockRequest()
+        hold = MagicMock()
+        hold.extend.side_effect = lambda on_extend: on_extend() or True
+        worker._current, worker._hold = current, hold
+
+        assert worker.submit(UnlockRequest())
+        assert current.coalesced == 1
+        assert worker.extended == 1
+        assert len(worker.queue) == 0
+
+        hold.extend.side_effect = lambda on_extend: False
+        assert worker.submit(UnlockRequest())
+        assert current.coalesced == 1
+        assert len(worker.queue) == 1
+
+    def test_requested_hold_time_is_capped(self):
+        from hocuspocus.worker import RequestQueue, UnlockRequest, UnlockWorker
+
+        worker = UnlockWorker(RequestQueue(), MagicMock(), hold_ms=5000,
+                              max_hold_ms=20000)
+        assert worker.hold_time(UnlockRequest()) == 5000
+        assert worker.hold_time(UnlockRequest(hold_ms=2000)) == 2000
+        assert worker.hold_time(UnlockRequest(hold_ms=60000)) == 20000
+
+
+class TestUnlockRequest():
+
+    def test_finish_calls_callbacks_of_merged_requests(self):
+        from hocuspocus.worker import UnlockRequest, UNLOCKED
+
+        finished = []
+        first, second = UnlockRequest(), UnlockRequest()
+        first.add_done_callback(finished.append)
+        second.add_done_callback(finished.append)
+
+        first.mark('pre_check')
+        first.merge(second)
+        first.mark('hold')
+        first.finish(UNLOCKED)
+
+        assert finished == [first, second]
+        assert second.status == UNLOCKED
+        assert [phase for phase, _ in first.timings()] == [
+            'received', 'pre_check', 'hold']
+        assert [phase for phase, _ in second.timings()] == [
+            'received', 'pre_check', 'hold']
+        assert all(ms >= 0 for _, ms in second.timings())
+
+    def test_dropped_requests_are_finished(self):
+        from hocuspocus.worker import (
+            RequestQueue,
+            UnlockRequest,
+            DROP_NEWEST,
+            DROP_OLDEST,
+            DROPPED,
+        )
+
+        for policy in (DROP_NEWEST, DROP_OLDEST):
+            queue = RequestQueue(maxsize=1, policy=policy)
+            first, second = UnlockRequest(), UnlockRequest()
+            queue.put(first)
+            queue.put(second)
+            dropped = second if policy == DROP_NEWEST else first
+            assert dropped.status == DROPPED
+
+
+class TestTokenBucket():
+
+    def test_refills_at_rate_up_to_burst(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.worker import TokenBucket
+
+        clock = VirtualClock()
+        bucket = TokenBucket(2, burst=3, clock=clock)
+
+        assert all(bucket.take() for _ in range(3))
+        assert not bucket.take()
+        assert bucket.delay() == pytest.approx(0.5)
+
+        clock.advance(0.5)
+        assert bucket.take()
+        clock.advance(60)
+        assert sum(bucket.take() for _ in range(10)) == 3
+
+    def test_invalid_arguments(self):
+        from hocuspocus.worker import TokenBucket
+
+        with pytest.raises(ValueError):
+            TokenBucket(0)
+        with pytest.raises(ValueError):
+            TokenBucket(1, burst=0)
+
+
+class TestAdmission():
+
+    def test_requests_over_the_rate_are_rejected(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.worker import (
+            Admission, RequestQueue, UnlockRequest, UnlockWorker, REJECTED,
+            RATE_LIMITED)
+
+        clock = VirtualClock()
+        worker = UnlockWorker(RequestQueue(maxsize=4), MagicMock(),
+                              clock=clock,
+                              admission=Admission(rate=1, burst=2,
+                                                  clock=clock))
+        requests = [UnlockRequest(clock=clock) for _ in range(3)]
+
+        with patch('hocuspocus.worker.logger'):
+            assert [worker.submit(request) for request in requests] == [
+                True, True, False]
+
+        assert requests[2].status == REJECTED
+        assert requests[2].reason == RATE_LIMITED
+        assert len(worker.queue) == 2
+        assert worker.stats()['rejected'][RATE_LIMITED] == 1
+
+    def test_cycles_are_spaced_out(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.worker import (
+            Admission, RequestQueue, UnlockRequest, UnlockWorker)
+
+        clock = VirtualClock()
+        started = []
+        worker = UnlockWorker(
+            RequestQueue(maxsize=4),
+            lambda request, hold: started.append(clock.now()),
+            clock=clock,
+            admission=Admission(max_cycles_per_minute=6, clock=clock))
+        for _ in range(3):
+            worker.submit(UnlockRequest(clock=clock))
+
+        for _ in range(3):
+            worker.serve_one(timeout=0)
+
+        assert started == pytest.approx([0, 10, 20])
+
+    def test_request_that_cannot_start_in_time_is_rejected(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.worker import (
+            Admission, RequestQueue, UnlockRequest, UnlockWorker, REJECTED,
+            DEADLINE, CYCLE_LIMIT)
+
+        clock = VirtualClock()
+        handler = MagicMock(
+            side_effect=lambda request, hold: clock.sleep(5))
+        worker = UnlockWorker(
+            RequestQueue(maxsize=4), handler, clock=clock,
+            admission=Admission(max_cycles_per_minute=2, deadline_ms=3000,
+                                clock=clock))
+        first, late, capped = (UnlockRequest(clock=clock),
+                               UnlockRequest(clock=clock),
+                               UnlockRequest(clock=clock, deadline_ms=60000))
+        for request in (first, late, capped):
+            worker.submit(request)
+
+        with patch('hocuspocus.worker.logger'):
+            for _ in range(3):
+                worker.serve_one(timeout=0)
+
+        assert handler.call_count == 2
+        assert late.status == REJECTED and late.reason == DEADLINE
+        # waited for the cycle cap, 30s after the first cycle started
+        assert capped.status is None
+        assert dict(capped.phases)['started'] == pytest.approx(30)
+
+        capped = UnlockRequest(clock=clock, deadline_ms=1000)
+        worker.submit(capped)
+        with patch('hocuspocus.worker.logger'):
+            worker.serve_one(timeout=0)
+        assert capped.reason == CYCLE_LIMIT
+        assert worker.stats()['rejected'] == {
+            'rate_limited': 0, 'deadline': 1, 'cycle_limit': 1}
+
+    def test_merged_request_extends_the_deadline(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.worker import UnlockRequest
+
+        clock = VirtualClock()
+        first = UnlockRequest(clock=clock)
+        first.deadline = 1
+        later = UnlockRequest(clock=clock)
+        later.deadline = 3
+        first.merge(later)
+        assert first.deadline == 3
+
+        first.merge(UnlockRequest(clock=clock))
+        assert first.deadline is None
+
+
+class TestScheduledWindow():
+
+    def test_requests_during_the_window_are_answered_right_away(self):
+        from hocuspocus.clock import VirtualClock
+        from hocuspocus.worker import (
+            RequestQueue, UnlockRequest, UnlockWorker, UNLOCKED)
+
+        clock = VirtualClock()
+
+        def handler(request, hold):
+            request.mark('pre_check')
+            request.mark('hold')
+            hold.wait()
+            request.mark('release')
+            request.finish(UNLOCKED)
+
+        worker = UnlockWorker(RequestQueue(maxsize=2), handler, clock=clock)
+        waiting = UnlockRequest(clock=clock)
+        worker.submit(waiting)
+        window = worker.open_window(3600)
+
+        during = UnlockRequest(clock=clock)
+        clock.call_at(60, worker.submit, during)
+        served = worker.serve_one(timeout=0)
+
+        assert served.window is window
+        assert window.closed
+        assert clock.now() == 3600
+        assert during.status == UNLOCKED
+        assert dict(during.phases)['done'] == 60
+        assert served.coalesced == 1
+        assert worker.counters.snapshot()[0] == {UNLOCKED: 2}
+        assert worker.latency.histograms['hold'].total == 0
+        # queued before the window, served after it
+        assert waiting.status is None
+        assert len(worker.queue) == 1
+
+    def test_closed_window_is_not_served(self):
+        from hocuspocus.worker import RequestQueue, UnlockWorker, DROPPED
+
+        handler = MagicMock()
+        worker = UnlockWorker(RequestQueue(), handler)
+        window = worker.open_window(3600)
+        window.close()
+
+        assert worker.serve_one(timeout=0).status == DROPPED
+        assert not handler.called
+
+    def test_stop_closes_the_window(self):
+        from hocuspocus.worker import RequestQueue, UnlockWorker
+
+        def handler(request, hold):
+            request.mark('hold')
+            hold.wait()
+
+        worker = UnlockWorker(RequestQueue(), handler)
+        window = worker.open_window(3600)
+        worker.start()
+        for _ in range(100):
+            if window.deadline is not None:
+                break
+            worker.join(0.01)
+
+        assert worker.stop(timeout=1)
+        assert window.closed
+        assert worker.open_window(3600) is None